@@ -0,0 +1,150 @@
+# analytics.py
+# Lead time por etapa (PreDEV -> DEV -> ... -> PRD) y MTTR por ambiente a
+# partir de deployment_events. El estado se actualiza de forma incremental:
+# cada refresh() lee solo los eventos nuevos (id > último procesado) y
+# ajusta histogramas por día, sin volver a recorrer el historial.
+
+import threading
+from collections import Counter
+from datetime import date
+
+from model import iter_deployment_events, next_event_cursor
+
+# Un despliegue en estos estados no cuenta como llegada al ambiente
+FAILED_STATES = ("Failed", "Invalid")
+# Estados que cierran una falla abierta (para MTTR)
+RECOVERED_STATES = ("Valid", "In-PRD")
+
+def _day(fecha):
+    try:
+        return date.fromisoformat(fecha).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+class DayHistogram:
+    """Histograma de duraciones en días; admite altas y bajas de muestras."""
+    __slots__ = ("counts", "n", "total")
+
+    def __init__(self):
+        self.counts = Counter()
+        self.n = 0
+        self.total = 0
+
+    def add(self, days):
+        self.counts[days] += 1
+        self.n += 1
+        self.total += days
+
+    def remove(self, days):
+        self.counts[days] -= 1
+        if not self.counts[days]:
+            del self.counts[days]
+        self.n -= 1
+        self.total -= days
+
+    def percentile(self, q):
+        if not self.n:
+            return None
+        rank = q * (self.n - 1)
+        seen = 0
+        for days in sorted(self.counts):
+            seen += self.counts[days]
+            if seen > rank:
+                return days
+        return max(self.counts)
+
+    def summary(self):
+        if not self.n:
+            return {"count": 0}
+        return {
+            "count": self.n,
+            "mean_days": round(self.total / self.n, 2),
+            "p50_days": self.percentile(0.5),
+            "p90_days": self.percentile(0.9),
+            "p95_days": self.percentile(0.95),
+            "max_days": max(self.counts),
+        }
+
+class LeadTimeAnalytics:
+    """
+    Duración de cada etapa del pipeline (primera llegada al ambiente
+    siguiente - primera llegada al actual), lead time total y MTTR por
+    ambiente (primer Failed -> siguiente Valid/In-PRD del mismo par).
+    """
+    def __init__(self, pipeline):
+        self.pipeline = [a.upper() for a in pipeline]
+        self._position = {a: i for i, a in enumerate(self.pipeline)}
+        self.last_event_id = 0
+        self._first = {}        # feature_id -> [día de llegada o None por ambiente]
+        self._samples = {}      # (feature_id, etapa) -> días registrados en el histograma
+        self.stages = [DayHistogram() for _ in self.pipeline[1:]]
+        self.total = DayHistogram()
+        self._open_failures = {}  # (feature_id, ambiente) -> día de la falla
+        self.mttr = {a: DayHistogram() for a in self.pipeline}
+        self._lock = threading.Lock()
+
+    def _set_sample(self, feature_id, stage, histogram, days):
+        key = (feature_id, stage)
+        old = self._samples.pop(key, None)
+        if old is not None:
+            histogram.remove(old)
+        # Fechas incoherentes (la etapa siguiente antes que la anterior) no cuentan
+        if days is not None and days >= 0:
+            histogram.add(days)
+            self._samples[key] = days
+
+    def _arrival(self, feature_id, position, day):
+        first = self._first.setdefault(feature_id, [None] * len(self.pipeline))
+        if first[position] is not None and first[position] <= day:
+            return
+        first[position] = day
+
+        def span(a, b):
+            return first[b] - first[a] if first[a] is not None and first[b] is not None else None
+
+        # Solo cambian las etapas que tocan este ambiente y el total
+        if position > 0:
+            self._set_sample(feature_id, position - 1, self.stages[position - 1],
+                             span(position - 1, position))
+        if position < len(self.stages):
+            self._set_sample(feature_id, position, self.stages[position], span(position, position + 1))
+        self._set_sample(feature_id, len(self.stages), self.total, span(0, len(self.pipeline) - 1))
+
+    def apply(self, event):
+        ambiente = (event["ambiente"] or "").strip().upper()
+        position = self._position.get(ambiente)
+        day = _day(event["fecha"])
+        if position is None or day is None or event["kind"] in ("delete", "archive"):
+            return
+        estado = event["estado"]
+        key = (event["feature_id"], ambiente)
+        if estado in FAILED_STATES:
+            self._open_failures.setdefault(key, day)
+            return
+        self._arrival(event["feature_id"], position, day)
+        failed_at = self._open_failures.pop(key, None)
+        if failed_at is not None and estado in RECOVERED_STATES:
+            self.mttr[ambiente].add(max(day - failed_at, 0))
+
+    def refresh(self):
+        """Incorpora los eventos nuevos; devuelve cuántos procesó."""
+        with self._lock:
+            processed = 0
+            for rows in iter_deployment_events(self.last_event_id):
+                for event in rows:
+                    self.apply(event)
+                self.last_event_id = next_event_cursor(self.last_event_id, rows)
+                processed += len(rows)
+            return processed
+
+    def summary(self):
+        with self._lock:
+            return {
+                "last_event_id": self.last_event_id,
+                "stages": [
+                    {"from": a, "to": b, **histogram.summary()}
+                    for a, b, histogram in zip(self.pipeline, self.pipeline[1:], self.stages)
+                ],
+                "lead_time": {"from": self.pipeline[0], "to": self.pipeline[-1], **self.total.summary()},
+                "mttr": {ambiente: histogram.summary() for ambiente, histogram in self.mttr.items()},
+            }
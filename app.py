@@ -1,13 +1,27 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session
-from datetime import date
-from datetime import datetime
-from collections import defaultdict
-from utils import calculate_kpis
+from flask import Flask, Response, make_response, render_template, request, redirect, url_for, jsonify, session
+from datetime import date, datetime, timezone
+import csv
+import io
+import json
+import zlib
+from utils import KpiColumns, calculate_kpis_columnar
+from analytics import LeadTimeAnalytics
+from matrix import MatrixStore
+from cache import CachedResponse, ResponseCache
+from events import EventBroker
+from metrics import Metrics
 
 from model import (
     create_db, add_or_get_feature, save_deployment,
-    get_all_features, get_all_feature_names, update_env_status,
-    update_full_deployment, get_all_deployment_details, get_db_connection,
+    update_full_deployment,
+    get_report_page, count_report_rows, iter_report_rows, get_dashboard_kpi_rows,
+    begin_connection_scope, end_connection_scope, get_pool_stats, get_writer_stats,
+    get_replica_stats, get_report_data_version, get_shard_stats, get_archive_stats,
+    archive_deployments, start_archiver, get_archiver_stats,
+    get_feature_by_name, get_deployment, get_deployments_batch, update_full_deployments,
+    ingest_deployments, bulk_delete, get_hierarchy, get_feature_history, get_data_version,
+    subscribe_writes, observe_statements,
+    set_kpi_environments, get_kpi_summary,
     get_user_by_username, hash_password, get_all_users, create_user, update_user_role, delete_user
 )
 
@@ -25,6 +39,48 @@ repos_options = ["Repo1", "Repo2"]
 rm_options = ["Michel LF", "Elizabet RC", "Yasser F"]
 app_options = ["INSIS", "Premium"]
 tenancy_options = ["Uruguay", "Panama"]
+set_kpi_environments(ambiente_options)
+lead_times = LeadTimeAnalytics(ambiente_options)
+
+# Cambios de la matriz -> navegadores conectados a /events
+broker = EventBroker()
+subscribe_writes(lambda changes: broker.publish("deployment", changes))
+
+# La matriz del dashboard vive en memoria; los mismos cambios la mantienen.
+# Suscripta antes de cargar: lo que se escriba mientras tanto no se pierde
+matrix_store = MatrixStore(ambiente_options, estado_options)
+subscribe_writes(matrix_store.apply)
+matrix_store.load()
+
+# El archivado corre en este proceso: sus cambios llegan a la matriz y a /events
+start_archiver()
+
+# Latencia por ruta y tiempo de SQL -> /metrics y header Server-Timing
+metrics = Metrics()
+observe_statements(metrics.observe_statement)
+
+@app.before_request
+def start_request_metrics():
+    metrics.begin_request()
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else "<unmatched>"
+    size = None if response.is_streamed else response.content_length
+    response.headers["Server-Timing"] = metrics.end_request(
+        route, request.method, response.status_code, size)
+    return response
+
+# --- Conexión por request ---
+
+@app.before_request
+def open_db_scope():
+    # Todas las llamadas a model.py del request comparten una conexión del pool
+    begin_connection_scope()
+
+@app.teardown_appcontext
+def close_db_scope(exc):
+    end_connection_scope()
 
 # --- Autenticación y sesión ---
 
@@ -81,34 +137,161 @@ def roles_required(allowed_roles):
             return f(*args, **kwargs)
         return decorated_function
     return wrapper
+
+def api_auth_required(allowed_roles):
+    """
+    Como login_required + roles_required pero para clientes sin navegador
+    (pipelines de CI): acepta la sesión o HTTP Basic contra la tabla users
+    y responde 401/403 en JSON en lugar de redirigir al login.
+    """
+    def wrapper(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            role = session.get('role') if 'user_id' in session else None
+            if role is None and request.authorization:
+                auth = request.authorization
+                user = get_user_by_username(auth.username or "")
+                if user and user['password'] == hash_password(auth.password or ""):
+                    role = user['role']
+            if role is None:
+                return (jsonify(success=False, message="Authentication required"), 401,
+                        {"WWW-Authenticate": 'Basic realm="deploy-mgmt"'})
+            if role not in allowed_roles:
+                return jsonify(success=False, message="Forbidden"), 403
+            return f(*args, **kwargs)
+        return decorated_function
+    return wrapper
+
+response_cache = ResponseCache()
+
+def primary_data_version():
+    return get_data_version("data")
+
+def dashboard_data_version():
+    # El formulario lee el primario y los KPIs la réplica: cambia con cualquiera
+    return f"{get_data_version('data')}.{get_report_data_version()}"
+
+def matrix_data_version():
+    # La matriz se sirve de memoria: cambia cuando el store aplica la escritura
+    return matrix_store.version
+
+def cached_view(f=None, version=primary_data_version):
+    """
+    Cachea el HTML de una vista GET por (vista, versión de datos, filtros,
+    usuario). Mientras no haya escrituras, repetir la vista no ejecuta SQL
+    (salvo leer la versión) ni renderiza Jinja, y con If-None-Match /
+    If-Modified-Since responde 304. `version` dice de dónde lee la vista:
+    las que leen de la réplica de reportes se invalidan con la réplica.
+    """
+    if f is None:
+        return lambda f: cached_view(f, version)
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method != "GET":
+            return f(*args, **kwargs)
+        data_version = version()
+        filters = tuple(sorted((k, v.strip()) for k, v in request.args.items(multi=True) if v.strip()))
+        key = (request.endpoint, data_version, filters, session.get('username'), session.get('role'))
+        entry = response_cache.get(key)
+        if entry is None:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            body = response.get_data()
+            entry = CachedResponse(body, response.mimetype, f"v{data_version}-{zlib.crc32(body):08x}",
+                                   datetime.now(timezone.utc).replace(microsecond=0))
+            response_cache.put(key, entry)
+        response = Response(entry.body, mimetype=entry.mimetype)
+        response.set_etag(entry.etag)
+        response.last_modified = entry.last_modified
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response.make_conditional(request)
+    return decorated_function
+
 # --- API y vistas protegidas ---
 
+def hierarchy_response(payload):
+    """
+    Respuesta JSON de la jerarquía con ETag = versión del cache: si el
+    navegador ya la tiene (If-None-Match) devuelve 304 sin armar el cuerpo.
+    """
+    hierarchy = get_hierarchy()
+    etag = f"hierarchy-{hierarchy['version']}"
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify(payload(hierarchy))
+    response.set_etag(etag)
+    # Siempre revalidar: barato (304) y nunca muestra datos viejos
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def _id_name(items):
+    return [{"id": item["id"], "name": item["name"]} for item in items]
+
+@app.route('/api/hierarchy')
+@login_required
+def api_hierarchy():
+    return hierarchy_response(lambda h: h["tree"])
+
 @app.route('/api/tenants')
 @login_required
 def api_tenants():
-    conn = get_db_connection()
-    rows = conn.execute('SELECT id, name FROM tenants ORDER BY name').fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in rows])
+    return hierarchy_response(lambda h: _id_name(h["tree"]))
 
 @app.route('/api/solutions/<int:tenant_id>')
 @login_required
 def api_solutions(tenant_id):
-    conn = get_db_connection()
-    rows = conn.execute('SELECT id, name FROM solutions WHERE tenant_id = ? ORDER BY name', (tenant_id,)).fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in rows])
+    return hierarchy_response(lambda h: _id_name(h["solutions"].get(tenant_id, [])))
 
 @app.route('/api/products/<int:solution_id>')
 @login_required
 def api_products(solution_id):
-    conn = get_db_connection()
-    rows = conn.execute('SELECT id, name FROM products WHERE solution_id = ? ORDER BY name', (solution_id,)).fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in rows])
+    return hierarchy_response(lambda h: h["products"].get(solution_id, []))
+
+@app.route('/api/matrix')
+@login_required
+@cached_view(version=matrix_data_version)
+def api_matrix():
+    """
+    Página de la matriz del dashboard. Filtros: name (prefijo), type,
+    application, tenancy; orden: sort=name|type|application|tenancy y
+    order=asc|desc; `after` es el "next" de la página anterior.
+    """
+    filters = {key: request.args.get(key, "").strip()
+               for key in ("name", "type", "application", "tenancy")}
+    after = None
+    if request.args.get("after"):
+        try:
+            after = json.loads(request.args["after"])
+            if not (isinstance(after, list) and len(after) == 2):
+                raise ValueError
+        except ValueError:
+            return jsonify(success=False, message="Invalid cursor"), 400
+    return jsonify(matrix_store.page(filters,
+                                     sort=request.args.get("sort", "name"),
+                                     descending=request.args.get("order") == "desc",
+                                     after=after,
+                                     limit=request.args.get("limit", type=int)))
+
+@app.route('/api/matrix/details')
+@login_required
+def api_matrix_details():
+    feature = request.args.get("feature", "")
+    return jsonify(feature=feature, details=matrix_store.details(feature))
+
+@app.route('/api/features/suggest')
+@login_required
+def api_features_suggest():
+    """Autocompletado del nombre de feature: ?q=prefijo&limit=N (máx. 50)."""
+    query = request.args.get("q", "")
+    return jsonify(query=query,
+                   features=matrix_store.suggest(query, request.args.get("limit", type=int)))
 
 @app.route("/", methods=["GET", "POST"])
 @login_required
+@cached_view(version=dashboard_data_version)
 def index():
     if 'role' in session and session['role'] == 'viewer':
         return redirect(url_for('reports'))
@@ -136,42 +319,16 @@ def index():
     filter_estado = request.args.get("filter_estado", "")
     filter_ambiente = request.args.get("filter_ambiente", "")
 
-    # 🧩 Full dataset for matrix table (ALWAYS UNFILTERED)
-    rows_all = get_all_features()
-
-    # 🎯 Filtered list only for flat result table
-    rows_filtered = get_all_features()
-    filtered_deployments = [
-        r for r in rows_filtered
-        if (not filtro or
-            filtro.lower() in r["name"].lower() or
-            filtro.lower() in r["repositorio"].lower() or
-            filtro.lower() in (r["estado"] or "").lower())
-        and (not filter_estado or r["estado"] == filter_estado)
-        and (not filter_ambiente or r["ambiente"] == filter_ambiente)
-    ]
-
-    # ✅ Build matrix view using full data
-    grouped = defaultdict(lambda: {
-        "repositorio": "", "type": "", "application": "", "master": "",
-        "env_status": {env: "" for env in ambiente_options}
-    })
-
-    for row in rows_all:
-        name = row["name"]
-        grouped[name]["repositorio"] = row["repositorio"]
-        grouped[name]["type"] = row["type"]
-        grouped[name]["application"] = row["application"]
-        grouped[name]["master"] = row["master"]
-        if row["ambiente"]:
-            grouped[name]["env_status"][row["ambiente"]] = row["estado"]
-
-    deployment_details = get_all_deployment_details()
-    kpis = calculate_kpis(filtered_deployments, ambiente_options)
+    # La matriz ya no se arma aquí: la página la pide por partes a /api/matrix
+    if filtro:
+        # Búsqueda de texto: KPIs ad hoc sobre las filas que coinciden
+        rows = get_dashboard_kpi_rows(filtro, filter_estado, filter_ambiente)
+        kpis = calculate_kpis_columnar(KpiColumns.from_rows(rows), ambiente_options)
+    else:
+        # Sin texto: los resúmenes mantenidos por triggers alcanzan
+        kpis = get_kpi_summary(filter_estado, filter_ambiente)
 
     return render_template("index.html",
-                           grouped_deployments=grouped,
-                           deployment_details=deployment_details,
                            ambiente_options=ambiente_options,
                            estado_options=estado_options,
                            type_options=type_options,
@@ -179,12 +336,10 @@ def index():
                            rm_options=rm_options,
                            app_options=app_options,
                            tenancy_options=tenancy_options,
-                           feature_names=get_all_feature_names(),
                            today=today,
                            filtro=filtro,
                            filter_estado=filter_estado,
                            filter_ambiente=filter_ambiente,
-                           filtered_deployments=filtered_deployments,
                            kpis=kpis)
 
 @app.route("/update_full_deployment", methods=["POST"])
@@ -197,14 +352,44 @@ def update_full_deployment_route():
     fecha = data.get("fecha")
     release_manager = data.get("release_manager")
 
-    rows = get_all_features()
-    for row in rows:
-        if row["name"] == feature_name:
-            feature_id = row["feature_id"]
-            update_full_deployment(feature_id, ambiente, estado, fecha, release_manager)
-            return jsonify(success=True)
+    feature = get_feature_by_name(feature_name, data.get("repositorio"))
+    if feature is None:
+        return jsonify(success=False, message="Feature not found"), 400
+
+    update_full_deployment(feature["id"], ambiente, estado, fecha, release_manager)
+    return jsonify(success=True)
 
-    return jsonify(success=False, message="Feature not found"), 400
+BATCH_ITEM_FIELDS = ("feature", "repositorio", "ambiente", "estado", "fecha", "release_manager")
+
+def _batch_items(data):
+    """
+    `items` de un pedido por lotes, o None si no es una lista de objetos
+    cuyos campos conocidos son texto (o faltan).
+    """
+    items = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return None
+    for item in items:
+        if not isinstance(item, dict):
+            return None
+        if any(item.get(field) is not None and not isinstance(item[field], str) for field in BATCH_ITEM_FIELDS):
+            return None
+    return items
+
+@app.route("/update_full_deployment_batch", methods=["POST"])
+@login_required
+def update_full_deployment_batch():
+    items = _batch_items(request.get_json(silent=True))
+    if items is None:
+        return jsonify(success=False, message="items must be a list of objects with string fields"), 400
+
+    results = update_full_deployments(items)
+    return jsonify(success=all(ok for ok, _ in results),
+                   results=[{"feature": item.get("feature"),
+                             "ambiente": item.get("ambiente"),
+                             "success": ok,
+                             "message": message}
+                            for item, (ok, message) in zip(items, results)])
 
 @app.route("/get_deployment_details", methods=["POST"])
 @login_required
@@ -213,51 +398,73 @@ def get_deployment_details():
     feature_name = data.get("feature")
     ambiente = data.get("ambiente")
 
-    rows = get_all_features()
-    for row in rows:
-        if row["name"] == feature_name and row["ambiente"] == ambiente:
-            return jsonify(success=True,
-                           estado=row["estado"],
-                           fecha=row["fecha"],
-                           release_manager=row["release_manager"])
-    return jsonify(success=False)
+    feature = get_feature_by_name(feature_name, data.get("repositorio"))
+    row = get_deployment(feature["id"], ambiente) if feature else None
+    if row is None:
+        return jsonify(success=False)
+    return jsonify(success=True,
+                   estado=row["estado"],
+                   fecha=row["fecha"],
+                   release_manager=row["release_manager"])
+
+@app.route("/get_deployment_details_batch", methods=["POST"])
+@login_required
+def get_deployment_details_batch():
+    items = _batch_items(request.get_json(silent=True))
+    if items is None:
+        return jsonify(success=False, message="items must be a list of objects with string fields"), 400
+
+    rows = get_deployments_batch(items)
+    return jsonify(success=True,
+                   results=[{"feature": row["name"],
+                             "ambiente": row["ambiente"],
+                             "success": row["deployment_id"] is not None,
+                             "estado": row["estado"],
+                             "fecha": row["fecha"],
+                             "release_manager": row["release_manager"]}
+                            for row in rows])
 
 @app.route("/reports", methods=["GET"])
 @login_required
+@cached_view(version=get_report_data_version)
 def reports():
-    filtro = request.args.get("filtro", "").strip()
-    filter_estado = request.args.get("filter_estado", "")
-    filter_ambiente = request.args.get("filter_ambiente", "")
-    start_date = request.args.get("start_date", "")
-    end_date = request.args.get("end_date", "")
-
-    rows = get_all_features()
-
-    def within_date_range(row):
-        if not row["fecha"]:
-            return False
-        row_date = datetime.strptime(row["fecha"], "%Y-%m-%d")
-        if start_date:
-            if row_date < datetime.strptime(start_date, "%Y-%m-%d"):
-                return False
-        if end_date:
-            if row_date > datetime.strptime(end_date, "%Y-%m-%d"):
-                return False
-        return True
-
-    filtered_deployments = [
-        r for r in rows
-        if (not filtro or
-            filtro.lower() in r["name"].lower() or
-            filtro.lower() in r["repositorio"].lower() or
-            filtro.lower() in (r["estado"] or "").lower())
-        and (not filter_estado or r["estado"] == filter_estado)
-        and (not filter_ambiente or r["ambiente"] == filter_ambiente)
-        and within_date_range(r)
-    ]
+    filters = report_filters_from_args()
+    filtro = filters["filtro"]
+    filter_estado = filters["filter_estado"]
+    filter_ambiente = filters["filter_ambiente"]
+    start_date = filters["start_date"]
+    end_date = filters["end_date"]
+
+    # Keyset pagination: after=<fecha>,<deployment_id>
+    after = None
+    after_arg = request.args.get("after", "")
+    if after_arg:
+        fecha, _, last_id = after_arg.rpartition(",")
+        if fecha and last_id.isdigit():
+            after = (fecha, int(last_id))
+
+    filtered_deployments, next_after = get_report_page(filters, after=after)
+    total_count = count_report_rows(filters)
+
+    next_url = None
+    if next_after:
+        args = request.args.to_dict()
+        args["after"] = f"{next_after[0]},{next_after[1]}"
+        next_url = url_for("reports", **args)
+    first_url = None
+    if after:
+        args = request.args.to_dict()
+        args.pop("after", None)
+        first_url = url_for("reports", **args)
+
+    export_args = {k: v for k, v in request.args.items() if k not in ("after", "format", "gzip")}
 
     return render_template("reports.html",
                            filtered_deployments=filtered_deployments,
+                           total_count=total_count,
+                           next_url=next_url,
+                           first_url=first_url,
+                           export_args=export_args,
                            ambiente_options=ambiente_options,
                            estado_options=estado_options,
                            filtro=filtro,
@@ -266,6 +473,120 @@ def reports():
                            start_date=start_date,
                            end_date=end_date)
 
+def report_filters_from_args():
+    return {
+        "filtro": request.args.get("filtro", "").strip(),
+        "filter_estado": request.args.get("filter_estado", ""),
+        "filter_ambiente": request.args.get("filter_ambiente", ""),
+        "start_date": request.args.get("start_date", ""),
+        "end_date": request.args.get("end_date", "")
+    }
+
+EXPORT_HEADERS = ["Feature", "Ambiente", "Estado", "Fecha", "Release Manager", "Repositorio", "Comentario"]
+
+def _csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADERS)
+    columns = len(EXPORT_HEADERS)  # sin deployment_id, que solo ordena
+    for rows in batches:
+        writer.writerows(row[:columns] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue()
+
+def _ndjson_chunks(batches):
+    for rows in batches:
+        yield "".join(json.dumps(dict(row), ensure_ascii=False) + "\n" for row in rows)
+
+def _gzip_chunks(chunks):
+    # wbits=31 -> formato gzip (cabecera + CRC), comprimido a medida que se genera
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _ndjson_records(stream):
+    # Una línea por registro; se parsea a medida que llega el cuerpo.
+    # El stream de werkzeug no tiene buffer: iterar líneas leería byte a byte
+    for line in io.BufferedReader(stream, 64 * 1024):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+@app.route("/api/deployments/bulk", methods=["POST"])
+@api_auth_required(["admin", "release_manager"])
+def api_deployments_bulk():
+    """
+    Ingesta masiva para pipelines: un array JSON o NDJSON
+    (Content-Type: application/x-ndjson) de despliegues.
+    """
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        records = _ndjson_records(request.stream)
+    else:
+        records = request.get_json(silent=True)
+        if not isinstance(records, list):
+            return jsonify(success=False, message="Expected a JSON array or NDJSON body"), 400
+
+    results = ingest_deployments(records, ambientes=ambiente_options, estados=estado_options)
+    failed = sum(1 for r in results if not r["ok"])
+    return jsonify(success=failed == 0, total=len(results),
+                   ok=len(results) - failed, failed=failed, results=results)
+
+@app.route("/events")
+@login_required
+def events():
+    """
+    Server-Sent Events con los cambios de la matriz. EventSource reenvía
+    Last-Event-ID al reconectarse y el stream retoma desde ese punto.
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    return Response(broker.stream(last_event_id), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/analytics/lead_time")
+@login_required
+def api_lead_time():
+    """Duración por etapa, lead time PreDEV -> PRD y MTTR por ambiente."""
+    lead_times.refresh()
+    return jsonify(lead_times.summary())
+
+@app.route("/api/features/<int:feature_id>/history")
+@login_required
+def api_feature_history(feature_id):
+    rows = get_feature_history(feature_id, request.args.get("ambiente") or None)
+    return jsonify([dict(row) for row in rows])
+
+@app.route("/reports/export")
+@login_required
+def export_reports():
+    """
+    Exporta todo el resultado filtrado de /reports (no solo la página
+    visible) en streaming: format=csv|ndjson, gzip=1 para comprimir.
+    """
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "ndjson"):
+        return jsonify(success=False, message="format debe ser csv o ndjson"), 400
+
+    batches = iter_report_rows(report_filters_from_args())
+    chunks = _csv_chunks(batches) if fmt == "csv" else _ndjson_chunks(batches)
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f"attachment; filename=deployments_{today}.{fmt}"}
+
+    if request.args.get("gzip") in ("1", "true") and request.accept_encodings["gzip"]:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+        chunks = _gzip_chunks(chunks)
+
+    return Response(chunks, mimetype=mimetype, headers=headers)
+
 @app.route("/delete_feature", methods=["POST"])
 @login_required
 def delete_feature():
@@ -274,22 +595,11 @@ def delete_feature():
     if not feature_name:
         return jsonify(success=False, message="No feature name provided"), 400
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    # Buscar todos los feature_id con ese nombre
-    cursor.execute("SELECT id FROM features WHERE name = ?", (feature_name,))
-    feature_ids = [row["id"] for row in cursor.fetchall()]
-    if not feature_ids:
-        conn.close()
+    # Borra todos los feature con ese nombre; sus deployments caen en cascada
+    counts = bulk_delete(features=[feature_name])
+    if not counts["features"]:
         return jsonify(success=False, message="Feature not found"), 404
-
-    # Eliminar despliegues asociados
-    cursor.executemany("DELETE FROM deployments WHERE feature_id = ?", [(fid,) for fid in feature_ids])
-    # Eliminar el feature
-    cursor.executemany("DELETE FROM features WHERE id = ?", [(fid,) for fid in feature_ids])
-    conn.commit()
-    conn.close()
-    return jsonify(success=True)
+    return jsonify(success=True, deleted=counts)
 
 @app.route("/delete_deployments", methods=["POST"])
 @login_required
@@ -304,21 +614,42 @@ def delete_deployments():
     if isinstance(ambientes, str):
         ambientes = [ambientes]
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM features WHERE name = ?", (feature_name,))
-    feature_ids = [row["id"] for row in cursor.fetchall()]
-    if not feature_ids:
-        conn.close()
+    if get_feature_by_name(feature_name) is None:
         return jsonify(success=False, message="Feature not found"), 404
 
     # Eliminar los despliegues solo para los ambientes indicados
-    for fid in feature_ids:
-        for amb in ambientes:
-            cursor.execute("DELETE FROM deployments WHERE feature_id = ? AND ambiente = ?", (fid, amb))
-    conn.commit()
-    conn.close()
-    return jsonify(success=True)
+    counts = bulk_delete(features=[feature_name], ambientes=ambientes)
+    return jsonify(success=True, deleted=counts)
+
+@app.route("/api/deployments/delete", methods=["POST"])
+@api_auth_required(["admin", "release_manager"])
+def api_deployments_delete():
+    """
+    Borrado masivo: {"features": [...], "ambientes": [...], "estado": "...",
+    "before": "YYYY-MM-DD"}. Solo features borra los features completos;
+    cualquier otro criterio borra los deployments que lo cumplen.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(success=False, message="JSON object required"), 400
+    features = data.get("features") or []
+    ambientes = data.get("ambientes") or []
+    if isinstance(features, str):
+        features = [features]
+    if isinstance(ambientes, str):
+        ambientes = [ambientes]
+    for field, values in (("features", features), ("ambientes", ambientes)):
+        if not (isinstance(values, list) and all(isinstance(v, str) for v in values)):
+            return jsonify(success=False, message=f"{field} must be a list of strings"), 400
+    for field in ("estado", "before"):
+        if data.get(field) is not None and not isinstance(data[field], str):
+            return jsonify(success=False, message=f"{field} must be a string"), 400
+    try:
+        counts = bulk_delete(features=features, ambientes=ambientes,
+                             estado=data.get("estado"), before=data.get("before"))
+    except ValueError as e:
+        return jsonify(success=False, message=str(e)), 400
+    return jsonify(success=True, deleted=counts)
 
 def admin_required(f):
     @wraps(f)
@@ -328,6 +659,69 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+@app.route('/admin/pool_stats')
+@login_required
+@admin_required
+def pool_stats():
+    return jsonify({**get_pool_stats(), "writer": get_writer_stats(), "replica": get_replica_stats(),
+                    "shards": get_shard_stats(),
+                    "archive": {**get_archive_stats(), "scheduler": get_archiver_stats()}})
+
+@app.route('/admin/archive', methods=['POST'])
+@login_required
+@admin_required
+def archive_now():
+    """
+    Archiva ya, sin esperar al agendado: {"before": "YYYY-MM-DD",
+    "estados": [...]} opcionales (por defecto la antigüedad y los estados
+    de la configuración; "estados": [] = todos).
+    """
+    data = request.get_json(silent=True) or {}
+    options = {}
+    if data.get("before") is not None:
+        try:
+            options["before"] = date.fromisoformat(data["before"]).isoformat()
+        except (TypeError, ValueError):
+            return jsonify(success=False, message="before must be YYYY-MM-DD"), 400
+    if "estados" in data:
+        estados = data["estados"]
+        if not (isinstance(estados, list) and all(isinstance(e, str) for e in estados)):
+            return jsonify(success=False, message="estados must be a list of strings"), 400
+        options["estados"] = estados
+    return jsonify(success=True, **archive_deployments(**options))
+
+@app.route('/admin/matrix_check')
+@login_required
+@admin_required
+def matrix_check():
+    """Compara la matriz en memoria con la base; ?repair=1 la recarga si difieren."""
+    return jsonify({**matrix_store.check(repair=request.args.get("repair") == "1"),
+                    "stats": matrix_store.stats()})
+
+@app.route('/metrics')
+@api_auth_required(['admin'])
+def prometheus_metrics():
+    writer = get_writer_stats()
+    pool = get_pool_stats()
+    replica = get_replica_stats()
+    gauges = [
+        ("db_pool_connections_in_use", "Conexiones del pool prestadas.", pool["in_use"]),
+        ("db_writer_queue_depth", "Escrituras esperando al escritor único.", writer["queue_depth"]),
+        ("db_writer_avg_commit_ms", "Duración media de un commit del escritor.", writer["avg_commit_ms"]),
+        ("db_report_replica_age_seconds", "Antigüedad de la réplica de reportes (-1 sin copia).",
+         replica["age_s"] if replica["age_s"] is not None else -1),
+        ("db_report_replica_fallbacks", "Lecturas de reportes que fueron al primario.", replica["fallbacks"]),
+        ("response_cache_bytes", "Bytes en la cache de respuestas.", response_cache.stats()["bytes"]),
+        ("sse_subscribers", "Navegadores conectados a /events.", broker.stats()["subscribers"]),
+    ]
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+@app.route('/admin/cache_stats')
+@login_required
+@admin_required
+def cache_stats():
+    return jsonify(cache=response_cache.stats(), events=broker.stats())
+
 @app.route('/admin/users', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -0,0 +1,47 @@
+# archiveDeployments.py
+# Pasa a deployments_archive los despliegues viejos (por defecto: estado
+# Archived con más de DEPLOYMENTS_ARCHIVE_AFTER_DAYS días) y devuelve al
+# sistema el espacio con incremental_vacuum. Correrlo con la app PARADA:
+# sus notificaciones no salen de este proceso y la matriz en memoria de la
+# app quedaría mostrando lo archivado. Con la app levantada el archivado ya
+# corre agendado en ella (DEPLOYMENTS_ARCHIVE_INTERVAL) o a pedido con
+# POST /admin/archive. --enable-incremental-vacuum reescribe el archivo con
+# VACUUM y va una sola vez en bases creadas antes.
+#
+#   python archiveDeployments.py [--days 365] [--estados Archived,Failed] [--enable-incremental-vacuum]
+import argparse
+
+import model
+from model import create_db, archive_deployments, enable_incremental_vacuum, get_archive_stats
+
+parser = argparse.ArgumentParser(description="Archiva despliegues viejos")
+parser.add_argument("--days", type=int, default=model.ARCHIVE_AFTER_DAYS,
+                    help="archivar los de fecha anterior a hoy - DAYS")
+parser.add_argument("--estados", default=",".join(model.ARCHIVE_ESTADOS),
+                    help="estados a archivar, separados por coma (vacío = todos)")
+parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                    help="convertir la base a auto_vacuum=INCREMENTAL antes de archivar")
+args = parser.parse_args()
+
+model.ARCHIVE_AFTER_DAYS = args.days
+estados = [e.strip() for e in args.estados.split(",") if e.strip()]
+
+create_db()
+if args.enable_incremental_vacuum:
+    enable_incremental_vacuum()
+
+def report(archived):
+    print(f"  {archived} despliegues archivados")
+
+stats = archive_deployments(estados=estados, progress=report)
+archive = get_archive_stats()
+model.shutdown_writer()
+model.shutdown_replica()
+model.close_shards()
+
+print(f"✅ Archive complete: {stats['archived']} archived in {stats['batches']} batches, "
+      f"{stats['freed_pages']} pages freed in {stats['seconds']:.1f}s. "
+      f"Archivo: {archive['rows']} filas, la más nueva del {archive['newest'] or '-'}.")
+if not archive["incremental_vacuum"]:
+    print("⚠️  La base no usa auto_vacuum=INCREMENTAL: correr con --enable-incremental-vacuum "
+          "(app parada) para devolver el espacio")
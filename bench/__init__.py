@@ -0,0 +1,2 @@
+# Benchmarks del dashboard de despliegues. Cada módulo se ejecuta con
+# `python -m bench.<modulo>` desde la raíz del repositorio.
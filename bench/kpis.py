@@ -0,0 +1,92 @@
+# Compara calculate_kpis (filas -> dicts, varias pasadas) con el motor
+# columnar de utils.py sobre despliegues sintéticos de 10k, 100k y 1M filas.
+#
+#   python -m bench.kpis [--sizes 10000 100000 1000000] [--no-numpy]
+
+import argparse
+import gc
+import random
+import sqlite3
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import utils
+
+AMBIENTES = ["PreDEV", "DEV", "UAT", "PPD", "PRD"]
+ESTADOS = ["Valid", "Invalid", "Failed", "Archived", "In-PRD"]
+RMS = ["Michel LF", "Elizabet RC", "Yasser F"]
+
+def synthetic_rows(n_rows, seed=7):
+    """
+    Filas sqlite3.Row con las columnas de get_dashboard_kpi_rows: ~5
+    ambientes por feature y algunas sin ambiente (los KPIs las ignoran).
+    """
+    rnd = random.Random(seed)
+    start = date(2022, 1, 1)
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute('''
+        CREATE TABLE r (name TEXT, ambiente TEXT, estado TEXT, fecha TEXT, release_manager TEXT)
+    ''')
+
+    def generate():
+        feature = 0
+        produced = 0
+        while produced < n_rows:
+            feature += 1
+            name = f"feature-{feature}"
+            if rnd.random() < 0.05:
+                yield (name, None, None, None, None)
+                produced += 1
+                continue
+            for ambiente in AMBIENTES[:rnd.randint(1, len(AMBIENTES))]:
+                fecha = (start + timedelta(days=rnd.randrange(1000))).isoformat()
+                estado = "Valid" if rnd.random() < 0.7 else rnd.choice(ESTADOS)
+                yield (name, ambiente, estado, fecha, rnd.choice(RMS))
+                produced += 1
+
+    conn.executemany('INSERT INTO r VALUES (?, ?, ?, ?, ?)', generate())
+    rows = conn.execute('SELECT * FROM r LIMIT ?', (n_rows,)).fetchall()
+    conn.close()
+    return rows
+
+def measure(fn):
+    """(segundos, pico de memoria en MB) de una ejecución de fn()."""
+    gc.collect()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de motores de KPIs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--no-numpy", action="store_true", help="fuerza el camino en Python puro")
+    args = parser.parse_args()
+    if args.no_numpy:
+        utils.np = None
+
+    engine = "numpy" if utils.np is not None else "python"
+    print(f"motor columnar: {engine}\n")
+    print(f"{'filas':>9} | {'motor':<9} | {'tiempo (s)':>10} | {'pico (MB)':>9} | {'speedup':>7}")
+    print("-" * 58)
+    for size in args.sizes:
+        rows = synthetic_rows(size)
+        old, old_time, old_peak = measure(lambda: utils.calculate_kpis(rows, AMBIENTES))
+        new, new_time, new_peak = measure(
+            lambda: utils.calculate_kpis_columnar(utils.KpiColumns.from_rows(rows), AMBIENTES))
+        assert old == new, (old, new)
+        print(f"{size:>9} | {'dicts':<9} | {old_time:>10.3f} | {old_peak:>9.1f} |")
+        print(f"{'':>9} | {'columnar':<9} | {new_time:>10.3f} | {new_peak:>9.1f} | "
+              f"{old_time / new_time:>6.1f}x")
+        del rows
+
+if __name__ == "__main__":
+    main()
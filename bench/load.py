@@ -0,0 +1,244 @@
+# Benchmark de punta a punta: genera una base sintética (bench.synthetic),
+# levanta la app contra ella y le pega con el test client de Flask desde
+# varios workers concurrentes. Reporta por endpoint latencia p50/p95/p99,
+# throughput y pico de RSS, y compara contra un baseline JSON guardado en
+# una corrida anterior para que las regresiones salten a la vista.
+#
+#   python -m bench.load [--features 5000] [--workers 8] [--requests 200]
+#                        [--baseline bench/baseline.json] [--save-baseline]
+#
+# Sale con código 1 si algún p95 empeoró más que --tolerance respecto del
+# baseline. Los números solo son comparables en la misma máquina.
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import model
+from bench import synthetic
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+def _reset_peak_rss():
+    """Reinicia el pico de RSS del proceso (Linux); False si no se puede."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def _peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Sin /proc: máximo histórico del proceso (KB en Linux, bytes en macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if platform.system() == "Darwin" else peak / 1024
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+def scenarios(app_module, names):
+    """
+    (nombre, función(client, rnd) -> status) por endpoint. Las búsquedas
+    varían el texto para no medir solo la cache de respuestas.
+    """
+    ambientes = app_module.ambiente_options
+    estados = app_module.estado_options
+    conn = model.get_db_connection()
+    feature_ids = [row["id"] for row in conn.execute('SELECT id FROM features')]
+    product_ids = [row["id"] for row in conn.execute('SELECT id FROM products')]
+    conn.close()
+
+    def prefix(rnd):
+        name = rnd.choice(names)
+        return name[:rnd.randint(3, len(name))]
+
+    def kpis(client, rnd):
+        # Lo mismo que hace "/" con un filtro de texto, sin HTTP ni template
+        rows = model.get_dashboard_kpi_rows(prefix(rnd))
+        app_module.calculate_kpis_columnar(app_module.KpiColumns.from_rows(rows), ambientes)
+        return 200
+
+    def update(client, rnd):
+        return client.post("/update_full_deployment", json={
+            "feature": rnd.choice(names), "ambiente": rnd.choice(ambientes),
+            "estado": rnd.choice(estados), "fecha": "2025-06-01", "release_manager": "bench",
+        }).status_code
+
+    return [
+        ("GET /", lambda c, r: c.get("/").status_code),
+        ("GET /?filtro", lambda c, r: c.get("/", query_string={"filtro": prefix(r)}).status_code),
+        ("GET /reports", lambda c, r: c.get("/reports").status_code),
+        ("GET /reports?filtro", lambda c, r: c.get("/reports", query_string={
+            "filtro": prefix(r), "filter_ambiente": r.choice(ambientes)}).status_code),
+        ("calculate_kpis", kpis),
+        ("GET /api/hierarchy", lambda c, r: c.get("/api/hierarchy").status_code),
+        ("GET /api/products/<id>", lambda c, r: c.get(f"/api/products/{r.choice(product_ids)}").status_code),
+        ("GET /api/features/<id>/history",
+         lambda c, r: c.get(f"/api/features/{r.choice(feature_ids)}/history").status_code),
+        ("GET /api/analytics/lead_time", lambda c, r: c.get("/api/analytics/lead_time").status_code),
+        ("POST /get_deployment_details", lambda c, r: c.post("/get_deployment_details", json={
+            "feature": r.choice(names), "ambiente": r.choice(ambientes)}).status_code),
+        ("POST /update_full_deployment", update),
+    ]
+
+def run_scenario(clients, fn, n_requests, seed, max_seconds=None):
+    """
+    Reparte n_requests entre los workers; devuelve métricas del escenario.
+    Con `max_seconds` cada worker deja de pedir al vencer el plazo (los
+    endpoints que no escalan no bloquean la corrida entera).
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(index):
+        nonlocal errors
+        client = clients[index]
+        rnd = random.Random(seed + index)
+        mine = []
+        failed = 0
+        for _ in range(n_requests // len(clients) + (index < n_requests % len(clients))):
+            if deadline is not None and mine and time.perf_counter() > deadline:
+                break
+            start = time.perf_counter()
+            status = fn(client, rnd)
+            mine.append(time.perf_counter() - start)
+            failed += status >= 400
+        with lock:
+            latencies.extend(mine)
+            errors += failed
+
+    tracked = _reset_peak_rss()
+    start = time.perf_counter()
+    deadline = start + max_seconds if max_seconds else None
+    with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+        list(pool.map(worker, range(len(clients))))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "rps": round(len(latencies) / wall, 1),
+        # Sin clear_refs el pico es el del proceso entero hasta ese momento
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "peak_rss_scope": "scenario" if tracked else "process",
+    }
+
+def compare(results, baseline, tolerance):
+    """Lista de (escenario, p95 baseline, p95 actual) que empeoraron más que `tolerance`."""
+    regressions = []
+    for name, current in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old and current["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append((name, old["p95_ms"], current["p95_ms"]))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga de la app con datos sintéticos")
+    parser.add_argument("--db", help="usar una base ya generada con bench.synthetic (se modifica)")
+    parser.add_argument("--tenants", type=int, default=5)
+    parser.add_argument("--solutions", type=int, default=4)
+    parser.add_argument("--products", type=int, default=4)
+    parser.add_argument("--features", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="por escenario")
+    parser.add_argument("--max-seconds", type=float, default=30, help="tope por escenario")
+    parser.add_argument("--only", nargs="+", help="correr solo estos escenarios (subcadena)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="guardar esta corrida como baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="empeoramiento de p95 tolerado")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-load-")
+    if args.db:
+        model.DB_NAME = args.db
+        dataset = {"db": os.path.abspath(args.db)}
+    else:
+        path = os.path.join(tmpdir, "deployments.db")
+        print("generando datos sintéticos...", flush=True)
+        dataset = synthetic.generate(path, args.tenants, args.solutions, args.products, args.features)
+        print(", ".join(f"{k}: {v}" for k, v in dataset.items()))
+
+    # app.py abre model.DB_NAME al importarse: recién ahora
+    import app as app_module
+    app_module.app.logger.disabled = True
+
+    clients = []
+    for _ in range(args.workers):
+        client = app_module.app.test_client()
+        client.post("/login", data={"username": synthetic.ADMIN_USER[0], "password": synthetic.ADMIN_USER[1]})
+        clients.append(client)
+    conn = model.get_db_connection()
+    names = [row["name"] for row in conn.execute('SELECT DISTINCT name FROM features')]
+    conn.close()
+
+    results = {}
+    print(f"\n{'escenario':<32} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | {'req/s':>8} | "
+          f"{'pico MB':>8} | {'err':>4}")
+    print("-" * 95)
+    for seed, (name, fn) in enumerate(scenarios(app_module, names)):
+        if args.only and not any(part in name for part in args.only):
+            continue
+        # Una vuelta corta de calentamiento (templates, caches de sentencias)
+        run_scenario(clients[:1], fn, min(5, args.requests), seed)
+        r = results[name] = run_scenario(clients, fn, args.requests, seed * 1000, args.max_seconds)
+        print(f"{name:<32} | {r['p50_ms']:>8.2f} | {r['p95_ms']:>8.2f} | {r['p99_ms']:>8.2f} | "
+              f"{r['rps']:>8.1f} | {r['peak_rss_mb']:>8.1f} | {r['errors']:>4}", flush=True)
+
+    run = {
+        "meta": {
+            "dataset": dataset,
+            "workers": args.workers,
+            "requests": args.requests,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+    status = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"\nbaseline: {args.baseline} ({baseline['meta'].get('created')})")
+        for name, old, new in regressions:
+            print(f"  REGRESIÓN {name}: p95 {old:.2f} ms -> {new:.2f} ms")
+        if not regressions:
+            print(f"  sin regresiones de p95 mayores a {args.tolerance:.0%}")
+        status = 1 if regressions else 0
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2, sort_keys=True)
+        print(f"\nbaseline guardado en {args.baseline}")
+
+    model.shutdown_writer()
+    model.shutdown_replica()
+    model.close_shards()
+    model._pool.close_all()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    return status
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,142 @@
+# Compara la migración a features_new fila por fila (la versión anterior de
+# model.migrate_features_to_normalized) con la versión por conjuntos y por
+# lotes, sobre tablas features legadas sintéticas. También corta la nueva a
+# mitad de camino y verifica que al retomar llegue al mismo resultado.
+#
+#   python -m bench.migration [--sizes 10000 100000] [--chunk 5000]
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import model
+
+TENANCIES = ["Uruguay", "Panama", "Chile", "Peru", "Mexico"]
+APPLICATIONS = ["INSIS", "Premium", "Core", "Portal"]
+TYPES = ["PersDB", "App", "MDSGen", "MDSHealth"]
+
+def legacy_migrate():
+    """La implementación anterior: hasta seis consultas por feature y un único commit."""
+    conn = model.get_db_connection()
+    c = conn.cursor()
+
+    c.execute('SELECT * FROM features')
+    old_rows = c.fetchall()
+
+    for row in old_rows:
+        tenancy = row['tenancy']
+        application = row['application']
+        tipo = row['type']
+
+        c.execute('SELECT id FROM tenants WHERE name = ?', (tenancy,))
+        tenant = c.fetchone()
+        tenant_id = tenant['id'] if tenant else c.execute('INSERT INTO tenants (name) VALUES (?)', (tenancy,)).lastrowid
+
+        c.execute('SELECT id FROM solutions WHERE name = ? AND tenant_id = ?', (application, tenant_id))
+        solution = c.fetchone()
+        solution_id = solution['id'] if solution else c.execute('INSERT INTO solutions (name, tenant_id) VALUES (?, ?)', (application, tenant_id)).lastrowid
+
+        c.execute('SELECT id FROM products WHERE name = ? AND solution_id = ?', (tipo, solution_id))
+        product = c.fetchone()
+        product_id = product['id'] if product else c.execute('INSERT INTO products (name, solution_id) VALUES (?, ?)', (tipo, solution_id)).lastrowid
+
+        c.execute('''
+            INSERT OR IGNORE INTO features_new (name, repositorio, master, product_id)
+            VALUES (?, ?, ?, ?)
+        ''', (row['name'], row['repositorio'], row['master'], product_id))
+
+    conn.commit()
+    conn.close()
+
+def use_db(path):
+    """Apunta model a otra base, descartando las conexiones del pool y del escritor."""
+    model.shutdown_writer()
+    model._pool.close_all()
+    model.DB_NAME = path
+
+def build_legacy_db(path, n_features, seed=11):
+    use_db(path)
+    model.create_db()
+    rnd = random.Random(seed)
+    conn = model.get_db_connection()
+    conn.executemany('''
+        INSERT INTO features (name, repositorio, type, application, tenancy, master)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', ((f"feat-{i}", f"Repo{i % 3}", rnd.choice(TYPES), rnd.choice(APPLICATIONS),
+           rnd.choice(TENANCIES), "package.sql") for i in range(n_features)))
+    conn.commit()
+    conn.close()
+    # Cierra todo para que el WAL vuelva al archivo antes de copiarlo
+    model._pool.close_all()
+
+def normalized(path):
+    use_db(path)
+    conn = model.get_db_connection()
+    rows = conn.execute('''
+        SELECT f.name, f.repositorio, f.master, t.name, s.name, p.name
+        FROM features_new f
+        JOIN products p ON p.id = f.product_id
+        JOIN solutions s ON s.id = p.solution_id
+        JOIN tenants t ON t.id = s.tenant_id
+        ORDER BY f.name, f.repositorio
+    ''').fetchall()
+    conn.close()
+    return [tuple(r) for r in rows]
+
+class Interrupted(Exception):
+    pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de migrate_features_to_normalized")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--chunk", type=int, default=model.MIGRATION_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-migration-")
+    print(f"{'features':>9} | {'versión':<10} | {'tiempo (s)':>10} | {'filas/s':>9} | {'speedup':>7}")
+    print("-" * 58)
+    try:
+        for size in args.sizes:
+            template = os.path.join(tmpdir, f"template-{size}.db")
+            build_legacy_db(template, size)
+            paths = {}
+            for name in ("legacy", "chunked", "resumed"):
+                paths[name] = os.path.join(tmpdir, f"{name}-{size}.db")
+                shutil.copy(template, paths[name])
+
+            use_db(paths["legacy"])
+            start = time.perf_counter()
+            legacy_migrate()
+            old_time = time.perf_counter() - start
+
+            use_db(paths["chunked"])
+            start = time.perf_counter()
+            model.migrate_features_to_normalized(chunk_size=args.chunk)
+            new_time = time.perf_counter() - start
+
+            # Corta después del primer lote y retoma desde el checkpoint
+            use_db(paths["resumed"])
+            def interrupt(done, total, seconds):
+                raise Interrupted()
+            try:
+                model.migrate_features_to_normalized(chunk_size=args.chunk, progress=interrupt)
+            except Interrupted:
+                pass
+            model.migrate_features_to_normalized(chunk_size=args.chunk)
+
+            expected = normalized(paths["legacy"])
+            assert normalized(paths["chunked"]) == expected, "la versión por lotes difiere"
+            assert normalized(paths["resumed"]) == expected, "la migración retomada difiere"
+
+            print(f"{size:>9} | {'fila/fila':<10} | {old_time:>10.3f} | {size / old_time:>9,.0f} |")
+            print(f"{'':>9} | {'por lotes':<10} | {new_time:>10.3f} | {size / new_time:>9,.0f} | "
+                  f"{old_time / new_time:>6.1f}x")
+    finally:
+        use_db(None)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# Carga mixta de lectura/escritura contra model.py: varios hilos corren las
+# lecturas de reportes y KPIs (conteos y páginas de /reports, el export
+# completo, KPIs con filtro) mientras otros hacen update_full_deployment.
+# Corre dos veces sobre la misma base sintética: con las lecturas en el
+# primario (REPLICA_MAX_AGE = 0) y en la réplica de reportes. Reporta la
+# latencia de las escrituras, el throughput de ambos lados, el tamaño
+# máximo que alcanzó el WAL y la edad máxima de la réplica.
+#
+#   python -m bench.replica [--features 5000] [--readers 4] [--writers 4] [--seconds 10]
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import model
+from bench import synthetic
+from bench.load import _percentile
+
+AMBIENTES = synthetic.AMBIENTES
+ESTADOS = ["Valid", "Invalid", "Failed", "Archived", "In-PRD"]
+
+def _reads(names):
+    """Lecturas de reportes: (nombre, función(rnd))."""
+    def report_filters(rnd):
+        filters = {"filter_ambiente": rnd.choice(AMBIENTES)}
+        if rnd.random() < 0.5:
+            filters["filtro"] = rnd.choice(names)[:4]
+        if rnd.random() < 0.5:
+            filters["start_date"] = f"{rnd.randint(2023, 2025)}-01-01"
+        return filters
+
+    def page(rnd):
+        filters = report_filters(rnd)
+        model.get_report_page(filters)
+        model.count_report_rows(filters)
+
+    def export(rnd):
+        for _ in model.iter_report_rows({"filter_estado": rnd.choice(ESTADOS)}):
+            pass
+
+    def kpis(rnd):
+        model.get_kpi_summary(filter_ambiente=rnd.choice(AMBIENTES))
+
+    return [("page", page), ("page", page), ("export", export), ("kpis", kpis)]
+
+def run(feature_ids, names, readers, writers, seconds, seed=11):
+    write_latencies = []
+    read_latencies = []
+    wal_max = 0
+    age_max = 0.0
+    lock = threading.Lock()
+    stop = threading.Event()
+    wal = model.DB_NAME + "-wal"
+    reads = _reads(names)
+
+    def writer(index):
+        rnd = random.Random(seed + index)
+        mine = []
+        while not stop.is_set():
+            start = time.perf_counter()
+            model.update_full_deployment(rnd.choice(feature_ids), rnd.choice(AMBIENTES),
+                                         rnd.choice(ESTADOS), "2025-06-01", "bench")
+            mine.append(time.perf_counter() - start)
+        with lock:
+            write_latencies.extend(mine)
+
+    def reader(index):
+        rnd = random.Random(seed * 100 + index)
+        mine = []
+        while not stop.is_set():
+            _, fn = rnd.choice(reads)
+            start = time.perf_counter()
+            fn(rnd)
+            mine.append(time.perf_counter() - start)
+        with lock:
+            read_latencies.extend(mine)
+
+    def sampler():
+        nonlocal wal_max, age_max
+        while not stop.wait(0.05):
+            if os.path.exists(wal):
+                wal_max = max(wal_max, os.path.getsize(wal))
+            age = model.get_replica_stats()["age_s"]
+            if model.REPLICA_MAX_AGE > 0 and age is not None:
+                age_max = max(age_max, age)
+
+    threads = ([threading.Thread(target=writer, args=(i,)) for i in range(writers)] +
+               [threading.Thread(target=reader, args=(i,)) for i in range(readers)] +
+               [threading.Thread(target=sampler)])
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    write_latencies.sort()
+    read_latencies.sort()
+    return {
+        "writes": len(write_latencies),
+        "writes_per_s": round(len(write_latencies) / wall, 1),
+        "write_p50_ms": round(_percentile(write_latencies, 0.50) * 1000, 3),
+        "write_p95_ms": round(_percentile(write_latencies, 0.95) * 1000, 3),
+        "write_p99_ms": round(_percentile(write_latencies, 0.99) * 1000, 3),
+        "write_max_ms": round(write_latencies[-1] * 1000, 3),
+        "reads_per_s": round(len(read_latencies) / wall, 1),
+        "read_p50_ms": round(_percentile(read_latencies, 0.50) * 1000, 3),
+        "read_p95_ms": round(_percentile(read_latencies, 0.95) * 1000, 3),
+        "wal_max_kb": round(wal_max / 1024, 1),
+        "replica_age_max_s": round(age_max, 3) if model.REPLICA_MAX_AGE > 0 else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Reportes en el primario vs en la réplica, con escrituras")
+    parser.add_argument("--features", type=int, default=5000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-replica-")
+    base = os.path.join(tmpdir, "base.db")
+    print("generando datos sintéticos...", flush=True)
+    dataset = synthetic.generate(base, features=args.features)
+    print(", ".join(f"{k}: {v}" for k, v in dataset.items()))
+    conn = model.get_db_connection()
+    feature_ids = [row["id"] for row in conn.execute('SELECT id FROM features')]
+    names = [row["name"] for row in conn.execute('SELECT DISTINCT name FROM features')]
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+
+    max_age = model.REPLICA_MAX_AGE or 30
+    results = {}
+    for label, age in (("primario", 0), ("réplica", max_age)):
+        # Cada corrida arranca de la misma base y con el WAL vacío
+        model.shutdown_writer()
+        model.shutdown_replica()
+        model._pool.close_all()
+        model.DB_NAME = os.path.join(tmpdir, f"{'replica' if age else 'primary'}.db")
+        shutil.copyfile(base, model.DB_NAME)
+        model.REPLICA_MAX_AGE = age
+        if age:
+            model.refresh_report_replica()
+        results[label] = run(feature_ids, names, args.readers, args.writers, args.seconds)
+        if age:
+            stats = model.get_replica_stats()
+            results[label]["refreshes"] = stats["refreshes"]
+            results[label]["avg_refresh_ms"] = stats["avg_refresh_ms"]
+            results[label]["fallbacks"] = stats["fallbacks"]
+
+    print(f"\n{args.writers} escritores, {args.readers} lectores de reportes, {args.seconds:g} s por corrida\n")
+    keys = list(results["réplica"])
+    print(f"{'':<20} | {'primario':>12} | {'réplica':>12}")
+    print("-" * 50)
+    for key in keys:
+        values = [results[label].get(key) for label in ("primario", "réplica")]
+        print(f"{key:<20} | " + " | ".join(f"{'-' if v is None else v:>12}" for v in values))
+
+    model.shutdown_replica()
+    model.shutdown_writer()
+    model._pool.close_all()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
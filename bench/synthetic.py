@@ -0,0 +1,129 @@
+# Genera una base de despliegues sintética con el esquema real (create_db
+# y sus migraciones, así que los triggers de KPIs, FTS y eventos quedan
+# poblados igual que en producción): tenants -> solutions -> products ->
+# features, y por cada feature su avance por el pipeline de ambientes.
+#
+#   python -m bench.synthetic --out /tmp/bench.db [--features 20000] [--tenants 5]
+#   DEPLOYMENTS_DB=/tmp/bench.db python app.py
+
+import argparse
+import os
+import random
+import time
+from datetime import date, timedelta
+
+import model
+
+AMBIENTES = ["PreDEV", "DEV", "UAT", "PPD", "PRD"]
+RMS = ["Michel LF", "Elizabet RC", "Yasser F"]
+REPOS = ["Repo1", "Repo2"]
+TENANCIES = ["Uruguay", "Panama", "Chile", "Peru", "Mexico", "Colombia", "Argentina", "Ecuador"]
+APPLICATIONS = ["INSIS", "Premium", "Core", "Portal", "Claims", "Billing"]
+TYPES = ["PersDB", "App", "MDSGen", "MDSHealth"]
+PREFIXES = ["sdd", "hotfix", "feat", "bug", "chg"]
+
+ADMIN_USER = ("admin", "admin")
+
+def _names(base, n):
+    return [base[i] if i < len(base) else f"{base[i % len(base)]}-{i // len(base)}" for i in range(n)]
+
+def _pipeline(rnd, start):
+    """(ambiente, estado, fecha) de un feature que avanzó hasta algún ambiente."""
+    reached = rnd.choices(range(1, len(AMBIENTES) + 1), weights=[10, 20, 25, 20, 25])[0]
+    fecha = start + timedelta(days=rnd.randrange(900))
+    for i, ambiente in enumerate(AMBIENTES[:reached]):
+        last = i == reached - 1
+        if last and rnd.random() < 0.15:
+            estado = rnd.choice(["Failed", "Invalid"])
+        elif ambiente == "PRD":
+            estado = rnd.choice(["In-PRD", "Valid"])
+        elif fecha.year < start.year + 1 and rnd.random() < 0.1:
+            estado = "Archived"
+        else:
+            estado = "Valid"
+        yield ambiente, estado, fecha.isoformat()
+        fecha += timedelta(days=rnd.randint(0, 14))
+
+def generate(path, tenants=5, solutions=4, products=4, features=20000, seed=7):
+    """
+    Crea (o pisa) la base en `path`: `solutions` soluciones por tenant,
+    `products` productos por solución y `features` features repartidos al
+    azar entre los productos. Devuelve un resumen con los conteos.
+    """
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    model.shutdown_writer()
+    model.shutdown_replica()
+    model.close_shards()
+    model._pool.close_all()
+    model.DB_NAME = path
+    model.create_db()
+    model.set_kpi_environments(AMBIENTES)
+    model.create_user(*ADMIN_USER, "admin")
+
+    rnd = random.Random(seed)
+    start = time.perf_counter()
+    conn = model.get_db_connection()
+    try:
+        conn.execute('BEGIN')
+        conn.executemany('INSERT INTO tenants (name) VALUES (?)',
+                         ((name,) for name in _names(TENANCIES, tenants)))
+        tenant_ids = [row["id"] for row in conn.execute('SELECT id FROM tenants ORDER BY id')]
+        conn.executemany('INSERT INTO solutions (tenant_id, name) VALUES (?, ?)',
+                         ((t, name) for t in tenant_ids for name in _names(APPLICATIONS, solutions)))
+        solution_ids = [row["id"] for row in conn.execute('SELECT id FROM solutions ORDER BY id')]
+        conn.executemany('INSERT INTO products (solution_id, name) VALUES (?, ?)',
+                         ((s, name) for s in solution_ids for name in _names(TYPES, products)))
+        product_ids = [row["id"] for row in conn.execute('SELECT id FROM products ORDER BY id')]
+
+        # ~10% de los features existen en los dos repositorios
+        feature_rows = []
+        for i in range(features):
+            name = f"{rnd.choice(PREFIXES)}-{i + 1}"
+            product_id = rnd.choice(product_ids)
+            repos = REPOS if rnd.random() < 0.1 else [rnd.choice(REPOS)]
+            feature_rows.extend((name, repo, product_id, f"{name}.sql") for repo in repos)
+        conn.executemany('INSERT INTO features (name, repositorio, product_id, master) VALUES (?, ?, ?, ?)',
+                         feature_rows)
+
+        first_day = date(2023, 1, 1)
+        conn.executemany(model.UPSERT_DEPLOYMENT_SQL, (
+            (row["id"], ambiente, estado, fecha, rnd.choice(RMS))
+            for row in conn.execute('SELECT id FROM features ORDER BY id').fetchall()
+            for ambiente, estado, fecha in _pipeline(rnd, first_day)
+        ))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    conn = model.get_db_connection()
+    counts = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+              for table in ("tenants", "solutions", "products", "features", "deployments")}
+    conn.close()
+    counts["seconds"] = round(time.perf_counter() - start, 2)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera una base de despliegues sintética")
+    parser.add_argument("--out", required=True, help="ruta de la base a crear (se pisa si existe)")
+    parser.add_argument("--tenants", type=int, default=5)
+    parser.add_argument("--solutions", type=int, default=4, help="por tenant")
+    parser.add_argument("--products", type=int, default=4, help="por solución")
+    parser.add_argument("--features", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    counts = generate(args.out, args.tenants, args.solutions, args.products, args.features, args.seed)
+    model.shutdown_writer()
+    model.shutdown_replica()
+    model.close_shards()
+    model._pool.close_all()
+    print(", ".join(f"{k}: {v}" for k, v in counts.items()))
+    print(f"usuario: {ADMIN_USER[0]} / {ADMIN_USER[1]}")
+
+if __name__ == "__main__":
+    main()
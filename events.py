@@ -0,0 +1,96 @@
+# events.py
+# Pub/sub en proceso para las actualizaciones en vivo del dashboard.
+# Los mensajes publicados quedan en un buffer circular con id creciente:
+# cada conexión SSE (/events) los lee desde su último id, así un navegador
+# que se reconecta con Last-Event-ID recupera lo que se perdió. Si el id ya
+# salió del buffer (o es de otro proceso) recibe "reset" y recarga.
+
+import json
+import threading
+import time
+from collections import deque
+
+EVENT_BUFFER_SIZE = 1000
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 3000
+
+class EventBroker:
+    def __init__(self, buffer_size=EVENT_BUFFER_SIZE):
+        # Los ids llevan la época del proceso: tras un reinicio no se confunden
+        self.epoch = format(int(time.time()), "x")
+        self._buffer = deque(maxlen=buffer_size)
+        self._last_id = 0
+        self._cond = threading.Condition()
+        self._listeners = []
+        self._subscribers = 0
+
+    def subscribe(self, listener):
+        """Listener síncrono: listener(event, data) en el hilo que publica."""
+        self._listeners.append(listener)
+
+    def publish(self, event, data):
+        with self._cond:
+            self._last_id += 1
+            self._buffer.append((self._last_id, event, json.dumps(data, ensure_ascii=False)))
+            self._cond.notify_all()
+        for listener in self._listeners:
+            listener(event, data)
+
+    def _parse_id(self, last_event_id):
+        epoch, _, number = (last_event_id or "").partition("-")
+        if epoch != self.epoch or not number.isdigit():
+            return None
+        return int(number)
+
+    def _pending(self, cursor):
+        """Mensajes con id > cursor; None si el buffer ya no los tiene."""
+        if cursor >= self._last_id:
+            return []
+        first = self._buffer[0][0] if self._buffer else self._last_id + 1
+        if cursor + 1 < first:
+            return None
+        return list(self._buffer)[cursor + 1 - first:]
+
+    def _format(self, message_id, event, data):
+        return f"id: {self.epoch}-{message_id}\nevent: {event}\ndata: {data}\n\n"
+
+    def stream(self, last_event_id=None, heartbeat=HEARTBEAT_SECONDS):
+        """Generador de texto SSE; no termina hasta que el cliente se desconecta."""
+        with self._cond:
+            self._subscribers += 1
+            current = self._last_id
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            cursor = self._parse_id(last_event_id)
+            if last_event_id and cursor is None:
+                yield self._format(current, "reset", "{}")
+            if cursor is None:
+                cursor = current
+            while True:
+                with self._cond:
+                    pending = self._pending(cursor)
+                    if pending == []:
+                        self._cond.wait(timeout=heartbeat)
+                        pending = self._pending(cursor)
+                    last = self._last_id
+                if pending is None:
+                    # Se quedó atrás del buffer: que recargue la vista completa
+                    cursor = last
+                    yield self._format(cursor, "reset", "{}")
+                elif not pending:
+                    yield ": heartbeat\n\n"
+                else:
+                    for message_id, event, data in pending:
+                        yield self._format(message_id, event, data)
+                    cursor = pending[-1][0]
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "last_id": self._last_id,
+                "buffered": len(self._buffer),
+                "subscribers": self._subscribers,
+            }
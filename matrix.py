@@ -0,0 +1,429 @@
+# matrix.py
+# La matriz feature × ambiente del dashboard, en memoria. Se carga una vez
+# al arrancar y la mantienen al día las notificaciones de escritura de
+# model.py (subscribe_writes), así /api/matrix pagina, filtra y cuenta sin
+# tocar SQL. Cada feature (por id) es un FeatureRecord con su fila en un
+# único bytearray: un byte por ambiente, 0 = sin despliegue y n = código
+# del estado (los estados se internan en `estados`). Fecha y release
+# manager van aparte, en un CellDetail solo por celda con despliegue.
+#
+# Como en get_matrix_page, la fila de la matriz es por nombre y solo
+# cuentan los features con jerarquía completa; si el nombre existe en
+# varios repositorios, en cada ambiente gana el de menor id (igual que
+# get_feature_details). Solo se guardan los ambientes de la matriz.
+#
+# Los mismos registros alimentan el autocompletado de nombres
+# (/api/features/suggest): una lista ordenada por nombre en minúsculas
+# donde un prefijo es un rango que se encuentra con bisect.
+
+import bisect
+import threading
+from collections import Counter
+
+from model import get_matrix_cells, get_matrix_features
+
+MATRIX_PAGE_SIZE = 100
+MATRIX_PAGE_MAX = 500
+MATRIX_SORTS = ("name", "type", "application", "tenancy")
+SUGGEST_LIMIT = 10
+SUGGEST_MAX = 50
+FULLY_DEPLOYED_ESTADO = "Valid"
+
+class FeatureRecord:
+    __slots__ = ("id", "name", "repositorio", "master", "product_id", "type", "application", "tenancy", "row")
+
+    def __init__(self, row, index):
+        self.row = index
+        self.update(row)
+
+    def update(self, row):
+        self.id = row["id"]
+        self.name = row["name"]
+        self.repositorio = row["repositorio"]
+        self.master = row["master"]
+        self.product_id = row["product_id"]
+        self.type = row["type"]
+        self.application = row["application"]
+        self.tenancy = row["tenancy"]
+
+class CellDetail:
+    __slots__ = ("fecha", "release_manager")
+
+    def __init__(self, fecha, release_manager):
+        self.fecha = fecha
+        self.release_manager = release_manager
+
+class MatrixStore:
+    """
+    Estado de la matriz y sus conteos. apply() es el listener de
+    model.subscribe_writes; `version` cambia con cada cambio aplicado (sirve
+    de versión para cachear las respuestas que salen de acá).
+    """
+    def __init__(self, ambientes, estados=()):
+        self.ambientes = list(ambientes)
+        self._env_index = {ambiente: i for i, ambiente in enumerate(self.ambientes)}
+        self._initial_estados = list(estados)
+        self._lock = threading.RLock()
+        self.version = 0
+        self._reset()
+
+    def _reset(self):
+        self.estados = [""]      # código -> estado; 0 = celda vacía
+        self._estado_codes = {}
+        for estado in self._initial_estados:
+            self._code(estado)
+        self._features = {}      # feature_id -> FeatureRecord
+        self._by_name = {}       # nombre -> [FeatureRecord] por id
+        self._status = bytearray()
+        self._free_rows = []
+        self._details = {}       # índice de celda (fila * ambientes + ambiente) -> CellDetail
+        self._names = []         # nombres con fila en la matriz, ordenados
+        self._merged = {}        # nombre -> (códigos por ambiente, fully deployed)
+        self._orders = {}        # sort -> [(clave, nombre)] ascendente; se arma al pedirlo
+        self._counts = Counter() # (ambiente, código) -> filas de la matriz
+        self._fully = 0
+        self._suggest = []       # (nombre en minúsculas, nombre, repositorio, id) ordenado
+
+    def _code(self, estado):
+        code = self._estado_codes.get(estado)
+        if code is None:
+            code = self._estado_codes[estado] = len(self.estados)
+            self.estados.append(estado)
+        return code
+
+    # --- carga y cambios ---
+
+    def load(self):
+        """(Re)carga la matriz completa desde la base."""
+        with self._lock:
+            self._reset()
+            self._load(get_matrix_features(), get_matrix_cells())
+            self.version += 1
+
+    def _load(self, features, cells):
+        # Carga completa: las listas ordenadas se arman al final, no con insort
+        bulk = not self._features
+        names = set()
+        for row in features:
+            self._add_record(row, bulk)
+            names.add(row["name"])
+        for row in cells:
+            self._set_cell(row["feature_id"], row["ambiente"], row["estado"],
+                           row["fecha"], row["release_manager"])
+        for name in names:
+            self._refresh_name(name, bulk)
+        if bulk:
+            self._suggest.sort()
+            self._names = sorted(self._merged)
+
+    def apply(self, changes):
+        """Listener de model.subscribe_writes: aplica cambios ya confirmados."""
+        with self._lock:
+            # Altas: la fila viene en el cambio. Corre en el hilo escritor,
+            # así que acá no se lee la base (check() detecta lo que falte)
+            created = [change["record"] for change in changes if change.get("created")]
+            if created:
+                self._load(created, [])
+
+            touched = set()
+            for change in changes:
+                if change.get("deleted") and not change.get("ambiente"):
+                    self._remove_name(change["feature"])
+                    touched.add(change["feature"])
+                    continue
+                record = self._features.get(change.get("feature_id"))
+                if record is None or "ambiente" not in change:
+                    continue
+                if change.get("deleted"):
+                    self._set_cell(record.id, change["ambiente"], None, None, None)
+                else:
+                    self._set_cell(record.id, change["ambiente"], change["estado"],
+                                   change["fecha"], change["release_manager"])
+                touched.add(record.name)
+            for name in touched:
+                self._refresh_name(name)
+            self.version += 1
+
+    def _add_record(self, row, bulk=False):
+        record = self._features.get(row["id"])
+        if record is not None:
+            self._unsuggest(record)
+            if record.name != row["name"]:
+                self._by_name[record.name].remove(record)
+                self._refresh_name(record.name)
+            record.update(row)
+        else:
+            if self._free_rows:
+                index = self._free_rows.pop()
+            else:
+                index = len(self._status) // len(self.ambientes)
+                self._status.extend(bytes(len(self.ambientes)))
+            record = self._features[row["id"]] = FeatureRecord(row, index)
+        records = self._by_name.setdefault(record.name, [])
+        if record not in records:
+            bisect.insort(records, record, key=lambda r: r.id)
+        if bulk:
+            self._suggest.append(self._suggest_key(record))
+        else:
+            bisect.insort(self._suggest, self._suggest_key(record))
+        self._orders.clear()
+
+    @staticmethod
+    def _suggest_key(record):
+        return record.name.casefold(), record.name, record.repositorio, record.id
+
+    def _unsuggest(self, record):
+        key = self._suggest_key(record)
+        index = bisect.bisect_left(self._suggest, key)
+        if index < len(self._suggest) and self._suggest[index] == key:
+            del self._suggest[index]
+
+    def _remove_name(self, name):
+        width = len(self.ambientes)
+        for record in self._by_name.pop(name, []):
+            start = record.row * width
+            self._status[start:start + width] = bytes(width)
+            for cell in range(start, start + width):
+                self._details.pop(cell, None)
+            self._free_rows.append(record.row)
+            self._unsuggest(record)
+            del self._features[record.id]
+        self._orders.clear()
+
+    def _set_cell(self, feature_id, ambiente, estado, fecha, release_manager):
+        record = self._features.get(feature_id)
+        env = self._env_index.get(ambiente)
+        if record is None or env is None:
+            return
+        cell = record.row * len(self.ambientes) + env
+        if estado is None:
+            self._status[cell] = 0
+            self._details.pop(cell, None)
+        else:
+            self._status[cell] = self._code(estado)
+            self._details[cell] = CellDetail(fecha, release_manager)
+
+    def _merge(self, records):
+        """(códigos por ambiente, fully deployed) de la fila que forman `records` (por id)."""
+        width = len(self.ambientes)
+        cells = bytearray(width)
+        valid = 0
+        valid_code = self._estado_codes.get(FULLY_DEPLOYED_ESTADO)
+        for record in reversed(records):
+            start = record.row * width
+            for env, code in enumerate(self._status[start:start + width]):
+                if code:
+                    cells[env] = code
+                if code == valid_code:
+                    valid |= 1 << env
+        return bytes(cells), valid == (1 << width) - 1
+
+    def _visible(self, name):
+        return [record for record in self._by_name.get(name, ()) if record.tenancy is not None]
+
+    def _refresh_name(self, name, bulk=False):
+        """Recalcula la fila de `name` y ajusta conteos y la lista de nombres."""
+        old = self._merged.pop(name, None)
+        if old is not None:
+            cells, fully = old
+            for env, code in enumerate(cells):
+                if code:
+                    self._counts[env, code] -= 1
+            self._fully -= fully
+        records = self._visible(name)
+        if not records:
+            if old is not None:
+                del self._names[bisect.bisect_left(self._names, name)]
+                self._orders.clear()
+            return
+        cells, fully = self._merged[name] = self._merge(records)
+        for env, code in enumerate(cells):
+            if code:
+                self._counts[env, code] += 1
+        self._fully += fully
+        if old is None and not bulk:
+            bisect.insort(self._names, name)
+            self._orders.clear()
+
+    # --- lecturas ---
+
+    def page(self, filters=None, sort="name", descending=False, after=None, limit=None):
+        """
+        Lo mismo que model.get_matrix_page, desde memoria. La primera página
+        (sin `after`) trae además "counts" ({ambiente: {estado: filas}}) y
+        "fully_deployed" de todas las filas que pasan los filtros.
+        """
+        filters = filters or {}
+        limit = max(1, min(limit or MATRIX_PAGE_SIZE, MATRIX_PAGE_MAX))
+        sort = sort if sort in MATRIX_SORTS else "name"
+        exact = {key: filters[key] for key in ("type", "application", "tenancy") if filters.get(key)}
+        match = None
+        if exact:
+            def match(record):
+                return all(getattr(record, key) == value for key, value in exact.items())
+
+        with self._lock:
+            entries = self._entries(sort, filters.get("name") or "", match)
+            if descending:
+                end = bisect.bisect_left(entries, (str(after[0]), str(after[1]))) if after else len(entries)
+                selected = entries[max(0, end - limit - 1):end][::-1]
+            else:
+                start = bisect.bisect_right(entries, (str(after[0]), str(after[1]))) if after else 0
+                selected = entries[start:start + limit + 1]
+            has_more = len(selected) > limit
+            selected = selected[:limit]
+            page = {
+                "rows": [self._row(name, match) for _, name in selected],
+                "next": list(selected[-1]) if has_more else None,
+                "total": None if after else len(entries),
+            }
+            if not after:
+                page.update(self._summary(entries, match))
+        return page
+
+    def _entries(self, sort, prefix, match):
+        """[(clave de orden, nombre)] ascendente de las filas que pasan los filtros."""
+        if match is None:
+            order = self._order(sort)
+            if not prefix:
+                return order
+            if sort == "name":
+                return order[bisect.bisect_left(order, (prefix,)):
+                             bisect.bisect_left(order, (prefix + "\U0010ffff",))]
+            return [entry for entry in order if entry[1].startswith(prefix)]
+        # Con filtros de jerarquía la fila y su clave salen solo de los repositorios que pasan
+        names = self._names[bisect.bisect_left(self._names, prefix):
+                            bisect.bisect_left(self._names, prefix + "\U0010ffff")] if prefix else self._names
+        entries = []
+        for name in names:
+            records = [record for record in self._visible(name) if match(record)]
+            if records:
+                entries.append((name if sort == "name" else min(getattr(r, sort) for r in records), name))
+        entries.sort()
+        return entries
+
+    def _order(self, sort):
+        order = self._orders.get(sort)
+        if order is None:
+            if sort == "name":
+                order = [(name, name) for name in self._names]
+            else:
+                order = sorted((min(getattr(r, sort) for r in self._visible(name)), name)
+                               for name in self._names)
+            self._orders[sort] = order
+        return order
+
+    def _row(self, name, match):
+        records = [record for record in self._visible(name) if match is None or match(record)]
+        cells, fully = self._merged[name] if match is None else self._merge(records)
+        first = records[0]
+        return {
+            "name": name,
+            "repositorio": first.repositorio,
+            "type": first.type,
+            "application": first.application,
+            "tenancy": first.tenancy,
+            "master": first.master,
+            "env_status": {ambiente: self.estados[code] for ambiente, code in zip(self.ambientes, cells)},
+            "fully_deployed": fully,
+        }
+
+    def _summary(self, entries, match):
+        if match is None and len(entries) == len(self._names):
+            counts, fully = self._counts, self._fully
+        else:
+            counts, fully = Counter(), 0
+            for _, name in entries:
+                cells, row_fully = self._merged[name] if match is None else self._merge(
+                    [record for record in self._visible(name) if match(record)])
+                counts.update((env, code) for env, code in enumerate(cells) if code)
+                fully += row_fully
+        return {
+            "counts": {ambiente: {estado: counts[env, code]
+                                  for code, estado in enumerate(self.estados) if code and counts[env, code]}
+                       for env, ambiente in enumerate(self.ambientes)},
+            "fully_deployed": fully,
+        }
+
+    def details(self, name):
+        """Lo mismo que model.get_feature_details (para los ambientes de la matriz)."""
+        width = len(self.ambientes)
+        details = {}
+        with self._lock:
+            for record in reversed(self._by_name.get(name, [])):
+                start = record.row * width
+                for env, code in enumerate(self._status[start:start + width]):
+                    if code:
+                        detail = self._details[start + env]
+                        details[self.ambientes[env]] = {"estado": self.estados[code], "fecha": detail.fecha,
+                                                        "release_manager": detail.release_manager}
+        return {ambiente: details[ambiente] for ambiente in self.ambientes if ambiente in details}
+
+    def suggest(self, prefix, limit=None):
+        """
+        Hasta `limit` features (con repositorio y producto) cuyo nombre
+        empieza con `prefix`, sin distinguir mayúsculas, en orden de nombre.
+        """
+        prefix = (prefix or "").strip().casefold()
+        if not prefix:
+            return []
+        limit = max(1, min(limit or SUGGEST_LIMIT, SUGGEST_MAX))
+        with self._lock:
+            start = bisect.bisect_left(self._suggest, (prefix,))
+            keys = self._suggest[start:start + limit]
+            records = [self._features[key[3]] for key in keys if key[0].startswith(prefix)]
+            return [{"name": record.name, "repositorio": record.repositorio, "feature_id": record.id,
+                     "product_id": record.product_id, "product": record.type,
+                     "application": record.application, "tenancy": record.tenancy}
+                    for record in records]
+
+    # --- control ---
+
+    def _snapshot(self):
+        width = len(self.ambientes)
+        snapshot = {}
+        for record in self._features.values():
+            start = record.row * width
+            cells = tuple((self.estados[code], self._details[start + env].fecha,
+                           self._details[start + env].release_manager) if code else None
+                          for env, code in enumerate(self._status[start:start + width]))
+            snapshot[record.id] = (record.name, record.repositorio, record.master, record.product_id,
+                                   record.type, record.application, record.tenancy, cells)
+        return snapshot
+
+    def check(self, repair=False):
+        """
+        Compara la matriz con la base y devuelve los ids de features que no
+        coinciden. Frena los cambios mientras lee; una escritura confirmada
+        durante la lectura puede aparecer como diferencia. Con repair=True y
+        diferencias, adopta lo leído.
+        """
+        with self._lock:
+            fresh = MatrixStore(self.ambientes, self._initial_estados)
+            fresh._load(get_matrix_features(), get_matrix_cells())
+            mine, theirs = self._snapshot(), fresh._snapshot()
+            mismatches = sorted(feature_id for feature_id in mine.keys() | theirs.keys()
+                                if mine.get(feature_id) != theirs.get(feature_id))
+            if mismatches and repair:
+                for attr in ("estados", "_estado_codes", "_features", "_by_name", "_status", "_free_rows",
+                             "_details", "_names", "_merged", "_orders", "_counts", "_fully", "_suggest"):
+                    setattr(self, attr, getattr(fresh, attr))
+                self.version += 1
+        return {
+            "features": len(theirs),
+            "mismatches": len(mismatches),
+            "feature_ids": mismatches[:100],
+            "repaired": bool(mismatches and repair),
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "features": len(self._features),
+                "rows": len(self._names),
+                "estados": len(self.estados) - 1,
+                "status_bytes": len(self._status),
+                "cells": len(self._details),
+                "fully_deployed": self._fully,
+                "version": self.version,
+            }
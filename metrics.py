@@ -0,0 +1,149 @@
+# metrics.py
+# Métricas en proceso para /metrics (formato de texto de Prometheus):
+# latencia y tamaño de respuesta por ruta, consultas SQL por request y
+# duración de cada sentencia. Las consultas que superan SLOW_QUERY_MS se
+# escriben en el log "deploy_mgmt.slow_query". Todo vive en memoria y se
+# reinicia con el proceso; Prometheus se encarga de acumular.
+
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+slow_query_log = logging.getLogger("deploy_mgmt.slow_query")
+
+def _labels(**labels):
+    return ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                    for k, v in labels.items())
+
+class Histogram:
+    """Histograma acumulativo con los límites fijos de `buckets` (le)."""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels=""):
+        sep = "," if labels else ""
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            yield f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}'
+        suffix = f"{{{labels}}}" if labels else ""
+        yield f"{name}_sum{suffix} {self.sum}"
+        yield f"{name}_count{suffix} {self.count}"
+
+class Metrics:
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._requests = {}   # (ruta, método, status) -> requests
+        self._latency = {}    # (ruta, método) -> Histogram en segundos
+        self._sizes = {}      # ruta -> Histogram en bytes
+        self._queries = {}    # ruta -> Histogram de consultas por request
+        self._statements = Histogram(LATENCY_BUCKETS)
+        self._slow = 0
+
+    # --- Por request (hilo del request) ---
+
+    def begin_request(self):
+        local = self._local
+        local.start = time.perf_counter()
+        local.queries = 0
+        local.db_seconds = 0.0
+
+    def observe_statement(self, sql, seconds):
+        """Observer para model.observe_statements: corre en el hilo que ejecuta."""
+        local = self._local
+        try:
+            local.queries += 1
+            local.db_seconds += seconds
+        except AttributeError:
+            pass  # fuera de un request (p.ej. el hilo escritor)
+        with self._lock:
+            self._statements.observe(seconds)
+        if seconds * 1000 >= self.slow_query_ms:
+            with self._lock:
+                self._slow += 1
+            slow_query_log.warning("slow query (%.1f ms): %s", seconds * 1000, " ".join(sql.split())[:1000])
+
+    def end_request(self, route, method, status, size=None):
+        """Registra el request y devuelve el valor del header Server-Timing."""
+        local = self._local
+        elapsed = time.perf_counter() - local.start
+        queries, db_seconds = local.queries, local.db_seconds
+        del local.start, local.queries, local.db_seconds
+        with self._lock:
+            key = (route, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            latency = self._latency.get((route, method))
+            if latency is None:
+                latency = self._latency[(route, method)] = Histogram(LATENCY_BUCKETS)
+            latency.observe(elapsed)
+            counts = self._queries.get(route)
+            if counts is None:
+                counts = self._queries[route] = Histogram(QUERY_COUNT_BUCKETS)
+            counts.observe(queries)
+            # Las respuestas en streaming (export, /events) no tienen tamaño conocido
+            if size is not None:
+                sizes = self._sizes.get(route)
+                if sizes is None:
+                    sizes = self._sizes[route] = Histogram(SIZE_BUCKETS)
+                sizes.observe(size)
+        return (f'db;dur={db_seconds * 1000:.2f};desc="{queries} queries", '
+                f'app;dur={elapsed * 1000:.2f}')
+
+    # --- Exposición ---
+
+    def render(self, gauges=()):
+        """Texto para /metrics. `gauges`: (nombre, ayuda, valor) calculados al vuelo."""
+        out = []
+        with self._lock:
+            out += ["# HELP http_requests_total Requests atendidos por ruta, método y status.",
+                    "# TYPE http_requests_total counter"]
+            for (route, method, status), n in sorted(self._requests.items()):
+                out.append(f"http_requests_total{{{_labels(route=route, method=method, status=status)}}} {n}")
+
+            out += ["# HELP http_request_duration_seconds Latencia de los requests.",
+                    "# TYPE http_request_duration_seconds histogram"]
+            for (route, method), histogram in sorted(self._latency.items()):
+                out += histogram.lines("http_request_duration_seconds", _labels(route=route, method=method))
+
+            out += ["# HELP http_response_size_bytes Tamaño del cuerpo de las respuestas.",
+                    "# TYPE http_response_size_bytes histogram"]
+            for route, histogram in sorted(self._sizes.items()):
+                out += histogram.lines("http_response_size_bytes", _labels(route=route))
+
+            out += ["# HELP db_queries_per_request Sentencias SQL ejecutadas en el hilo del request.",
+                    "# TYPE db_queries_per_request histogram"]
+            for route, histogram in sorted(self._queries.items()):
+                out += histogram.lines("db_queries_per_request", _labels(route=route))
+
+            out += ["# HELP db_statement_duration_seconds Duración de cada sentencia SQL.",
+                    "# TYPE db_statement_duration_seconds histogram"]
+            out += self._statements.lines("db_statement_duration_seconds")
+
+            out += [f"# HELP db_slow_statements_total Sentencias de {self.slow_query_ms:g} ms o más.",
+                    "# TYPE db_slow_statements_total counter",
+                    f"db_slow_statements_total {self._slow}"]
+
+        for name, help_text, value in gauges:
+            out += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(out) + "\n"
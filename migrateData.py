@@ -1,7 +1,12 @@
 # migrate.py
 from model import create_db, migrate_features_to_normalized
 
+def report(done, total, seconds):
+    rate = done / seconds if seconds else 0
+    print(f"  {done}/{total} features ({rate:,.0f} filas/s)")
+
 create_db()
-migrate_features_to_normalized()
+stats = migrate_features_to_normalized(progress=report)
 
-print("✅ Migration complete.")
\ No newline at end of file
+print(f"✅ Migration complete: {stats['migrated']} migrated, {stats['skipped']} skipped "
+      f"in {stats['seconds']:.1f}s.")
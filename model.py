@@ -1,10 +1,29 @@
 import sqlite3
 import hashlib
+import heapq
+import itertools
+import json
+import logging
+import os
+import re
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
+from urllib.parse import quote
 
-DB_NAME = "deployments.db"
+from utils import build_kpis, day_span, most_common_value
 
-def create_db():
-    conn = sqlite3.connect(DB_NAME)
+# DEPLOYMENTS_DB permite levantar la app sobre otra base (p.ej. una de bench.synthetic)
+DB_NAME = os.environ.get("DEPLOYMENTS_DB", "deployments.db")
+
+def create_db(path=None):
+    conn = sqlite3.connect(path or DB_NAME)
+    # Solo tiene efecto en una base nueva; las existentes: enable_incremental_vacuum()
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
     c = conn.cursor()
 
     c.execute('''
@@ -65,7 +84,7 @@ def create_db():
             fecha TEXT,
             release_manager TEXT,
             UNIQUE(feature_id, ambiente),
-            FOREIGN KEY(feature_id) REFERENCES features(id)
+            FOREIGN KEY(feature_id) REFERENCES features(id) ON DELETE CASCADE
         )
     ''')
     # Tabla de usuarios
@@ -78,77 +97,1734 @@ def create_db():
         )
     ''')
     conn.commit()
+    migrate_schema(conn)
+    shard_paths = [] if path else [row[0] for row in conn.execute('SELECT path FROM tenant_shards')]
     conn.close()
+    # Los shards por tenant (si los hay) llevan el mismo esquema
+    base = os.path.dirname(os.path.abspath(DB_NAME))
+    for shard_path in shard_paths:
+        create_db(os.path.join(base, shard_path))
 
-def migrate_features_to_normalized():
-    conn = get_db_connection()
-    c = conn.cursor()
+# --- MIGRACIONES DE ESQUEMA (versionadas con PRAGMA user_version) ---
+#
+# Cada entrada lleva el esquema de la versión N-1 a la N. Una entrada es una
+# lista de sentencias SQL o una función que recibe la conexión. Nunca se
+# edita una migración ya publicada: se agrega una nueva al final.
+
+migration_log = logging.getLogger("deploy_mgmt.migrations")
 
-    c.execute('SELECT * FROM features')
-    old_rows = c.fetchall()
+SCHEMA_MIGRATIONS = [
+    # 1: índices secundarios para todas las consultas de model.py y app.py.
+    #    UNIQUE(name, repositorio) ya sirve las búsquedas por features.name y
+    #    UNIQUE(feature_id, ambiente) las de deployments por feature.
+    [
+        # /api/solutions/<tenant_id> y el JOIN solutions -> tenants
+        "CREATE INDEX IF NOT EXISTS idx_solutions_tenant ON solutions(tenant_id, name)",
+        # /api/products/<solution_id> y el JOIN products -> solutions
+        "CREATE INDEX IF NOT EXISTS idx_products_solution ON products(solution_id, name)",
+        # features de un producto (jerarquía -> features)
+        "CREATE INDEX IF NOT EXISTS idx_features_product ON features(product_id)",
+        # /reports: rango de fechas ordenado por (fecha, id); el rowid va implícito
+        "CREATE INDEX IF NOT EXISTS idx_deployments_fecha ON deployments(fecha)",
+        # /reports y dashboard filtrando por ambiente o estado + rango de fechas
+        "CREATE INDEX IF NOT EXISTS idx_deployments_ambiente_fecha ON deployments(ambiente, fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_deployments_estado_fecha ON deployments(estado, fecha)",
+    ],
+    # 2: índice FTS5 del buscador (features + jerarquía) y sus triggers
+    lambda conn: _create_features_fts(conn),
+    # 3: resúmenes de KPIs mantenidos por triggers sobre deployments
+    lambda conn: _create_kpi_summary(conn),
+    # 4: deployments con ON DELETE CASCADE hacia features
+    lambda conn: _add_deployments_cascade(conn),
+    # 5: contadores de versión para los caches en memoria (jerarquía)
+    lambda conn: _create_cache_versions(conn),
+    # 6: historial append-only de despliegues (deployment_events)
+    lambda conn: _create_deployment_events(conn),
+    # 7: contador "data" para el cache de respuestas (dashboard y reportes)
+    lambda conn: _add_data_cache_version(conn),
+    # 8: mapa tenant -> archivo de shard (vacío = una sola base; ver splitShards.py)
+    ["CREATE TABLE IF NOT EXISTS tenant_shards (tenant_id INTEGER PRIMARY KEY, path TEXT NOT NULL)"],
+    # 9: archivo de despliegues viejos (deployments_archive) y sus eventos
+    lambda conn: _create_deployments_archive(conn),
+    # 10: splitShards dejaba dos filas por tabla en sqlite_sequence; queda la mayor
+    ["""DELETE FROM sqlite_sequence WHERE rowid NOT IN
+        (SELECT rowid FROM (SELECT rowid, max(seq) FROM sqlite_sequence GROUP BY name))"""],
+    # 11: /reports filtrando por ambiente o estado también lee el archivo:
+    #     los mismos índices que la migración 1 da a deployments
+    [
+        "CREATE INDEX IF NOT EXISTS idx_deployments_archive_ambiente_fecha ON deployments_archive(ambiente, fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_deployments_archive_estado_fecha ON deployments_archive(estado, fecha)",
+    ],
+]
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate_schema(conn):
+    version = get_schema_version(conn)
+    if version >= len(SCHEMA_MIGRATIONS):
+        return
+    for target in range(version + 1, len(SCHEMA_MIGRATIONS) + 1):
+        migration = SCHEMA_MIGRATIONS[target - 1]
+        if callable(migration):
+            migration(conn)
+        else:
+            for statement in migration:
+                conn.execute(statement)
+        conn.execute(f'PRAGMA user_version = {target}')
+        conn.commit()
+    # Estadísticas frescas para que el planificador use los índices nuevos
+    conn.execute('ANALYZE')
+    conn.commit()
+
+def _add_deployments_cascade(conn):
+    """
+    SQLite no puede cambiar una FK con ALTER TABLE: se recrea deployments
+    con ON DELETE CASCADE, se copian las filas (sin huérfanos, que la FK ya
+    no admite) y se rehacen sus índices y triggers.
+    """
+    conn.commit()
+    conn.execute('PRAGMA foreign_keys = OFF')
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'deployments'").fetchone()
+    # Los huérfanos no pasan a la tabla nueva: que quede constancia de cuáles eran
+    orphans = conn.execute('''
+        SELECT id, feature_id, ambiente, estado, fecha FROM deployments
+        WHERE feature_id NOT IN (SELECT id FROM features)
+    ''').fetchall()
+    if orphans:
+        migration_log.warning("deployments cascade: dropping %d orphan deployments "
+                              "(id, feature_id, ambiente, estado, fecha), first %d: %s",
+                              len(orphans), min(len(orphans), 100),
+                              "; ".join(str(tuple(row)) for row in orphans[:100]))
+    # features_kpi_ad lee deployments: sin él, el RENAME no choca con la tabla borrada
+    conn.executescript('''
+        BEGIN;
+        DROP TRIGGER IF EXISTS features_kpi_ad;
+        CREATE TABLE deployments_cascade (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            feature_id INTEGER NOT NULL,
+            ambiente TEXT,
+            estado TEXT,
+            fecha TEXT,
+            release_manager TEXT,
+            UNIQUE(feature_id, ambiente),
+            FOREIGN KEY(feature_id) REFERENCES features(id) ON DELETE CASCADE
+        );
+        INSERT INTO deployments_cascade (id, feature_id, ambiente, estado, fecha, release_manager)
+        SELECT id, feature_id, ambiente, estado, fecha, release_manager
+        FROM deployments
+        WHERE feature_id IN (SELECT id FROM features);
+        DROP TABLE deployments;
+        ALTER TABLE deployments_cascade RENAME TO deployments;
+        COMMIT;
+    ''')
+    if seq:
+        conn.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'deployments'", (seq[0],))
+    for statement in SCHEMA_MIGRATIONS[0]:
+        if " ON deployments(" in statement:
+            conn.execute(statement)
+    _create_kpi_triggers(conn)
+    rebuild_kpi_summary(conn)
+    conn.commit()
+    conn.execute('PRAGMA foreign_keys = ON')
 
-    for row in old_rows:
-        tenancy = row['tenancy']
-        application = row['application']
-        tipo = row['type']
+MIGRATION_CHUNK_SIZE = 5000
 
-        # Tenant
-        c.execute('SELECT id FROM tenants WHERE name = ?', (tenancy,))
-        tenant = c.fetchone()
-        tenant_id = tenant['id'] if tenant else c.execute('INSERT INTO tenants (name) VALUES (?)', (tenancy,)).lastrowid
+# Producto de cada feature legado según (tenancy, application, type); con
+# jerarquía incompleta queda NULL y features_new (NOT NULL) ignora la fila
+_LEGACY_PRODUCT_ID = '''
+    SELECT MIN(p.id)
+    FROM tenants t
+    JOIN solutions s ON s.tenant_id = t.id AND s.name = f.application
+    JOIN products p ON p.solution_id = s.id AND p.name = f.type
+    WHERE t.name = f.tenancy
+'''
 
-        # Solution
-        c.execute('SELECT id FROM solutions WHERE name = ? AND tenant_id = ?', (application, tenant_id))
-        solution = c.fetchone()
-        solution_id = solution['id'] if solution else c.execute('INSERT INTO solutions (name, tenant_id) VALUES (?, ?)', (application, tenant_id)).lastrowid
+def _build_legacy_hierarchy(conn):
+    """Tenants, solutions y products que faltan, en tres INSERT ... SELECT DISTINCT."""
+    conn.executescript('''
+        BEGIN;
+        INSERT OR IGNORE INTO tenants (name)
+        SELECT DISTINCT tenancy FROM features WHERE tenancy IS NOT NULL;
 
-        # Product
-        c.execute('SELECT id FROM products WHERE name = ? AND solution_id = ?', (tipo, solution_id))
-        product = c.fetchone()
-        product_id = product['id'] if product else c.execute('INSERT INTO products (name, solution_id) VALUES (?, ?)', (tipo, solution_id)).lastrowid
+        INSERT INTO solutions (tenant_id, name)
+        SELECT DISTINCT t.id, f.application
+        FROM features f
+        JOIN tenants t ON t.name = f.tenancy
+        WHERE f.application IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM solutions s
+                          WHERE s.tenant_id = t.id AND s.name = f.application);
 
-        # Insert into new features
-        c.execute('''
-            INSERT OR IGNORE INTO features_new (name, repositorio, master, product_id)
-            VALUES (?, ?, ?, ?)
-        ''', (row['name'], row['repositorio'], row['master'], product_id))
+        INSERT INTO products (solution_id, name)
+        SELECT DISTINCT s.id, f.type
+        FROM features f
+        JOIN tenants t ON t.name = f.tenancy
+        JOIN solutions s ON s.id = (SELECT MIN(id) FROM solutions
+                                    WHERE tenant_id = t.id AND name = f.application)
+        WHERE f.type IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM products p
+                          WHERE p.solution_id = s.id AND p.name = f.type);
+        COMMIT;
+    ''')
 
+def migrate_features_to_normalized(chunk_size=MIGRATION_CHUNK_SIZE, progress=None, restart=False):
+    """
+    Pasa features (tenancy/application/type) a features_new + jerarquía.
+    Primero crea la jerarquía por conjuntos y después copia los features en
+    lotes de `chunk_size` por id, cada uno en su propia transacción junto con
+    el checkpoint: si se corta, la siguiente ejecución sigue desde ahí.
+    `progress(hechos, total, segundos)` se llama después de cada lote.
+    Devuelve {"migrated", "skipped", "seconds"} de esta ejecución.
+    """
+    conn = get_db_connection()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS migration_checkpoints (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        )
+    ''')
+    if restart:
+        conn.execute("DELETE FROM migration_checkpoints WHERE name = 'features_normalized'")
     conn.commit()
-    conn.close()
+
+    start = time.perf_counter()
+    columns = {row["name"] for row in conn.execute('PRAGMA table_info(features)')}
+    if not {"tenancy", "application", "type"} <= columns:
+        # Base creada con el esquema nuevo: no hay nada legado que migrar
+        conn.close()
+        return {"migrated": 0, "skipped": 0, "seconds": 0.0}
+    _build_legacy_hierarchy(conn)
+
+    row = conn.execute("SELECT last_id FROM migration_checkpoints "
+                       "WHERE name = 'features_normalized'").fetchone()
+    last_id = row["last_id"] if row else 0
+    total = conn.execute('SELECT COUNT(*) FROM features WHERE id > ?', (last_id,)).fetchone()[0]
+
+    done = migrated = 0
+    try:
+        while True:
+            bound = conn.execute('''
+                SELECT MAX(id), COUNT(*) FROM (
+                    SELECT id FROM features WHERE id > ? ORDER BY id LIMIT ?
+                )
+            ''', (last_id, chunk_size)).fetchone()
+            if not bound[1]:
+                break
+            upper, count = bound
+            migrated += conn.execute(f'''
+                INSERT OR IGNORE INTO features_new (name, repositorio, master, product_id)
+                SELECT f.name, f.repositorio, f.master, ({_LEGACY_PRODUCT_ID})
+                FROM features f
+                WHERE f.id > ? AND f.id <= ?
+                ORDER BY f.id
+            ''', (last_id, upper)).rowcount
+            conn.execute('''
+                INSERT INTO migration_checkpoints (name, last_id) VALUES ('features_normalized', ?)
+                ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id
+            ''', (upper,))
+            conn.commit()
+            last_id = upper
+            done += count
+            if progress:
+                progress(done, total, time.perf_counter() - start)
+    finally:
+        conn.close()
+    return {"migrated": migrated, "skipped": done - migrated,
+            "seconds": time.perf_counter() - start}
+
+# --- POOL DE CONEXIONES ---
+
+POOL_MAX_CONNECTIONS = 8
+POOL_WAIT_TIMEOUT = 10  # segundos esperando una conexión libre
+STATEMENT_CACHE_SIZE = 256
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16384",      # ~16 MB de page cache por conexión
+    "PRAGMA mmap_size = 268435456",    # 256 MB de I/O mapeada
+    "PRAGMA foreign_keys = ON",        # ON DELETE CASCADE de deployments
+)
+
+# Observadores de sentencias: observer(sql, segundos) por cada execute,
+# executemany o executescript de una conexión del pool (metrics.py los usa
+# para /metrics y el log de consultas lentas). El tiempo cubre la
+# preparación y el primer paso, que es donde SQLite ordena y agrega; las
+# filas que se leen después iterando el cursor no entran.
+_statement_observers = []
+
+def observe_statements(observer):
+    _statement_observers.append(observer)
+
+def _timed(method, sql, *args):
+    if not _statement_observers:
+        return method(sql, *args)
+    start = time.perf_counter()
+    try:
+        return method(sql, *args)
+    finally:
+        elapsed = time.perf_counter() - start
+        for observer in _statement_observers:
+            observer(sql, elapsed)
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        return _timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return _timed(super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return _timed(super().executescript, sql_script)
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Conexión que al cerrarse vuelve al pool. El código existente puede
+    seguir haciendo conn.close() sin saber que hay un pool detrás.
+    """
+    dedicated = False
+    pool = None
+
+    # sqlite3.Connection.execute no pasa por cursor(): se cronometran los dos
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return _timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return _timed(super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return _timed(super().executescript, sql_script)
+
+    def close(self):
+        # Las conexiones dedicadas las devuelve su context manager
+        if not self.dedicated:
+            self.pool.release(self)
+
+    def close_for_real(self):
+        super().close()
+
+class ConnectionPool:
+    """
+    Pool de conexiones SQLite con afinidad por hilo: mientras un hilo tiene
+    una conexión prestada, cada get_db_connection() le devuelve la misma.
+    Las conexiones libres se reutilizan en orden LIFO para mantener caliente
+    la caché de sentencias.
+    """
+    def __init__(self, max_connections=POOL_MAX_CONNECTIONS, timeout=POOL_WAIT_TIMEOUT, path=None):
+        self.path = path  # None = DB_NAME
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle = []
+        self._open = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._hits = 0
+        self._misses = 0
+        self._waits = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path or DB_NAME, factory=PooledConnection,
+                               check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        conn.pool = self
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _take(self):
+        """Saca una conexión libre (o abre una nueva) respetando el máximo."""
+        conn = None
+        with self._cond:
+            if not self._idle and self._open >= self.max_connections:
+                self._waits += 1
+                if not self._cond.wait_for(lambda: self._idle or self._open < self.max_connections,
+                                           timeout=self.timeout):
+                    raise sqlite3.OperationalError("connection pool exhausted")
+            if self._idle:
+                conn = self._idle.pop()
+                self._hits += 1
+            else:
+                self._open += 1
+                self._misses += 1
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def _give_back(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def acquire(self):
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is not None:
+            local.depth += 1
+            with self._cond:
+                self._hits += 1
+            return conn
+
+        conn = self._take()
+        local.conn = conn
+        # Dentro de un request la conexión queda fijada hasta end_scope()
+        local.depth = 2 if getattr(local, "scoped", False) else 1
+        return conn
+
+    @contextmanager
+    def dedicated(self):
+        """
+        Conexión exclusiva, no ligada al hilo: para generadores que siguen
+        leyendo después de que termina el request (respuestas en streaming).
+        """
+        conn = self._take()
+        conn.dedicated = True
+        try:
+            yield conn
+        finally:
+            conn.dedicated = False
+            self._give_back(conn)
+
+    def release(self, conn):
+        local = self._local
+        if getattr(local, "conn", None) is not conn:
+            return
+        local.depth -= 1
+        if local.depth > 0:
+            return
+        local.conn = None
+        self._give_back(conn)
+
+    def begin_scope(self):
+        self._local.scoped = True
+
+    def end_scope(self):
+        local = self._local
+        if not getattr(local, "scoped", False):
+            return
+        local.scoped = False
+        conn = getattr(local, "conn", None)
+        if conn is not None:
+            # Libera aunque algún camino de error no haya hecho close()
+            local.depth = 1
+            self.release(conn)
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            conn.close_for_real()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "waits": self._waits,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "max": self.max_connections
+            }
+
+_pool = ConnectionPool()
+
+# Base activa del hilo: la principal, o un shard mientras corre _on_shard()
+_active = threading.local()
+
+def _current():
+    return getattr(_active, "shard", None) or _main_shard
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return _current().pool.acquire()
 
-def add_or_get_feature(data):
-    conn = get_db_connection()
+def dedicated_connection():
+    return _current().pool.dedicated()
+
+def begin_connection_scope():
+    """Fija la conexión del hilo actual hasta end_connection_scope() (un request)."""
+    _pool.begin_scope()
+    _replica.pool.begin_scope()
+
+def end_connection_scope():
+    _pool.end_scope()
+    _replica.pool.end_scope()
+
+def get_pool_stats():
+    return _pool.stats()
+
+# --- ESCRITOR ÚNICO CON GROUP COMMIT ---
+#
+# Todas las escrituras de la app pasan por un solo hilo con su propia
+# conexión. Cada vuelta junta los trabajos que ya están en cola (hasta
+# WRITE_BATCH_MAX; WRITE_BATCH_WINDOW > 0 espera además por más) y los
+# confirma en una única transacción: un solo commit por lote y nunca dos
+# escritores peleando por el lock de SQLite. Con synchronous=NORMAL el
+# commit es barato, así que por defecto no se espera: esperar solo suma
+# latencia. Cada trabajo corre en su
+# SAVEPOINT, así el error de uno no tumba a los demás del lote.
+#
+# Las funciones de escritura se escriben como `_algo_tx(conn, ...)`: no
+# abren ni confirman transacciones y registran con _after_commit() lo que
+# deba pasar recién cuando el lote quedó confirmado (p.ej. publicar cambios).
+
+WRITE_QUEUE_MAX = 1000        # trabajos en espera antes de frenar a quien escribe
+WRITE_BATCH_MAX = 64          # trabajos por transacción
+WRITE_BATCH_WINDOW = 0.0      # segundos extra esperando más trabajos para el mismo commit
+WRITE_TIMEOUT = 30            # segundos esperando lugar en la cola o el resultado
+
+writer_log = logging.getLogger("deploy_mgmt.writer")
+
+class WriteQueue:
+    def __init__(self, pool):
+        self.pool = pool
+        self._queue = queue.Queue(maxsize=WRITE_QUEUE_MAX)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.connection = None
+        self._batches = 0
+        self._writes = 0
+        self._errors = 0
+        self._commit_seconds = 0.0
+        self._commit_max = 0.0
+        self._wait_seconds = 0.0
+        self._wait_max = 0.0
+        self._last_batch = 0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.connection = self.pool._connect()
+            self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, fn, *args):
+        """Encola fn(conn, *args); devuelve un Future con su resultado."""
+        self._start()
+        future = Future()
+        try:
+            self._queue.put((fn, args, future, time.perf_counter()), timeout=WRITE_TIMEOUT)
+        except queue.Full:
+            raise sqlite3.OperationalError("write queue full")
+        return future
+
+    def run(self, fn, *args):
+        # Desde el propio escritor (p.ej. un hook) no se puede esperar a la cola
+        if threading.current_thread() is self._thread:
+            return fn(self.connection, *args)
+        return self.submit(fn, *args).result(timeout=WRITE_TIMEOUT)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            stop = False
+            deadline = time.perf_counter() + WRITE_BATCH_WINDOW
+            while len(batch) < WRITE_BATCH_MAX:
+                try:
+                    job = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+            # El hilo escritor no puede morir: sin él toda escritura vence por timeout
+            try:
+                self._commit(batch)
+            except Exception as e:
+                writer_log.exception("write batch failed")
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            if stop:
+                break
+        self.connection.close_for_real()
+
+    def _commit(self, batch):
+        conn = self.connection
+        started = time.perf_counter()
+        outcomes = []
+        hooks = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for fn, args, future, _ in batch:
+                conn.after_commit = []
+                conn.execute('SAVEPOINT write_job')
+                try:
+                    result = fn(conn, *args)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_job')
+                    conn.execute('RELEASE write_job')
+                    outcomes.append((future, None, e))
+                else:
+                    conn.execute('RELEASE write_job')
+                    outcomes.append((future, result, None))
+                    hooks.extend(conn.after_commit)
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            outcomes = [(future, None, e) for _, _, future, _ in batch]
+            hooks = []
+        finally:
+            conn.after_commit = []
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._batches += 1
+            self._writes += len(batch)
+            self._errors += sum(1 for _, _, error in outcomes if error is not None)
+            self._commit_seconds += elapsed
+            self._commit_max = max(self._commit_max, elapsed)
+            for _, _, _, queued_at in batch:
+                waited = started - queued_at
+                self._wait_seconds += waited
+                self._wait_max = max(self._wait_max, waited)
+            self._last_batch = len(batch)
+
+        # El lote ya está confirmado: quien escribió recibe su resultado aunque
+        # después falle un hook, y un hook que falla no frena a los demás
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        for hook in hooks:
+            try:
+                hook()
+            except Exception:
+                writer_log.exception("after_commit hook failed")
+
+    def shutdown(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def stats(self):
+        with self._lock:
+            batches = self._batches or 1
+            writes = self._writes or 1
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "writes": self._writes,
+                "errors": self._errors,
+                "last_batch_size": self._last_batch,
+                "avg_batch_size": round(self._writes / batches, 2),
+                "avg_commit_ms": round(self._commit_seconds / batches * 1000, 3),
+                "max_commit_ms": round(self._commit_max * 1000, 3),
+                "avg_queue_wait_ms": round(self._wait_seconds / writes * 1000, 3),
+                "max_queue_wait_ms": round(self._wait_max * 1000, 3),
+            }
+
+_writer = WriteQueue(_pool)
+
+def run_write(fn, *args):
+    """Ejecuta fn(conn, *args) en el escritor y devuelve su resultado (o su excepción)."""
+    return _current().writer.run(fn, *args)
+
+def _after_commit(conn, hook):
+    conn.after_commit.append(hook)
+
+def get_writer_stats():
+    return _writer.stats()
+
+def get_writer_connection():
+    _writer._start()
+    return _writer.connection
+
+def shutdown_writer():
+    """Termina el hilo escritor (se vuelve a crear con la próxima escritura)."""
+    _writer.shutdown()
+
+# --- RÉPLICA DE SOLO LECTURA PARA REPORTES Y KPIs ---
+#
+# /reports, el export y los KPIs del dashboard leen de una copia de la base
+# hecha con la API de backup de SQLite, no del archivo donde escriben los
+# release managers: una lectura larga no retiene el WAL ni compite por la
+# page cache del escritor. Un hilo consulta cada REPLICA_POLL_INTERVAL la
+# versión de datos del primario y rehace la copia cuando hubo escrituras y
+# pasó REPLICA_REFRESH_INTERVAL, o antes si cambiaron REPLICA_REFRESH_ROWS
+# filas (una ráfaga). La copia se arma en un archivo temporal y se cambia
+# con os.replace: las conexiones abiertas siguen leyendo la copia anterior
+# hasta que vuelven al pool.
+#
+# La edad de la réplica es el tiempo desde el último momento en que se
+# sabe igual al primario. Si supera REPLICA_MAX_AGE (p.ej. el refresco
+# falla) las lecturas vuelven al primario; REPORT_REPLICA_MAX_AGE=0 apaga
+# la réplica.
+
+REPLICA_MAX_AGE = float(os.environ.get("REPORT_REPLICA_MAX_AGE", 30))  # segundos; 0 = sin réplica
+REPLICA_REFRESH_INTERVAL = 5    # segundos mínimos entre copias mientras haya escrituras
+REPLICA_REFRESH_ROWS = 1000     # filas cambiadas que adelantan la copia
+REPLICA_POLL_INTERVAL = 1       # segundos entre consultas de la versión del primario
+
+REPLICA_PRAGMAS = (
+    "PRAGMA cache_size = -16384",
+    "PRAGMA mmap_size = 268435456",
+)
+
+class ReplicaPool(ConnectionPool):
+    """
+    Pool de solo lectura sobre la copia vigente. La copia nunca se modifica
+    (se reemplaza entera), así que se abre con immutable=1: sin locks ni WAL.
+    Las conexiones de una copia anterior se cierran al devolverse.
+    """
+    def __init__(self, primary):
+        super().__init__()
+        self.primary = primary
+        self.generation = 0
+
+    @property
+    def replica_path(self):
+        return (self.primary.path or DB_NAME) + "-replica"
+
+    def _connect(self):
+        generation = self.generation
+        conn = sqlite3.connect(f"file:{quote(os.path.abspath(self.replica_path))}?immutable=1",
+                               uri=True, factory=PooledConnection,
+                               check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        conn.pool = self
+        conn.generation = generation
+        for pragma in REPLICA_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _give_back(self, conn):
+        with self._cond:
+            if conn.generation == self.generation:
+                self._idle.append(conn)
+                self._cond.notify()
+                return
+            self._open -= 1
+            self._cond.notify()
+        conn.close_for_real()
+
+    def swap(self):
+        """La copia en disco cambió: las conexiones siguientes la abren de nuevo."""
+        with self._cond:
+            self.generation += 1
+        self.close_all()
+
+class ReportReplica:
+    def __init__(self, primary):
+        self.primary = primary
+        self.pool = ReplicaPool(primary)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._reset()
+
+    def _reset(self):
+        self.version = None       # versión de "data" copiada; None = todavía no hay copia
+        self.synced_at = None     # monotonic del último momento en que coincidía con el primario
+        self.refreshed_at = None
+        self._refreshes = 0
+        self._refresh_seconds = 0.0
+        self._last_refresh = 0.0
+        self._fallbacks = 0
+        self._bytes = 0
+        self._error = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="report-replica", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        wait = 0
+        while not self._stop.wait(wait):
+            wait = REPLICA_POLL_INTERVAL
+            try:
+                self.refresh_if_needed()
+            except Exception as e:
+                with self._lock:
+                    self._error = f"{type(e).__name__}: {e}"
+
+    def refresh_if_needed(self):
+        checked = time.monotonic()
+        conn = self.primary.acquire()
+        try:
+            primary = get_data_version("data", conn)
+        finally:
+            conn.close()
+        with self._lock:
+            version, refreshed_at = self.version, self.refreshed_at
+            if version == primary:
+                self.synced_at = checked
+                return False
+        if (version is not None and primary - version < REPLICA_REFRESH_ROWS
+                and checked - refreshed_at < REPLICA_REFRESH_INTERVAL):
+            return False
+        self.refresh()
+        return True
+
+    def refresh(self):
+        """Copia el primario a la réplica (una sola transacción de lectura) y la publica."""
+        with self._refresh_lock:
+            self._refresh()
+
+    def _refresh(self):
+        started = time.perf_counter()
+        taken = time.monotonic()
+        path = self.pool.replica_path
+        tmp = path + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        with self.primary.dedicated() as source:
+            target = sqlite3.connect(tmp)
+            try:
+                source.backup(target)
+                # La copia se abre con immutable=1: sin WAL que leer al lado
+                target.execute('PRAGMA journal_mode = DELETE')
+                row = target.execute("SELECT version FROM cache_versions WHERE name = 'data'").fetchone()
+            finally:
+                target.close()
+        os.replace(tmp, path)
+        self.pool.swap()
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.version = row[0] if row else 0
+            self.synced_at = self.refreshed_at = taken
+            self._refreshes += 1
+            self._refresh_seconds += elapsed
+            self._last_refresh = elapsed
+            self._bytes = os.path.getsize(path)
+            self._error = None
+
+    def fresh(self):
+        """True si las lecturas pueden ir a la réplica; si no, cuenta un fallback."""
+        if REPLICA_MAX_AGE <= 0:
+            return False
+        self._start()
+        with self._lock:
+            if self.synced_at is not None and time.monotonic() - self.synced_at <= REPLICA_MAX_AGE:
+                return True
+            self._fallbacks += 1
+            return False
+
+    def shutdown(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+        self.pool.close_all()
+        with self._lock:
+            self._reset()
+
+    def stats(self):
+        with self._lock:
+            refreshes = self._refreshes or 1
+            return {
+                "enabled": REPLICA_MAX_AGE > 0,
+                "max_age_s": REPLICA_MAX_AGE,
+                "age_s": round(time.monotonic() - self.synced_at, 3) if self.synced_at is not None else None,
+                "version": self.version,
+                "refreshes": self._refreshes,
+                "last_refresh_ms": round(self._last_refresh * 1000, 3),
+                "avg_refresh_ms": round(self._refresh_seconds / refreshes * 1000, 3),
+                "bytes": self._bytes,
+                "fallbacks": self._fallbacks,
+                "error": self._error,
+                "pool": self.pool.stats(),
+            }
+
+_replica = ReportReplica(_pool)
+
+def _report_pool():
+    current = _current()
+    return current.replica.pool if current.replica.fresh() else current.pool
+
+def get_report_connection():
+    """Conexión de solo lectura para reportes y KPIs (réplica, o el primario si está vieja)."""
+    return _report_pool().acquire()
+
+def dedicated_report_connection():
+    return _report_pool().dedicated()
+
+def get_report_data_version():
+    """Versión de "data" que ven las lecturas de reportes (para cachear sus vistas)."""
+    if _fan_out_needed():
+        return sum(_fan_out(get_report_data_version))
+    conn = get_report_connection()
+    try:
+        return get_data_version("data", conn)
+    finally:
+        conn.close()
+
+def refresh_report_replica():
+    """Rehace la réplica ya mismo (sin esperar al hilo de refresco)."""
+    _replica.refresh()
+
+def get_replica_stats():
+    return _replica.stats()
+
+def shutdown_replica():
+    """Detiene el refresco y olvida la copia (p.ej. al cambiar DB_NAME)."""
+    _replica.shutdown()
+
+# --- SHARDS POR TENANT (opcional) ---
+#
+# Con tenant_shards cargada (splitShards.py) cada tenant vive en su propio
+# archivo SQLite, con su pool, su escritor y su réplica de reportes: las
+# escrituras y los scans de un tenant no frenan a los demás. La base
+# principal queda como catálogo (usuarios, jerarquía, mapa de shards) y
+# guarda los features sin tenant. Sin filas en tenant_shards todo sigue en
+# un solo archivo y nada de esto interviene.
+#
+# Los ids de features y deployments de un shard arrancan en
+# tenant_id << SHARD_ID_BITS: el id dice en qué archivo está. Las llamadas
+# de un feature (update_full_deployment, historial, ...) van directo a su
+# shard y las altas por product_id al shard de su tenant. Las vistas de
+# todos los tenants (reportes, KPIs, matriz, get_all_features) corren la
+# misma función en cada shard en paralelo (_fan_out) y mezclan los
+# resultados, ya ordenados, con heapq.merge. (name, repositorio) es único
+# dentro de cada shard; la jerarquía se copia a todos para los JOIN.
+
+SHARD_ID_BITS = 32
+SHARD_WORKERS = 8
+
+class Shard:
+    def __init__(self, key, pool, writer, replica):
+        self.key = key  # tenant_id; 0 = la base principal
+        self.pool = pool
+        self.writer = writer
+        self.replica = replica
+
+    @classmethod
+    def open(cls, key, path):
+        pool = ConnectionPool(path=path)
+        return cls(key, pool, WriteQueue(pool), ReportReplica(pool))
+
+    def close(self):
+        self.writer.shutdown()
+        self.replica.shutdown()
+        self.pool.close_all()
+
+    def stats(self):
+        return {"path": self.pool.path or DB_NAME, "pool": self.pool.stats(),
+                "writer": self.writer.stats(), "replica": self.replica.stats()}
+
+_main_shard = Shard(0, _pool, _writer, _replica)
+_shards_lock = threading.Lock()
+_shards = None            # [base principal, shard de cada tenant...]; None = sin leer
+_shards_by_tenant = {}
+_product_tenants = (None, {})  # (versión de la jerarquía, product_id -> tenant_id)
+_fan_out_executor = None
+
+def _load_shards():
+    global _shards, _shards_by_tenant
+    shards = _shards
+    if shards is not None:
+        return shards
+    with _shards_lock:
+        if _shards is None:
+            conn = _pool.acquire()
+            try:
+                rows = conn.execute('SELECT tenant_id, path FROM tenant_shards ORDER BY tenant_id').fetchall()
+            finally:
+                conn.close()
+            # Las rutas del mapa son relativas a la base principal
+            base = os.path.dirname(os.path.abspath(DB_NAME))
+            _shards_by_tenant = {row["tenant_id"]: Shard.open(row["tenant_id"], os.path.join(base, row["path"]))
+                                 for row in rows}
+            _shards = [_main_shard, *_shards_by_tenant.values()]
+        return _shards
+
+def _fan_out_needed():
+    """True si hay shards y el hilo no está ya trabajando dentro de uno."""
+    return getattr(_active, "shard", None) is None and len(_load_shards()) > 1
+
+@contextmanager
+def _on_shard(shard):
+    previous = getattr(_active, "shard", None)
+    _active.shard = shard
+    try:
+        yield shard
+    finally:
+        _active.shard = previous
+
+def _shard_for_feature(feature_id):
+    """Shard de un feature (o deployment) por su id."""
+    if len(_load_shards()) == 1:
+        return _main_shard
+    return _shards_by_tenant.get((_as_int(feature_id) or 0) >> SHARD_ID_BITS, _main_shard)
+
+def _shard_for_product(product_id):
+    """Shard donde se dan de alta los features de un producto (el de su tenant)."""
+    global _product_tenants
+    if len(_load_shards()) == 1:
+        return _main_shard
+    hierarchy = get_hierarchy()
+    version, tenants = _product_tenants
+    if version != hierarchy["version"]:
+        tenants = {product["id"]: tenant_id
+                   for tenant_id, solutions in hierarchy["solutions"].items()
+                   for solution in solutions
+                   for product in solution["products"]}
+        _product_tenants = (hierarchy["version"], tenants)
+    return _shards_by_tenant.get(tenants.get(_as_int(product_id)), _main_shard)
+
+def _fan_out(fn, *args):
+    """fn(*args) en cada shard (la base principal incluida), en paralelo; resultados en orden de shard."""
+    global _fan_out_executor
+    if _fan_out_executor is None:
+        with _shards_lock:
+            if _fan_out_executor is None:
+                _fan_out_executor = ThreadPoolExecutor(max_workers=SHARD_WORKERS,
+                                                       thread_name_prefix="shard")
+
+    def run(shard):
+        with _on_shard(shard):
+            return fn(*args)
+    return list(_fan_out_executor.map(run, _load_shards()))
+
+def get_shard_stats():
+    return {shard.key: shard.stats() for shard in _load_shards()[1:]}
+
+def close_shards():
+    """Cierra los shards abiertos y olvida el mapa (se vuelve a leer al usarlo)."""
+    global _shards, _shards_by_tenant
+    with _shards_lock:
+        shards = _shards or []
+        _shards, _shards_by_tenant = None, {}
+    for shard in shards[1:]:
+        shard.close()
+
+def _copy_into_shard(path, source, key, where, params):
+    """Copia a `path` (ya creada con create_db) lo que le toca de `source`."""
+    base = key << SHARD_ID_BITS
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('ATTACH DATABASE ? AS src', (source,))
+        # El historial se copia tal cual: con los triggers de alta cada
+        # deployment copiado sumaría un evento 'insert' (o 'archive') de más
+        conn.execute('DROP TRIGGER deployments_events_ai')
+        conn.execute('DROP TRIGGER deployments_archive_events_ai')
+        conn.execute('INSERT INTO tenants (id, name) SELECT id, name FROM src.tenants')
+        conn.execute('INSERT INTO solutions (id, tenant_id, name) SELECT id, tenant_id, name FROM src.solutions')
+        conn.execute('INSERT INTO products (id, solution_id, name) SELECT id, solution_id, name FROM src.products')
+        conn.execute('INSERT INTO kpi_envs (ambiente, bit) SELECT ambiente, bit FROM src.kpi_envs')
+        if key == 0:
+            conn.execute('INSERT INTO users (id, username, password, role) '
+                         'SELECT id, username, password, role FROM src.users')
+        features = conn.execute(f'''
+            INSERT INTO features (id, name, repositorio, type, application, tenancy, master, product_id)
+            SELECT f.id + ?, f.name, f.repositorio, f.type, f.application, f.tenancy, f.master, f.product_id
+            FROM src.features f WHERE {where}
+        ''', (base, *params)).rowcount
+        conn.execute(f'''
+            INSERT INTO deployments (id, feature_id, ambiente, estado, fecha, release_manager)
+            SELECT d.id + ?, d.feature_id + ?, d.ambiente, d.estado, d.fecha, d.release_manager
+            FROM src.deployments d JOIN src.features f ON f.id = d.feature_id
+            WHERE {where}
+        ''', (base, base, *params))
+        conn.execute(f'''
+            INSERT INTO deployments_archive (id, feature_id, ambiente, estado, fecha, release_manager,
+                                             archived_at)
+            SELECT d.id + ?, d.feature_id + ?, d.ambiente, d.estado, d.fecha, d.release_manager,
+                   d.archived_at
+            FROM src.deployments_archive d JOIN src.features f ON f.id = d.feature_id
+            WHERE {where}
+        ''', (base, base, *params))
+        # Los eventos de features ya borrados (sin fila en features) quedan en la principal
+        conn.execute(f'''
+            INSERT INTO deployment_events (id, {_EVENT_COLUMNS}, recorded_at)
+            SELECT e.id, e.deployment_id + ?, e.feature_id + ?, e.ambiente, e.estado, e.fecha,
+                   e.release_manager, e.kind, e.recorded_at
+            FROM src.deployment_events e LEFT JOIN src.features f ON f.id = e.feature_id
+            WHERE {where}
+            ORDER BY e.id
+        ''', (base, base, *params))
+        # Las altas siguientes siguen numerando dentro del rango del tenant
+        for table in ("features", "deployments"):
+            # sqlite_sequence no tiene UNIQUE(name): INSERT OR IGNORE duplicaría la fila
+            if not conn.execute('UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?',
+                                (base, table)).rowcount:
+                conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, base))
+        # Los ids archivados tampoco se reusan
+        conn.execute("""UPDATE sqlite_sequence SET seq = max(seq, (SELECT IFNULL(MAX(id), 0)
+                        FROM deployments_archive)) WHERE name = 'deployments'""")
+        conn.commit()
+        conn.execute('DETACH DATABASE src')
+        _create_deployment_events(conn)
+        _create_deployments_archive(conn)
+        conn.execute('ANALYZE')
+        conn.commit()
+        return features
+    finally:
+        conn.close()
+
+def split_into_shards(out_dir, progress=None):
+    """
+    Parte la base actual (DB_NAME, que no se modifica) en `out_dir`: una
+    base principal con el mismo nombre de archivo (usuarios, jerarquía,
+    features sin tenant y el mapa tenant_shards) y un tenant-<id>.db por
+    tenant. progress(tenant_id, features) se llama al terminar cada
+    archivo (0 = la principal). Devuelve {tenant_id: features copiados}.
+    """
+    create_db()
+    source = os.path.abspath(DB_NAME)
+    conn = sqlite3.connect(source)
+    try:
+        if conn.execute('SELECT 1 FROM tenant_shards LIMIT 1').fetchone():
+            raise ValueError(f"{DB_NAME} ya es la base principal de una instalación con shards")
+        tenants = [row[0] for row in conn.execute('SELECT id FROM tenants ORDER BY id')]
+    finally:
+        conn.close()
+
+    os.makedirs(out_dir, exist_ok=True)
+    main_path = os.path.join(out_dir, os.path.basename(DB_NAME))
+    if os.path.abspath(main_path) == source:
+        raise ValueError("out_dir no puede ser el directorio de la base actual")
+    attached = ('SELECT p.id FROM src.products p JOIN src.solutions s ON s.id = p.solution_id '
+                'JOIN src.tenants t ON t.id = s.tenant_id')
+    targets = [(0, main_path, f"(f.product_id IS NULL OR f.product_id NOT IN ({attached}))", ())]
+    targets += [(tenant, os.path.join(out_dir, f"tenant-{tenant}.db"),
+                 f"f.product_id IN ({attached} WHERE t.id = ?)", (tenant,))
+                for tenant in tenants]
+
+    counts = {}
+    for key, path, where, params in targets:
+        for suffix in ("", "-wal", "-shm", "-replica"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        create_db(path)
+        counts[key] = _copy_into_shard(path, source, key, where, params)
+        if progress:
+            progress(key, counts[key])
+
+    conn = sqlite3.connect(main_path)
+    conn.executemany('INSERT INTO tenant_shards (tenant_id, path) VALUES (?, ?)',
+                     [(tenant, f"tenant-{tenant}.db") for tenant in tenants])
+    conn.commit()
+    conn.close()
+    return counts
+
+def _add_or_get_feature_tx(conn, data):
     cursor = conn.cursor()
     cursor.execute('SELECT id FROM features WHERE name = ? AND repositorio = ?', (data["name"], data["repositorio"]))
     row = cursor.fetchone()
     if row:
-        feature_id = row["id"]
-    else:
-        cursor.execute('''
-            INSERT INTO features (name, repositorio, product_id, master)
-            VALUES (?, ?, ?, ?)
-        ''', (data["name"], data["repositorio"], data["product_id"], data["master"]))
-        feature_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return feature_id
+        return row["id"]
+    cursor.execute('''
+        INSERT INTO features (name, repositorio, product_id, master)
+        VALUES (?, ?, ?, ?)
+    ''', (data["name"], data["repositorio"], data["product_id"], data["master"]))
+    _publish_after_commit(conn, _created_feature_changes(conn, [cursor.lastrowid]))
+    return cursor.lastrowid
+
+def add_or_get_feature(data):
+    return _shard_for_product(data["product_id"]).writer.run(_add_or_get_feature_tx, data)
+
+# Upsert y no INSERT OR REPLACE: REPLACE borra la fila sin disparar los
+# triggers de DELETE, y los resúmenes de KPIs quedarían desfasados.
+UPSERT_DEPLOYMENT_SQL = '''
+    INSERT INTO deployments (feature_id, ambiente, estado, fecha, release_manager)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(feature_id, ambiente) DO UPDATE SET
+        estado = excluded.estado,
+        fecha = excluded.fecha,
+        release_manager = excluded.release_manager
+'''
+
+# --- NOTIFICACIONES DE ESCRITURA ---
+#
+# Listeners síncronos que reciben, después de cada commit, la lista de
+# cambios en la matriz: {"feature", "feature_id", "ambiente", "estado",
+# "fecha", "release_manager"} por celda escrita, {"feature", "feature_id",
+# "ambiente", "deleted"} por celda borrada, {"feature", "deleted"} por
+# feature borrado y {"feature", "feature_id", "created", "record"} por
+# feature dado de alta, con `record` = su fila de get_matrix_features().
+# app.py los publica por SSE (/events) y con ellos mantiene la matriz en
+# memoria (matrix.py). Los listeners corren en el hilo escritor: todo lo que
+# necesitan viaja en los cambios, armado dentro de la transacción.
+
+_write_listeners = []
+
+def subscribe_writes(listener):
+    _write_listeners.append(listener)
+
+def _publish_changes(changes):
+    if not changes:
+        return
+    for listener in _write_listeners:
+        try:
+            listener(changes)
+        except Exception:
+            writer_log.exception("write listener %r failed", listener)
+
+def _publish_after_commit(conn, changes):
+    if changes:
+        _after_commit(conn, lambda: _publish_changes(changes))
+
+def _created_feature_changes(conn, feature_ids):
+    """Altas de los features indicados, con su fila de la matriz."""
+    if not _write_listeners or not feature_ids:
+        return []
+    rows = conn.execute(f'{_MATRIX_FEATURES_SQL} WHERE f.id IN (SELECT value FROM json_each(?))',
+                        (json.dumps(list(feature_ids)),)).fetchall()
+    return [{"feature": row["name"], "feature_id": row["id"], "created": True, "record": dict(row)}
+            for row in rows]
+
+def _deployment_changes(conn, keys):
+    """Estado actual de las celdas (feature_id, ambiente) indicadas."""
+    if not _write_listeners or not keys:
+        return []
+    rows = conn.execute('''
+        SELECT f.name AS feature, d.feature_id, d.ambiente, d.estado, d.fecha, d.release_manager
+        FROM json_each(?) j
+        CROSS JOIN deployments d ON d.feature_id = json_extract(j.value, '$[0]')
+                                AND d.ambiente = json_extract(j.value, '$[1]')
+        JOIN features f ON f.id = d.feature_id
+    ''', (json.dumps(list(keys)),)).fetchall()
+    return [dict(row) for row in rows]
+
+def _save_deployment_tx(conn, feature_id, deployment_data):
+    conn.execute(UPSERT_DEPLOYMENT_SQL, (feature_id, deployment_data["ambiente"], deployment_data["estado"], deployment_data["fecha"], deployment_data["release_manager"]))
+    _publish_after_commit(conn, _deployment_changes(conn, [(feature_id, deployment_data["ambiente"])]))
 
 def save_deployment(feature_id, deployment_data):
+    _shard_for_feature(feature_id).writer.run(_save_deployment_tx, feature_id, deployment_data)
+
+# --- JERARQUÍA TENANT > SOLUTION > PRODUCT (cacheada en memoria) ---
+#
+# cache_versions guarda un contador por conjunto de datos; los triggers lo
+# incrementan en cada escritura. Los caches en memoria comparan su versión
+# con la de la base (una búsqueda por clave) y se reconstruyen al cambiar,
+# así también se enteran de lo que escriben otros procesos.
+
+def _create_cache_versions(conn):
+    # Migración 5 tal como se publicó: solo el contador "hierarchy"
+    statements = ['''
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID;
+    ''']
+    for name, tables in {"hierarchy": ("tenants", "solutions", "products")}.items():
+        statements.append(f"INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('{name}', 1);")
+        for table in tables:
+            for event, suffix in (("INSERT", "ai"), ("UPDATE", "au"), ("DELETE", "ad")):
+                statements.append(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_version_{suffix} AFTER {event} ON {table} BEGIN
+                        UPDATE cache_versions SET version = version + 1 WHERE name = '{name}';
+                    END;
+                ''')
+    conn.executescript("\n".join(statements))
+
+def _add_data_cache_version(conn):
+    """
+    Migración 7: contador "data" (todo lo que muestran el dashboard y
+    /reports, para el cache de respuestas). Cada tabla queda con un solo
+    trigger por operación que incrementa todos sus contadores, así que se
+    rehacen los de la migración 5.
+    """
+    versioned_tables = {
+        "hierarchy": ("tenants", "solutions", "products"),
+        "data": ("deployments", "features", "tenants", "solutions", "products"),
+    }
+    statements = []
+    counters_by_table = {}
+    for name, tables in versioned_tables.items():
+        statements.append(f"INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('{name}', 1);")
+        for table in tables:
+            counters_by_table.setdefault(table, []).append(f"'{name}'")
+    for table, counters in counters_by_table.items():
+        for event, suffix in (("INSERT", "ai"), ("UPDATE", "au"), ("DELETE", "ad")):
+            statements.append(f'''
+                DROP TRIGGER IF EXISTS {table}_version_{suffix};
+                CREATE TRIGGER {table}_version_{suffix} AFTER {event} ON {table} BEGIN
+                    UPDATE cache_versions SET version = version + 1 WHERE name IN ({", ".join(counters)});
+                END;
+            ''')
+    conn.executescript("\n".join(statements))
+
+def get_data_version(name, conn=None):
+    """Versión actual de un conjunto de datos de cache_versions."""
+    if conn is None and name == "data" and _fan_out_needed():
+        # Suma de los contadores de cada shard: crece con cualquier escritura
+        return sum(_fan_out(get_data_version, name))
+    own = conn is None
+    if own:
+        conn = get_db_connection()
+    row = conn.execute('SELECT version FROM cache_versions WHERE name = ?', (name,)).fetchone()
+    if own:
+        conn.close()
+    return row["version"] if row else 0
+
+_hierarchy_lock = threading.Lock()
+_hierarchy = None
+
+def _load_hierarchy(conn):
+    tenants = [{"id": r["id"], "name": r["name"], "solutions": []}
+               for r in conn.execute('SELECT id, name FROM tenants ORDER BY name')]
+    solutions_by_tenant = {t["id"]: t["solutions"] for t in tenants}
+    products_by_solution = {}
+    for r in conn.execute('SELECT id, tenant_id, name FROM solutions ORDER BY tenant_id, name'):
+        solution = {"id": r["id"], "name": r["name"], "products": []}
+        solutions_by_tenant.setdefault(r["tenant_id"], []).append(solution)
+        products_by_solution[r["id"]] = solution["products"]
+    for r in conn.execute('SELECT id, solution_id, name FROM products ORDER BY solution_id, name'):
+        products_by_solution.setdefault(r["solution_id"], []).append({"id": r["id"], "name": r["name"]})
+    return tenants, solutions_by_tenant, products_by_solution
+
+def get_hierarchy():
+    """
+    Árbol completo tenant > solution > product, cacheado por versión.
+    Devuelve un dict con version, tree (lista de tenants con sus solutions
+    y products) y los índices solutions[tenant_id] / products[solution_id].
+    No hay que modificar lo que devuelve: es compartido entre requests.
+    """
+    global _hierarchy
+    # Con shards la jerarquía se lee siempre de la base principal
+    conn = _pool.acquire()
+    try:
+        version = get_data_version("hierarchy", conn)
+        cached = _hierarchy
+        if cached is not None and cached["version"] == version:
+            return cached
+        with _hierarchy_lock:
+            # Otro hilo pudo haberlo recargado mientras esperábamos
+            if _hierarchy is None or _hierarchy["version"] != version:
+                tree, solutions, products = _load_hierarchy(conn)
+                _hierarchy = {"version": version, "tree": tree,
+                              "solutions": solutions, "products": products}
+            return _hierarchy
+    finally:
+        conn.close()
+
+# --- BÚSQUEDA FULL-TEXT (FTS5) ---
+#
+# features_fts guarda una fila por feature (rowid = features.id) con su
+# jerarquía desnormalizada. Los triggers la mantienen al día cuando cambian
+# features, products, solutions o tenants.
+
+_FTS_ROWS_SELECT = '''
+    SELECT f.id, f.name, f.repositorio, p.name, s.name, t.name, f.master
+    FROM features f
+    LEFT JOIN products p ON f.product_id = p.id
+    LEFT JOIN solutions s ON p.solution_id = s.id
+    LEFT JOIN tenants t ON s.tenant_id = t.id
+'''
+
+_FTS_INSERT = 'INSERT INTO features_fts (rowid, name, repositorio, type, application, tenancy, master)'
+
+def _create_features_fts(conn):
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS features_fts USING fts5(
+            name, repositorio, type, application, tenancy, master,
+            tokenize = "unicode61 remove_diacritics 2",
+            prefix = '2 3'
+        )
+    ''')
+    conn.executescript(f'''
+        CREATE TRIGGER IF NOT EXISTS features_fts_ai AFTER INSERT ON features BEGIN
+            {_FTS_INSERT} {_FTS_ROWS_SELECT} WHERE f.id = new.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS features_fts_ad AFTER DELETE ON features BEGIN
+            DELETE FROM features_fts WHERE rowid = old.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS features_fts_au AFTER UPDATE ON features BEGIN
+            DELETE FROM features_fts WHERE rowid = old.id;
+            {_FTS_INSERT} {_FTS_ROWS_SELECT} WHERE f.id = new.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, solution_id ON products BEGIN
+            DELETE FROM features_fts WHERE rowid IN (SELECT id FROM features WHERE product_id = new.id);
+            {_FTS_INSERT} {_FTS_ROWS_SELECT} WHERE f.product_id = new.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS solutions_fts_au AFTER UPDATE OF name, tenant_id ON solutions BEGIN
+            DELETE FROM features_fts WHERE rowid IN (
+                SELECT f.id FROM features f JOIN products p ON f.product_id = p.id
+                WHERE p.solution_id = new.id);
+            {_FTS_INSERT} {_FTS_ROWS_SELECT} WHERE p.solution_id = new.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS tenants_fts_au AFTER UPDATE OF name ON tenants BEGIN
+            DELETE FROM features_fts WHERE rowid IN (
+                SELECT f.id FROM features f
+                JOIN products p ON f.product_id = p.id
+                JOIN solutions s ON p.solution_id = s.id
+                WHERE s.tenant_id = new.id);
+            {_FTS_INSERT} {_FTS_ROWS_SELECT} WHERE s.tenant_id = new.id;
+        END;
+    ''')
+    rebuild_features_fts(conn)
+
+def rebuild_features_fts(conn):
+    conn.execute('DELETE FROM features_fts')
+    conn.execute(f'{_FTS_INSERT} {_FTS_ROWS_SELECT}')
+    conn.commit()
+
+def fts_query(filtro):
+    """
+    Convierte el texto del buscador en una consulta FTS5 de prefijos:
+    'sdd-1 uru' -> '"sdd"* "1"* "uru"*' (todas las palabras, como prefijo).
+    Devuelve None si no queda ninguna palabra.
+    """
+    tokens = re.findall(r'\w+', filtro or '')
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+def search_features(filtro, limit=None):
+    """Features que coinciden con `filtro`, ordenados por relevancia (bm25)."""
+    query = fts_query(filtro)
+    if query is None:
+        return []
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO deployments (feature_id, ambiente, estado, fecha, release_manager)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (feature_id, deployment_data["ambiente"], deployment_data["estado"], deployment_data["fecha"], deployment_data["release_manager"]))
+    rows = conn.execute('''
+        SELECT rowid AS feature_id, name, repositorio, type, application, tenancy, master
+        FROM features_fts
+        WHERE features_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    ''', (query, -1 if limit is None else limit)).fetchall()
+    conn.close()
+    return rows
+
+def _matching_estados(conn, filtro):
+    """
+    Estados cuyo texto contiene `filtro`. Los valores distintos se leen
+    saltando por el índice de estado (una búsqueda por valor, no un recorrido).
+    """
+    rows = conn.execute('''
+        WITH RECURSIVE estados(estado) AS (
+            SELECT MIN(estado) FROM deployments
+            UNION ALL
+            SELECT (SELECT MIN(estado) FROM deployments WHERE estado > estados.estado)
+            FROM estados WHERE estados.estado IS NOT NULL
+        )
+        SELECT estado FROM estados WHERE estado IS NOT NULL
+    ''').fetchall()
+    needle = filtro.lower()
+    return [row["estado"] for row in rows if needle in row["estado"].lower()]
+
+def build_search_filter(conn, filtro, feature_column="f.id", estado_column="d.estado"):
+    """
+    WHERE parametrizado para el buscador de texto: coincidencia FTS sobre el
+    feature o estado que contiene el texto. Devuelve (sql, params).
+    """
+    query = fts_query(filtro)
+    clauses = []
+    params = []
+    if query is not None:
+        clauses.append(f"{feature_column} IN (SELECT rowid FROM features_fts WHERE features_fts MATCH ?)")
+        params.append(query)
+    estados = _matching_estados(conn, filtro)
+    if estados:
+        clauses.append(f"{estado_column} IN ({', '.join('?' * len(estados))})")
+        params += estados
+    if not clauses:
+        return "0", []
+    return "(" + " OR ".join(clauses) + ")", params
+
+# --- RESÚMENES DE KPIs MANTENIDOS POR TRIGGERS ---
+#
+# Solo cuentan los despliegues con ambiente (igual que calculate_kpis):
+#   kpi_counts      totales por 'total', 'estado', 'ambiente' y 'release_manager'
+#   kpi_daily       despliegues por fecha (min/max para el promedio diario)
+#   kpi_buckets     (ambiente, estado, release_manager, fecha) -> n, para KPIs filtrados
+#   kpi_valid_envs  por nombre de feature, máscara de bits de ambientes en Valid
+#   kpi_envs        ambiente normalizado -> bit (los ambiente_options de la app)
+
+def _kpi_delta_sql(row, sign):
+    has_env = f"trim(coalesce({row}.ambiente, '')) <> ''"
+    upsert_count = "ON CONFLICT(dimension, value) DO UPDATE SET n = n + excluded.n"
+    return f'''
+        INSERT INTO kpi_counts (dimension, value, n)
+        SELECT 'total', '', {sign} WHERE {has_env} {upsert_count};
+        INSERT INTO kpi_counts (dimension, value, n)
+        SELECT 'estado', coalesce({row}.estado, ''), {sign} WHERE {has_env} {upsert_count};
+        INSERT INTO kpi_counts (dimension, value, n)
+        SELECT 'ambiente', upper(trim({row}.ambiente)), {sign} WHERE {has_env} {upsert_count};
+        INSERT INTO kpi_counts (dimension, value, n)
+        SELECT 'release_manager', {row}.release_manager, {sign}
+        WHERE {has_env} AND coalesce({row}.release_manager, '') <> '' {upsert_count};
+        INSERT INTO kpi_daily (fecha, n)
+        SELECT {row}.fecha, {sign} WHERE {has_env} AND coalesce({row}.fecha, '') <> ''
+        ON CONFLICT(fecha) DO UPDATE SET n = n + excluded.n;
+        INSERT INTO kpi_buckets (ambiente, estado, release_manager, fecha, n)
+        SELECT {row}.ambiente, coalesce({row}.estado, ''), coalesce({row}.release_manager, ''),
+               coalesce({row}.fecha, ''), {sign}
+        WHERE {has_env}
+        ON CONFLICT(ambiente, estado, release_manager, fecha) DO UPDATE SET n = n + excluded.n;
+    '''
+
+_KPI_PRUNE_SQL = '''
+        DELETE FROM kpi_counts WHERE n <= 0;
+        DELETE FROM kpi_daily WHERE fecha = old.fecha AND n <= 0;
+        DELETE FROM kpi_buckets
+        WHERE ambiente = old.ambiente AND estado = coalesce(old.estado, '')
+          AND release_manager = coalesce(old.release_manager, '')
+          AND fecha = coalesce(old.fecha, '') AND n <= 0;
+'''
+
+def _kpi_mask_sql(name_expr, condition):
+    # sum(DISTINCT bit) hace de OR de bits: cada ambiente tiene un bit distinto.
+    # CROSS JOIN y +d.estado fijan el plan: por nombre -> feature -> sus
+    # despliegues, nunca recorrer todos los Valid desde el índice de estado.
+    return f'''
+        INSERT INTO kpi_valid_envs (name, mask)
+        SELECT {name_expr}, (
+            SELECT coalesce(sum(DISTINCT e.bit), 0)
+            FROM features f2
+            CROSS JOIN deployments d ON d.feature_id = f2.id
+            JOIN kpi_envs e ON e.ambiente = upper(trim(d.ambiente))
+            WHERE f2.name = {name_expr} AND +d.estado = 'Valid'
+        )
+        WHERE {name_expr} IS NOT NULL AND ({condition})
+        ON CONFLICT(name) DO UPDATE SET mask = excluded.mask;
+    '''
+
+def _create_kpi_summary(conn):
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS kpi_counts (
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            PRIMARY KEY (dimension, value)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS kpi_daily (
+            fecha TEXT PRIMARY KEY,
+            n INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS kpi_buckets (
+            ambiente TEXT NOT NULL,
+            estado TEXT NOT NULL,
+            release_manager TEXT NOT NULL,
+            fecha TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            PRIMARY KEY (ambiente, estado, release_manager, fecha)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_kpi_buckets_estado ON kpi_buckets(estado);
+        CREATE TABLE IF NOT EXISTS kpi_envs (
+            ambiente TEXT PRIMARY KEY,
+            bit INTEGER NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS kpi_valid_envs (
+            name TEXT PRIMARY KEY,
+            mask INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_kpi_valid_envs_mask ON kpi_valid_envs(mask);
+    ''')
+    _create_kpi_triggers(conn)
+    rebuild_kpi_summary(conn)
+
+def _create_kpi_triggers(conn):
+    conn.executescript(f'''
+        CREATE TRIGGER IF NOT EXISTS deployments_kpi_ai AFTER INSERT ON deployments BEGIN
+            {_kpi_delta_sql("new", 1)}
+            {_kpi_mask_sql("(SELECT name FROM features WHERE id = new.feature_id)",
+                           "new.estado = 'Valid'")}
+        END;
+        CREATE TRIGGER IF NOT EXISTS deployments_kpi_ad AFTER DELETE ON deployments BEGIN
+            {_kpi_delta_sql("old", -1)}
+            {_KPI_PRUNE_SQL}
+            {_kpi_mask_sql("(SELECT name FROM features WHERE id = old.feature_id)",
+                           "old.estado = 'Valid'")}
+        END;
+        CREATE TRIGGER IF NOT EXISTS deployments_kpi_au AFTER UPDATE ON deployments BEGIN
+            {_kpi_delta_sql("old", -1)}
+            {_kpi_delta_sql("new", 1)}
+            {_KPI_PRUNE_SQL}
+            {_kpi_mask_sql("(SELECT name FROM features WHERE id = old.feature_id)",
+                           "old.estado = 'Valid' OR new.estado = 'Valid'")}
+            {_kpi_mask_sql("(SELECT name FROM features WHERE id = new.feature_id)",
+                           "(old.estado = 'Valid' OR new.estado = 'Valid') AND new.feature_id <> old.feature_id")}
+        END;
+        CREATE TRIGGER IF NOT EXISTS features_kpi_ad AFTER DELETE ON features BEGIN
+            {_kpi_mask_sql("old.name", "1")}
+        END;
+    ''')
+
+def rebuild_kpi_summary(conn):
+    """Recalcula todos los resúmenes desde deployments (backfill y reparación)."""
+    has_env = "trim(coalesce(ambiente, '')) <> ''"
+    conn.executescript(f'''
+        DELETE FROM kpi_counts;
+        DELETE FROM kpi_daily;
+        DELETE FROM kpi_buckets;
+        DELETE FROM kpi_valid_envs;
+
+        INSERT INTO kpi_counts (dimension, value, n)
+        SELECT 'total', '', COUNT(*) FROM deployments WHERE {has_env} HAVING COUNT(*) > 0;
+        INSERT INTO kpi_counts (dimension, value, n)
+        SELECT 'estado', coalesce(estado, ''), COUNT(*) FROM deployments
+        WHERE {has_env} GROUP BY coalesce(estado, '');
+        INSERT INTO kpi_counts (dimension, value, n)
+        SELECT 'ambiente', upper(trim(ambiente)), COUNT(*) FROM deployments
+        WHERE {has_env} GROUP BY upper(trim(ambiente));
+        INSERT INTO kpi_counts (dimension, value, n)
+        SELECT 'release_manager', release_manager, COUNT(*) FROM deployments
+        WHERE {has_env} AND coalesce(release_manager, '') <> '' GROUP BY release_manager;
+        INSERT INTO kpi_daily (fecha, n)
+        SELECT fecha, COUNT(*) FROM deployments
+        WHERE {has_env} AND coalesce(fecha, '') <> '' GROUP BY fecha;
+        INSERT INTO kpi_buckets (ambiente, estado, release_manager, fecha, n)
+        SELECT ambiente, coalesce(estado, ''), coalesce(release_manager, ''), coalesce(fecha, ''), COUNT(*)
+        FROM deployments WHERE {has_env}
+        GROUP BY 1, 2, 3, 4;
+
+        INSERT INTO kpi_valid_envs (name, mask)
+        SELECT f.name, sum(DISTINCT e.bit)
+        FROM features f
+        JOIN deployments d ON d.feature_id = f.id
+        JOIN kpi_envs e ON e.ambiente = upper(trim(d.ambiente))
+        WHERE d.estado = 'Valid'
+        GROUP BY f.name;
+    ''')
     conn.commit()
+
+def set_kpi_environments(ambiente_options):
+    """
+    Registra los ambientes requeridos para "fully deployed" (uno por bit).
+    Si cambian respecto de lo guardado, recalcula los resúmenes.
+    """
+    if _fan_out_needed():
+        _fan_out(set_kpi_environments, ambiente_options)
+        return
+    envs = list(dict.fromkeys(a.strip().upper() for a in ambiente_options))
+    conn = get_db_connection()
+    current = [row["ambiente"] for row in conn.execute('SELECT ambiente FROM kpi_envs ORDER BY bit')]
+    if current != envs:
+        conn.execute('DELETE FROM kpi_envs')
+        conn.executemany('INSERT INTO kpi_envs (ambiente, bit) VALUES (?, ?)',
+                         [(env, 1 << i) for i, env in enumerate(envs)])
+        rebuild_kpi_summary(conn)
     conn.close()
 
+def get_kpi_summary(filter_estado="", filter_ambiente=""):
+    """
+    KPIs del dashboard leídos de los resúmenes. Sin filtros son lecturas
+    puntuales; con filtro de estado/ambiente solo se recorren los buckets
+    que coinciden. Devuelve el mismo dict que utils.calculate_kpis.
+    """
+    if _fan_out_needed():
+        partials = _fan_out(_kpi_partial, filter_estado, filter_ambiente)
+    else:
+        partials = [_kpi_partial(filter_estado, filter_ambiente)]
+
+    env_counts = Counter()
+    rm_counts = Counter()
+    for partial in partials:
+        env_counts.update(partial["envs"])
+        rm_counts.update(partial["rms"])
+    first_day = min((p["first_day"] for p in partials if p["first_day"]), default=None)
+    last_day = max((p["last_day"] for p in partials if p["last_day"]), default=None)
+
+    return build_kpis(total=sum(p["total"] for p in partials),
+                      failed=sum(p["failed"] for p in partials),
+                      valid=sum(p["valid"] for p in partials),
+                      most_active_env=most_common_value(env_counts), top_rm=most_common_value(rm_counts),
+                      span_days=day_span(first_day, last_day),
+                      fully_deployed=sum(p["fully"] for p in partials))
+
+def _kpi_partial(filter_estado, filter_ambiente):
+    """Conteos de KPIs de una base (o shard), para sumarlos con los de las demás."""
+    conn = get_report_connection()
+    full_mask = conn.execute('SELECT coalesce(sum(bit), 0) FROM kpi_envs').fetchone()[0]
+
+    if not filter_estado and not filter_ambiente:
+        counts = {}
+        envs = Counter()
+        rms = Counter()
+        for row in conn.execute('''
+            SELECT dimension, value, n FROM kpi_counts
+            WHERE dimension IN ('total', 'estado', 'ambiente', 'release_manager')
+        '''):
+            if row["dimension"] == "ambiente":
+                envs[row["value"]] = row["n"]
+            elif row["dimension"] == "release_manager":
+                rms[row["value"]] = row["n"]
+            else:
+                counts[(row["dimension"], row["value"])] = row["n"]
+        # Dos subconsultas: cada MIN/MAX por separado es una búsqueda en la PK
+        first_day, last_day = conn.execute('''
+            SELECT (SELECT MIN(fecha) FROM kpi_daily), (SELECT MAX(fecha) FROM kpi_daily)
+        ''').fetchone()
+        fully = conn.execute('SELECT COUNT(*) FROM kpi_valid_envs WHERE mask = ?',
+                             (full_mask,)).fetchone()[0]
+        conn.close()
+        return {"total": counts.get(("total", ""), 0),
+                "failed": counts.get(("estado", "Failed"), 0),
+                "valid": counts.get(("estado", "Valid"), 0),
+                "envs": envs, "rms": rms, "first_day": first_day, "last_day": last_day,
+                "fully": fully}
+
+    clauses = []
+    params = []
+    if filter_estado:
+        clauses.append("estado = ?")
+        params.append(filter_estado)
+    if filter_ambiente:
+        clauses.append("ambiente = ?")
+        params.append(filter_ambiente)
+    rows = conn.execute(f'''
+        SELECT ambiente, estado, release_manager, fecha, n FROM kpi_buckets
+        WHERE {" AND ".join(clauses)}
+    ''', params).fetchall()
+
+    total = failed = valid = 0
+    env_counts = Counter()
+    rm_counts = Counter()
+    days = []
+    for row in rows:
+        n = row["n"]
+        total += n
+        if row["estado"] == "Failed":
+            failed += n
+        elif row["estado"] == "Valid":
+            valid += n
+        env_counts[row["ambiente"].strip().upper()] += n
+        if row["release_manager"]:
+            rm_counts[row["release_manager"]] += n
+        if row["fecha"]:
+            days.append(row["fecha"])
+
+    # "Fully deployed" exige Valid en todos los ambientes: con filtro de
+    # estado distinto de Valid, o de un solo ambiente, solo cuenta si alcanza
+    fully = 0
+    if valid and (not filter_ambiente or
+                  conn.execute('SELECT coalesce(sum(bit), 0) FROM kpi_envs WHERE ambiente = ?',
+                               (filter_ambiente.strip().upper(),)).fetchone()[0] == full_mask):
+        fully = conn.execute('SELECT COUNT(*) FROM kpi_valid_envs WHERE mask = ?',
+                             (full_mask,)).fetchone()[0]
+    conn.close()
+    return {"total": total, "failed": failed, "valid": valid, "envs": env_counts, "rms": rm_counts,
+            "first_day": min(days) if days else None, "last_day": max(days) if days else None,
+            "fully": fully}
+
 def get_all_features(filtro=None):
+    if _fan_out_needed():
+        return list(heapq.merge(*_fan_out(get_all_features, filtro), key=_feature_row_order))
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -173,16 +1849,8 @@ def get_all_features(filtro=None):
     '''
     params = []
     if filtro:
-        query += '''
-            WHERE f.name LIKE ? 
-               OR f.repositorio LIKE ? 
-               OR d.estado LIKE ?
-               OR p.name LIKE ? 
-               OR s.name LIKE ?
-               OR t.name LIKE ?
-        '''
-        pattern = f"%{filtro}%"
-        params = [pattern] * 6
+        where, params = build_search_filter(conn, filtro)
+        query += ' WHERE ' + where
 
     query += ' ORDER BY f.name, d.ambiente'
     cursor.execute(query, params)
@@ -190,27 +1858,1203 @@ def get_all_features(filtro=None):
     conn.close()
     return rows
 
-def update_env_status(feature_id, ambiente, estado):
+def _feature_row_order(row):
+    # El ORDER BY f.name, d.ambiente de SQLite (NULL primero), para heapq.merge
+    return row["name"], row["ambiente"] is not None, row["ambiente"] or ""
+
+# --- DASHBOARD: KPIs de la búsqueda de texto ---
+
+def get_dashboard_kpi_rows(filtro, filter_estado="", filter_ambiente=""):
+    """
+    Filas (name, ambiente, estado, fecha, release_manager) que alimentan los
+    KPIs de "/" con texto: los despliegues de features con jerarquía
+    completa que coinciden con el buscador (FTS o estado) y los filtros.
+    Sin orden: los KPIs no dependen de él.
+    """
+    if _fan_out_needed():
+        return list(itertools.chain.from_iterable(
+            _fan_out(get_dashboard_kpi_rows, filtro, filter_estado, filter_ambiente)))
+    conn = get_report_connection()
+    search, params = build_search_filter(conn, filtro, feature_column="d.feature_id")
+    clauses = [search]
+    if filter_estado:
+        clauses.append("d.estado = ?")
+        params.append(filter_estado)
+    if filter_ambiente:
+        clauses.append("d.ambiente = ?")
+        params.append(filter_ambiente)
+    rows = conn.execute(f'''
+        SELECT f.name, d.ambiente, d.estado, d.fecha, d.release_manager
+        {_REPORT_FROM}
+        WHERE {" AND ".join(clauses)}
+    ''', params).fetchall()
+    conn.close()
+    return rows
+
+# --- MATRIZ PAGINADA (/api/matrix) ---
+#
+# La matriz del dashboard por páginas: una fila por nombre de feature,
+# solo features con jerarquía completa. Paginación por cursor (clave de orden de la última fila) y no
+# por OFFSET: las altas y bajas mientras el usuario scrollea no duplican ni
+# saltean filas.
+
+MATRIX_PAGE_SIZE = 100
+MATRIX_PAGE_MAX = 500
+MATRIX_SORTS = {
+    "name": "f.name",
+    "type": "MIN(p.name)",
+    "application": "MIN(s.name)",
+    "tenancy": "MIN(t.name)",
+}
+
+_MATRIX_FROM = '''
+    FROM features f
+    JOIN products p ON f.product_id = p.id
+    JOIN solutions s ON p.solution_id = s.id
+    JOIN tenants t ON s.tenant_id = t.id
+'''
+
+def _matrix_where(filters):
+    """name: prefijo; type/application/tenancy: nombre exacto del nivel."""
+    conditions = []
+    params = []
+    name = filters.get("name")
+    if name:
+        # Rango sobre UNIQUE(name, repositorio) en lugar de LIKE 'x%'
+        conditions.append("f.name >= ? AND f.name < ?")
+        params += [name, name + "\U0010ffff"]
+    for key, column in (("type", "p.name"), ("application", "s.name"), ("tenancy", "t.name")):
+        if filters.get(key):
+            conditions.append(f"{column} = ?")
+            params.append(filters[key])
+    return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+def get_matrix_page(ambiente_options, filters=None, sort="name", descending=False,
+                    after=None, limit=None):
+    """
+    Una página de la matriz. `after` es el cursor que devolvió la página
+    anterior ([clave de orden, nombre]). Devuelve {"rows", "next", "total"};
+    "next" es None en la última página y "total" solo viene en la primera.
+    """
+    filters = filters or {}
+    limit = max(1, min(limit or MATRIX_PAGE_SIZE, MATRIX_PAGE_MAX))
+    if _fan_out_needed():
+        # Cada shard trae su página ya ordenada: alcanza con mezclar y cortar
+        parts = _fan_out(_matrix_page, ambiente_options, filters, sort, descending, after, limit)
+        merged = list(itertools.islice(
+            heapq.merge(*(zip(part["keys"], part["rows"]) for part in parts),
+                        key=lambda entry: entry[0], reverse=descending),
+            limit + 1))
+        has_more = len(merged) > limit or any(part["has_more"] for part in parts)
+        merged = merged[:limit]
+        total = None if after else sum(part["total"] for part in parts)
+    else:
+        page = _matrix_page(ambiente_options, filters, sort, descending, after, limit)
+        merged = list(zip(page["keys"], page["rows"]))
+        has_more = page["has_more"]
+        total = page["total"]
+    return {
+        "rows": [row for _, row in merged],
+        "next": merged[-1][0] if has_more and merged else None,
+        "total": total,
+    }
+
+def _matrix_page(ambiente_options, filters, sort, descending, after, limit):
+    sort_expr = MATRIX_SORTS.get(sort, MATRIX_SORTS["name"])
+    direction = "DESC" if descending else "ASC"
+    where, params = _matrix_where(filters)
+
+    # Por nombre el orden sale del índice UNIQUE(name, repositorio), sin sort temporal
+    if sort_expr == "f.name":
+        order_by = f"f.name {direction}"
+    else:
+        order_by = f"sort_key {direction}, f.name {direction}"
+    having = ""
+    page_where, page_params = where, list(params)
+    if after:
+        key, name = after
+        op = "<" if descending else ">"
+        if sort_expr == "f.name":
+            # Por nombre el cursor es un rango sobre el índice, antes de agrupar
+            page_where = f"{where} AND f.name {op} ?" if where else f" WHERE f.name {op} ?"
+            page_params.append(name)
+        else:
+            having = f" HAVING ({sort_expr}, f.name) {op} (?, ?)"
+            page_params += [key, name]
+
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO deployments (feature_id, ambiente, estado, fecha, release_manager)
+    page = conn.execute(f'''
+        SELECT f.name, {sort_expr} AS sort_key
+        {_MATRIX_FROM}{page_where}
+        GROUP BY f.name{having}
+        ORDER BY {order_by}
+        LIMIT ?
+    ''', page_params + [limit + 1]).fetchall()
+    has_more = len(page) > limit
+    page = page[:limit]
+    names = [row["name"] for row in page]
+
+    total = None
+    if not after:
+        total = conn.execute(f'SELECT COUNT(DISTINCT f.name) {_MATRIX_FROM}{where}', params).fetchone()[0]
+
+    grouped = {name: None for name in names}
+    if names:
+        name_filter = "f.name IN (SELECT value FROM json_each(?))"
+        where_page = f"{where} AND {name_filter}" if where else f" WHERE {name_filter}"
+        for row in conn.execute(f'''
+            SELECT f.name, f.repositorio, f.master, p.name AS type, s.name AS application,
+                   t.name AS tenancy, d.ambiente, d.estado
+            {_MATRIX_FROM}
+            LEFT JOIN deployments d ON d.feature_id = f.id
+            {where_page}
+            ORDER BY f.name, d.ambiente
+        ''', params + [json.dumps(names)]):
+            entry = grouped[row["name"]]
+            if entry is None:
+                entry = grouped[row["name"]] = {
+                    "name": row["name"], "env_status": {e: "" for e in ambiente_options}
+                }
+            entry["repositorio"] = row["repositorio"]
+            entry["type"] = row["type"]
+            entry["application"] = row["application"]
+            entry["tenancy"] = row["tenancy"]
+            entry["master"] = row["master"]
+            if row["ambiente"]:
+                entry["env_status"][row["ambiente"]] = row["estado"]
+    conn.close()
+
+    return {
+        "rows": list(grouped.values()),
+        "keys": [[row["sort_key"], row["name"]] for row in page],
+        "has_more": has_more,
+        "total": total,
+    }
+
+def get_feature_details(name):
+    """Detalle por ambiente de un feature (todas sus versiones por repositorio)."""
+    if _fan_out_needed():
+        # Gana el de menor id: los shards van en el orden de sus rangos de ids
+        details = {}
+        for part in reversed(_fan_out(get_feature_details, name)):
+            details.update(part)
+        return details
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT d.ambiente, d.estado, d.fecha, d.release_manager
+        FROM features f
+        JOIN deployments d ON d.feature_id = f.id
+        WHERE f.name = ?
+        ORDER BY f.id DESC, d.ambiente
+    ''', (name,)).fetchall()
+    # Con el mismo ambiente en dos repositorios gana el de menor id, como en
+    # get_feature_by_name
+    conn.close()
+    return {row["ambiente"]: {"estado": row["estado"], "fecha": row["fecha"],
+                              "release_manager": row["release_manager"]}
+            for row in rows if row["ambiente"]}
+
+# --- FUENTE DE LA MATRIZ EN MEMORIA (matrix.py) ---
+
+_MATRIX_FEATURES_SQL = '''
+    SELECT f.id, f.name, f.repositorio, f.master, f.product_id,
+           p.name AS type, s.name AS application, t.name AS tenancy
+    FROM features f
+    LEFT JOIN products p ON f.product_id = p.id
+    LEFT JOIN solutions s ON p.solution_id = s.id
+    LEFT JOIN tenants t ON s.tenant_id = t.id
+'''
+
+_MATRIX_CELLS_SQL = '''
+    SELECT feature_id, ambiente, estado, fecha, release_manager
+    FROM deployments d
+'''
+
+def get_matrix_features(feature_ids=None):
+    """Features con su jerarquía (tenancy NULL si no está completa); todos o los de `feature_ids`."""
+    return _matrix_source(_MATRIX_FEATURES_SQL, "f.id", feature_ids)
+
+def get_matrix_cells(feature_ids=None):
+    """Despliegues (feature_id, ambiente, estado, fecha, release_manager); todos o los de `feature_ids`."""
+    return _matrix_source(_MATRIX_CELLS_SQL, "d.feature_id", feature_ids)
+
+def _matrix_source(sql, column, feature_ids):
+    if _fan_out_needed():
+        if feature_ids is None:
+            return list(itertools.chain.from_iterable(_fan_out(_matrix_source, sql, column, None)))
+        by_shard = {}
+        for feature_id in feature_ids:
+            by_shard.setdefault(_shard_for_feature(feature_id), []).append(feature_id)
+        rows = []
+        for shard, ids in by_shard.items():
+            with _on_shard(shard):
+                rows += _matrix_source(sql, column, ids)
+        return rows
+    # Del primario y no de la réplica: la matriz tiene que ver cada escritura
+    conn = get_db_connection()
+    if feature_ids is None:
+        rows = conn.execute(sql).fetchall()
+    else:
+        rows = conn.execute(f'{sql} WHERE {column} IN (SELECT value FROM json_each(?))',
+                            (json.dumps(list(feature_ids)),)).fetchall()
+    conn.close()
+    return rows
+
+# --- REPORTES: filtros y paginación en SQL ---
+
+REPORT_PAGE_SIZE = 50
+
+_REPORT_FROM = '''
+    FROM deployments d
+    JOIN features f ON f.id = d.feature_id
+    JOIN products p ON f.product_id = p.id
+    JOIN solutions s ON p.solution_id = s.id
+    JOIN tenants t ON s.tenant_id = t.id
+'''
+# Mismas columnas y alias: los filtros de build_report_filters sirven igual.
+# Al archivo se llega siempre por fecha: el + en el join impide que el
+# planner lo recorra por feature_id desde tenants/features cuando el rango
+# cubre casi todo el archivo (pasa apenas se llena, antes de tener volumen)
+_REPORT_ARCHIVE_FROM = (_REPORT_FROM.replace("FROM deployments d", "FROM deployments_archive d")
+                        .replace("f.id = d.feature_id", "f.id = +d.feature_id"))
+
+def _report_archive_newest(conn, filters):
+    """
+    Fecha más nueva del archivo si el rango de `filters` llega hasta ella;
+    None si el archivo está vacío o el rango empieza después (no se lee).
+    """
+    newest = conn.execute('SELECT MAX(fecha) FROM deployments_archive').fetchone()[0]
+    start = filters.get("start_date")
+    if newest is None or (start and start > newest):
+        return None
+    return newest
+
+def build_report_filters(filtro=None, filter_estado=None, filter_ambiente=None,
+                         start_date=None, end_date=None):
+    """
+    Traduce los filtros de /reports a un WHERE parametrizado.
+    Devuelve (sql, params). Solo entran despliegues con fecha.
+    """
+    clauses = ["d.fecha IS NOT NULL", "d.fecha <> ''"]
+    params = []
+    if filtro:
+        conn = get_report_connection()
+        search, search_params = build_search_filter(conn, filtro, feature_column="d.feature_id")
+        conn.close()
+        clauses.append(search)
+        params += search_params
+    if filter_estado:
+        clauses.append("d.estado = ?")
+        params.append(filter_estado)
+    if filter_ambiente:
+        clauses.append("d.ambiente = ?")
+        params.append(filter_ambiente)
+    # Fechas ISO (YYYY-MM-DD): la comparación de texto equivale a la de fechas
+    if start_date:
+        clauses.append("d.fecha >= ?")
+        params.append(start_date)
+    if end_date:
+        clauses.append("d.fecha <= ?")
+        params.append(end_date)
+    return " WHERE " + " AND ".join(clauses), params
+
+def get_report_page(filters, after=None, limit=REPORT_PAGE_SIZE):
+    """
+    Una página de /reports ordenada por (fecha, id) descendente.
+    `after` es la tupla (fecha, deployment_id) de la última fila de la
+    página anterior (keyset pagination). Devuelve (rows, next_after).
+    """
+    if _fan_out_needed():
+        # Los ids son únicos entre shards: (fecha, id) sigue siendo una clave total
+        parts = _fan_out(get_report_page, filters, after, limit)
+        rows = list(itertools.islice(heapq.merge(
+            *(rows for rows, _ in parts),
+            key=lambda row: (row["fecha"], row["deployment_id"]), reverse=True), limit + 1))
+        more = len(rows) > limit or any(next_after for _, next_after in parts)
+        rows = rows[:limit]
+        return rows, (rows[-1]["fecha"], rows[-1]["deployment_id"]) if more and rows else None
+
+    where, params = build_report_filters(**filters)
+    if after:
+        where += " AND (d.fecha, d.id) < (?, ?)"
+        params += [after[0], after[1]]
+
+    conn = get_report_connection()
+    rows = _report_page_rows(conn, _REPORT_FROM, where, params, limit)
+    # El archivo solo tiene filas más viejas que su fecha más nueva: si la
+    # página ya se llena con filas posteriores, no hace falta leerlo
+    newest = _report_archive_newest(conn, filters)
+    if newest is not None and (len(rows) <= limit or rows[limit]["fecha"] <= newest):
+        archived = _report_page_rows(conn, _REPORT_ARCHIVE_FROM, where, params, limit)
+        rows = list(itertools.islice(heapq.merge(
+            rows, archived, key=lambda row: (row["fecha"], row["deployment_id"]), reverse=True),
+            limit + 1))
+    conn.close()
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = (rows[-1]["fecha"], rows[-1]["deployment_id"])
+    return rows, next_after
+
+def _report_page_rows(conn, source, where, params, limit):
+    return conn.execute(f'''
+        SELECT
+            d.id AS deployment_id,
+            f.id AS feature_id,
+            f.name,
+            f.repositorio,
+            f.master,
+            p.name AS type,
+            s.name AS application,
+            t.name AS tenancy,
+            d.ambiente,
+            d.estado,
+            d.fecha,
+            d.release_manager
+        {source}
+        {where}
+        ORDER BY d.fecha DESC, d.id DESC
+        LIMIT ?
+    ''', params + [limit + 1]).fetchall()
+
+EXPORT_BATCH_SIZE = 500
+
+def iter_report_rows(filters, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Todas las filas de /reports que pasan los filtros, en lotes de
+    `batch_size` leídos del cursor a medida que se consumen. Usa una
+    conexión dedicada (de la réplica): la memoria no crece con la
+    cantidad de filas. La última columna (deployment_id) desempata el
+    orden al mezclar con el archivo o entre shards.
+    """
+    if _fan_out_needed():
+        yield from _iter_sharded_report_rows(filters, batch_size)
+        return
+    where, params = build_report_filters(**filters)
+    with dedicated_report_connection() as conn:
+        sources = [_REPORT_FROM]
+        if _report_archive_newest(conn, filters) is not None:
+            sources.append(_REPORT_ARCHIVE_FROM)
+        cursors = [conn.execute(f'''
+            SELECT
+                f.name,
+                d.ambiente,
+                d.estado,
+                d.fecha,
+                d.release_manager,
+                f.repositorio,
+                f.master,
+                d.id AS deployment_id
+            {source}
+            {where}
+            ORDER BY d.fecha DESC, d.id DESC
+        ''', params) for source in sources]
+        if len(cursors) == 1:
+            cursor = cursors[0]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+            return
+        merged = heapq.merge(*cursors, key=_report_row_order, reverse=True)
+        while True:
+            rows = list(itertools.islice(merged, batch_size))
+            if not rows:
+                break
+            yield rows
+
+def _report_row_order(row):
+    # El mismo orden que ORDER BY d.fecha DESC, d.id DESC (con reverse=True)
+    return row["fecha"], row["deployment_id"]
+
+def _iter_sharded_report_rows(filters, batch_size):
+    # Cada shard abre su cursor y lee la primera tanda en el fan-out; el
+    # resto se va leyendo desde acá a medida que avanza la mezcla
+    def start(filters):
+        batches = iter_report_rows(filters, batch_size)
+        return batches, next(batches, [])
+
+    streams = [itertools.chain(first, itertools.chain.from_iterable(batches))
+               for batches, first in _fan_out(start, filters)]
+    merged = heapq.merge(*streams, key=_report_row_order, reverse=True)
+    while True:
+        rows = list(itertools.islice(merged, batch_size))
+        if not rows:
+            break
+        yield rows
+
+def count_report_rows(filters):
+    if _fan_out_needed():
+        return sum(_fan_out(count_report_rows, filters))
+    where, params = build_report_filters(**filters)
+    conn = get_report_connection()
+    total = conn.execute(f'SELECT COUNT(*) {_REPORT_FROM} {where}', params).fetchone()[0]
+    if _report_archive_newest(conn, filters) is not None:
+        total += conn.execute(f'SELECT COUNT(*) {_REPORT_ARCHIVE_FROM} {where}', params).fetchone()[0]
+    conn.close()
+    return total
+
+def _update_env_status_tx(conn, feature_id, ambiente, estado):
+    conn.execute('''
+        INSERT INTO deployments (feature_id, ambiente, estado, fecha, release_manager)
         VALUES (?, ?, ?, DATE('now'), '')
+        ON CONFLICT(feature_id, ambiente) DO UPDATE SET
+            estado = excluded.estado,
+            fecha = excluded.fecha,
+            release_manager = excluded.release_manager
     ''', (feature_id, ambiente, estado))
-    conn.commit()
-    conn.close()
+    _publish_after_commit(conn, _deployment_changes(conn, [(feature_id, ambiente)]))
+
+def update_env_status(feature_id, ambiente, estado):
+    _shard_for_feature(feature_id).writer.run(_update_env_status_tx, feature_id, ambiente, estado)
+
+def _update_full_deployment_tx(conn, feature_id, ambiente, estado, fecha, release_manager):
+    conn.execute(UPSERT_DEPLOYMENT_SQL, (feature_id, ambiente, estado, fecha, release_manager))
+    _publish_after_commit(conn, _deployment_changes(conn, [(feature_id, ambiente)]))
 
 def update_full_deployment(feature_id, ambiente, estado, fecha, release_manager):
+    _shard_for_feature(feature_id).writer.run(_update_full_deployment_tx, feature_id, ambiente,
+                                              estado, fecha, release_manager)
+
+# --- HISTORIAL DE DESPLIEGUES (append-only) ---
+#
+# deployments guarda solo el último estado por (feature, ambiente); cada
+# alta, cambio o baja queda además en deployment_events, escrito por
+# triggers en la misma transacción que el upsert. analytics.py lo consume.
+
+_EVENT_COLUMNS = "deployment_id, feature_id, ambiente, estado, fecha, release_manager, kind"
+
+def _event_values(row, kind):
+    return (f"{row}.id, {row}.feature_id, {row}.ambiente, {row}.estado, "
+            f"{row}.fecha, {row}.release_manager, '{kind}'")
+
+def _create_deployment_events(conn):
+    conn.executescript(f'''
+        CREATE TABLE IF NOT EXISTS deployment_events (
+            id INTEGER PRIMARY KEY,
+            deployment_id INTEGER NOT NULL,
+            feature_id INTEGER NOT NULL,
+            ambiente TEXT,
+            estado TEXT,
+            fecha TEXT,
+            release_manager TEXT,
+            kind TEXT NOT NULL,  -- 'snapshot' (estado al crear la tabla), 'insert', 'update', 'delete'
+                                 -- y, desde la migración 9, 'archive'
+            recorded_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+        );
+        CREATE INDEX IF NOT EXISTS idx_deployment_events_feature
+            ON deployment_events(feature_id, ambiente, fecha);
+
+        CREATE TRIGGER IF NOT EXISTS deployments_events_ai AFTER INSERT ON deployments BEGIN
+            INSERT INTO deployment_events ({_EVENT_COLUMNS}) VALUES ({_event_values("new", "insert")});
+        END;
+        CREATE TRIGGER IF NOT EXISTS deployments_events_au AFTER UPDATE ON deployments
+        WHEN old.estado IS NOT new.estado OR old.fecha IS NOT new.fecha
+          OR old.release_manager IS NOT new.release_manager
+          OR old.ambiente IS NOT new.ambiente OR old.feature_id IS NOT new.feature_id
+        BEGIN
+            INSERT INTO deployment_events ({_EVENT_COLUMNS}) VALUES ({_event_values("new", "update")});
+        END;
+        CREATE TRIGGER IF NOT EXISTS deployments_events_ad AFTER DELETE ON deployments BEGIN
+            INSERT INTO deployment_events ({_EVENT_COLUMNS}) VALUES ({_event_values("old", "delete")});
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS deployment_events_no_update BEFORE UPDATE ON deployment_events BEGIN
+            SELECT RAISE(ABORT, 'deployment_events is append-only');
+        END;
+        CREATE TRIGGER IF NOT EXISTS deployment_events_no_delete BEFORE DELETE ON deployment_events BEGIN
+            SELECT RAISE(ABORT, 'deployment_events is append-only');
+        END;
+
+        INSERT INTO deployment_events ({_EVENT_COLUMNS})
+        SELECT id, feature_id, ambiente, estado, fecha, release_manager, 'snapshot'
+        FROM deployments
+        WHERE NOT EXISTS (SELECT 1 FROM deployment_events)
+        ORDER BY id;
+    ''')
+
+DEPLOYMENT_EVENTS_BATCH = 5000
+
+def iter_deployment_events(after_id=0, batch_size=DEPLOYMENT_EVENTS_BATCH):
+    """
+    Eventos con id > after_id en orden de llegada, en lotes. Con shards
+    cada archivo numera sus propios eventos: el cursor es {tenant_id: id},
+    cada lote sale de un solo shard y trae la columna shard. Avanzar el
+    cursor con next_event_cursor sirve para los dos casos.
+    """
+    if not _fan_out_needed():
+        yield from _iter_shard_events(_current(), None, after_id, batch_size)
+        return
+    cursor = after_id or {}
+    for shard in _load_shards():
+        yield from _iter_shard_events(shard, shard.key, cursor.get(shard.key, 0), batch_size)
+
+def _iter_shard_events(shard, key, after_id, batch_size):
+    shard_column = "" if key is None else f"{int(key)} AS shard, "
+    conn = shard.pool.acquire()
+    try:
+        while True:
+            rows = conn.execute(f'''
+                SELECT {shard_column}id, feature_id, ambiente, estado, fecha, kind
+                FROM deployment_events
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (after_id, batch_size)).fetchall()
+            if not rows:
+                return
+            yield rows
+            after_id = rows[-1]["id"]
+    finally:
+        conn.close()
+
+def next_event_cursor(cursor, rows):
+    """Cursor para seguir después de un lote de iter_deployment_events."""
+    last = rows[-1]
+    if "shard" not in last.keys():
+        return last["id"]
+    cursor = dict(cursor or {})
+    cursor[last["shard"]] = last["id"]
+    return cursor
+
+def get_feature_history(feature_id, ambiente=None):
+    """Historial completo de un feature (opcionalmente de un ambiente)."""
+    conn = _shard_for_feature(feature_id).pool.acquire()
+    if ambiente:
+        rows = conn.execute('''
+            SELECT * FROM deployment_events
+            WHERE feature_id = ? AND ambiente = ?
+            ORDER BY fecha, id
+        ''', (feature_id, ambiente)).fetchall()
+    else:
+        rows = conn.execute('''
+            SELECT * FROM deployment_events
+            WHERE feature_id = ?
+            ORDER BY ambiente, fecha, id
+        ''', (feature_id,)).fetchall()
+    conn.close()
+    return rows
+
+# --- BÚSQUEDAS PUNTUALES (usan los índices UNIQUE de features y deployments) ---
+
+def get_feature_by_name(name, repositorio=None):
+    """
+    Resuelve un feature por nombre (y repositorio, si se indica) usando el
+    índice UNIQUE(name, repositorio). Sin repositorio devuelve el de menor id.
+    """
+    if _fan_out_needed():
+        rows = [row for row in _fan_out(get_feature_by_name, name, repositorio) if row is not None]
+        return min(rows, key=lambda row: row["id"], default=None)
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO deployments (feature_id, ambiente, estado, fecha, release_manager)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (feature_id, ambiente, estado, fecha, release_manager))
-    conn.commit()
+    if repositorio is None:
+        row = conn.execute('''
+            SELECT id, name, repositorio, master, product_id
+            FROM features WHERE name = ?
+            ORDER BY id LIMIT 1
+        ''', (name,)).fetchone()
+    else:
+        row = conn.execute('''
+            SELECT id, name, repositorio, master, product_id
+            FROM features WHERE name = ? AND repositorio = ?
+        ''', (name, repositorio)).fetchone()
+    conn.close()
+    return row
+
+def get_deployment(feature_id, ambiente):
+    conn = _shard_for_feature(feature_id).pool.acquire()
+    row = conn.execute('''
+        SELECT id, feature_id, ambiente, estado, fecha, release_manager
+        FROM deployments WHERE feature_id = ? AND ambiente = ?
+    ''', (feature_id, ambiente)).fetchone()
+    conn.close()
+    return row
+
+# Los lotes viajan como un único parámetro JSON: sin límite de variables SQL
+_BATCH_LOOKUP_CTE = '''
+    WITH req AS (
+        SELECT CAST(key AS INTEGER) AS idx,
+               json_extract(value, '$[0]') AS name,
+               json_extract(value, '$[1]') AS ambiente,
+               json_extract(value, '$[2]') AS repositorio
+        FROM json_each(?)
+    )
+'''
+
+_BATCH_FEATURE_ID = '''
+    SELECT id FROM features
+    WHERE name = req.name AND (req.repositorio IS NULL OR repositorio = req.repositorio)
+    ORDER BY id LIMIT 1
+'''
+
+def _batch_lookup_json(pairs):
+    return json.dumps([[p.get("feature"), p.get("ambiente"), p.get("repositorio")] for p in pairs])
+
+def get_deployments_batch(pairs):
+    """
+    Detalle de muchos pares (feature, ambiente) en una sola consulta.
+    `pairs` es una lista de dicts con feature, ambiente y opcionalmente
+    repositorio. Devuelve una fila por par, en el mismo orden; las columnas
+    de deployments vienen en NULL si no hay despliegue.
+    """
+    if not pairs:
+        return []
+    if _fan_out_needed():
+        # Por par gana el shard con el feature de menor id (como sin shards)
+        return [min(rows, key=lambda row: (row["feature_id"] is None, row["feature_id"] or 0))
+                for rows in zip(*_fan_out(get_deployments_batch, pairs))]
+    conn = get_db_connection()
+    rows = conn.execute(_BATCH_LOOKUP_CTE + f'''
+        SELECT req.idx, req.name, req.ambiente,
+               f.id AS feature_id, d.id AS deployment_id,
+               d.estado, d.fecha, d.release_manager
+        FROM req
+        LEFT JOIN features f ON f.id = ({_BATCH_FEATURE_ID})
+        LEFT JOIN deployments d ON d.feature_id = f.id AND d.ambiente = req.ambiente
+        ORDER BY req.idx
+    ''', (_batch_lookup_json(pairs),)).fetchall()
+    conn.close()
+    return rows
+
+def update_full_deployments(items):
+    """
+    Versión por lotes de update_full_deployment: resuelve todos los
+    features en una consulta y escribe todo en una sola transacción.
+    Devuelve una lista de (ok, mensaje) en el orden de `items`.
+    """
+    if not items:
+        return []
+    if _fan_out_needed():
+        return _update_full_deployments_sharded(items)
+    return run_write(_update_full_deployments_tx, items)
+
+def _update_full_deployments_sharded(items):
+    # Resuelve en qué shard está cada feature y escribe un lote por shard;
+    # cada lote es atómico, el conjunto no
+    results = [(False, "Feature not found")] * len(items)
+    by_shard = {}
+    for index, row in enumerate(get_deployments_batch(items)):
+        if row["feature_id"] is not None:
+            by_shard.setdefault(_shard_for_feature(row["feature_id"]), []).append(index)
+    for shard, indexes in by_shard.items():
+        done = shard.writer.run(_update_full_deployments_tx, [items[i] for i in indexes])
+        for index, result in zip(indexes, done):
+            results[index] = result
+    return results
+
+def _update_full_deployments_tx(conn, items):
+    resolved = conn.execute(_BATCH_LOOKUP_CTE + f'''
+        SELECT req.idx, ({_BATCH_FEATURE_ID}) AS feature_id
+        FROM req
+        ORDER BY req.idx
+    ''', (_batch_lookup_json(items),)).fetchall()
+
+    results = []
+    params = []
+    for item, row in zip(items, resolved):
+        if row["feature_id"] is None:
+            results.append((False, "Feature not found"))
+            continue
+        if not item.get("ambiente"):
+            results.append((False, "Ambiente required"))
+            continue
+        params.append((row["feature_id"], item["ambiente"], item.get("estado"),
+                       item.get("fecha"), item.get("release_manager")))
+        results.append((True, None))
+
+    conn.executemany(UPSERT_DEPLOYMENT_SQL, params)
+    _publish_after_commit(conn, _deployment_changes(conn, [(p[0], p[1]) for p in params]))
+    return results
+
+# --- INGESTA MASIVA (CI) ---
+
+INGEST_CHUNK_SIZE = 1000
+INGEST_REQUIRED = ("name", "repositorio", "ambiente", "estado", "fecha")
+INGEST_TEXT = INGEST_REQUIRED + ("release_manager", "master")
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+# CROSS JOIN fija el orden: json_each afuera y búsqueda por el índice
+# UNIQUE(name, repositorio), si no el planner recorre features por cada par
+_INGEST_FEATURE_LOOKUP = '''
+    SELECT f.name, f.repositorio, f.id
+    FROM json_each(?) j
+    CROSS JOIN features f ON f.name = json_extract(j.value, '$[0]')
+                   AND f.repositorio = json_extract(j.value, '$[1]')
+'''
+
+def _as_int(value):
+    """Entero de un int o de un texto solo con dígitos; None para bool, float y el resto."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
+    return None
+
+def _ingest_key(record):
+    """(name, repositorio) del registro; None si no son textos no vacíos (lo reporta _ingest_error)."""
+    if not isinstance(record, dict):
+        return None
+    name, repositorio = record.get("name"), record.get("repositorio")
+    if not (isinstance(name, str) and isinstance(repositorio, str) and name and repositorio):
+        return None
+    return name, repositorio
+
+def _ingest_error(record, ambientes, estados, known_products, feature_ids, new_features):
+    if not isinstance(record, dict):
+        return "Invalid record: expected a JSON object"
+    missing = [field for field in INGEST_REQUIRED if not record.get(field)]
+    if missing:
+        return "Missing " + ", ".join(missing)
+    not_text = [field for field in INGEST_TEXT
+                if record.get(field) is not None and not isinstance(record[field], str)]
+    if not_text:
+        return "Must be strings: " + ", ".join(not_text)
+    if ambientes is not None and record["ambiente"] not in ambientes:
+        return f"Unknown ambiente {record['ambiente']}"
+    if estados is not None and record["estado"] not in estados:
+        return f"Unknown estado {record['estado']}"
+    if not _ISO_DATE.match(record["fecha"]):
+        return "fecha must be YYYY-MM-DD"
+    try:
+        date.fromisoformat(record["fecha"])
+    except ValueError:
+        return f"Invalid fecha {record['fecha']}"
+    key = (record["name"], record["repositorio"])
+    if key not in feature_ids and key not in new_features:
+        # Feature nuevo: hace falta un producto existente para crearlo
+        if record.get("product_id") is None:
+            return "product_id required to create a feature"
+        if _as_int(record["product_id"]) is None:
+            return "product_id must be an integer"
+        if _as_int(record["product_id"]) not in known_products:
+            return f"Unknown product_id {record['product_id']}"
+    return None
+
+def _ingest_chunk(conn, chunk, offset, feature_ids, known_products, ambientes, estados):
+    # Resuelve de una vez los features del lote que todavía no están en cache
+    unknown = {key for key in map(_ingest_key, chunk) if key is not None}
+    unknown -= feature_ids.keys()
+    if unknown:
+        for row in conn.execute(_INGEST_FEATURE_LOOKUP, (json.dumps(list(unknown)),)):
+            feature_ids[(row["name"], row["repositorio"])] = row["id"]
+
+    results = []
+    valid = []
+    new_features = {}
+    for i, record in enumerate(chunk, start=offset):
+        error = _ingest_error(record, ambientes, estados, known_products, feature_ids, new_features)
+        if error:
+            results.append({"index": i, "ok": False, "message": error})
+            continue
+        key = (record["name"], record["repositorio"])
+        if key not in feature_ids and key not in new_features:
+            new_features[key] = (record["name"], record["repositorio"],
+                                 _as_int(record["product_id"]), record.get("master"))
+        valid.append((i, key, record))
+
+    # El lote es un job del escritor; el savepoint propio permite reportar
+    # el error por registro sin tirar los demás jobs del mismo commit
+    conn.execute('SAVEPOINT ingest_chunk')
+    try:
+        if new_features:
+            conn.executemany('''
+                INSERT INTO features (name, repositorio, product_id, master)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(name, repositorio) DO NOTHING
+            ''', new_features.values())
+            for row in conn.execute(_INGEST_FEATURE_LOOKUP, (json.dumps(list(new_features)),)):
+                feature_ids[(row["name"], row["repositorio"])] = row["id"]
+        conn.executemany(UPSERT_DEPLOYMENT_SQL, [
+            (feature_ids[key], r["ambiente"], r["estado"], r["fecha"], r.get("release_manager"))
+            for _, key, r in valid
+        ])
+        conn.execute('RELEASE ingest_chunk')
+    except sqlite3.Error as e:
+        conn.execute('ROLLBACK TO ingest_chunk')
+        conn.execute('RELEASE ingest_chunk')
+        for key in new_features:
+            feature_ids.pop(key, None)
+        results.extend({"index": i, "ok": False, "message": str(e)} for i, _, _ in valid)
+    else:
+        results.extend({"index": i, "ok": True, "feature_id": feature_ids[key],
+                        "created": key in new_features}
+                       for i, key, _ in valid)
+        _publish_after_commit(conn, _created_feature_changes(conn, [feature_ids[key] for key in new_features]) +
+                              _deployment_changes(conn, [(feature_ids[key], r["ambiente"])
+                                                         for _, key, r in valid]))
+
+    results.sort(key=lambda r: r["index"])
+    return results
+
+def ingest_deployments(records, ambientes=None, estados=None, chunk_size=INGEST_CHUNK_SIZE):
+    """
+    Alta/actualización masiva de despliegues. `records` es un iterable de
+    dicts (name, repositorio, ambiente, estado, fecha, release_manager y,
+    para features nuevos, product_id y master); se consume en lotes de
+    `chunk_size`, cada uno un job del escritor único con executemany.
+    Devuelve un resultado por registro, en orden: {"index", "ok", ...}.
+    """
+    conn = get_db_connection()
+    known_products = {row["id"] for row in conn.execute('SELECT id FROM products')}
+    conn.close()
+    feature_ids = {}  # (name, repositorio) -> id, vive lo que dura la ingesta
+
+    results = []
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            results.extend(_write_ingest_chunk(chunk, len(results), feature_ids,
+                                               known_products, ambientes, estados))
+            chunk = []
+    if chunk:
+        results.extend(_write_ingest_chunk(chunk, len(results), feature_ids,
+                                           known_products, ambientes, estados))
+    return results
+
+def _write_ingest_chunk(chunk, offset, feature_ids, known_products, ambientes, estados):
+    if not _fan_out_needed():
+        return run_write(_ingest_chunk, chunk, offset, feature_ids, known_products, ambientes, estados)
+
+    # Con shards: los features existentes se buscan en todos y el registro va
+    # al shard del id; los nuevos, al del tenant de su product_id. Los
+    # registros inválidos van a la base principal, que solo reporta el error
+    unknown = {key for key in map(_ingest_key, chunk) if key is not None}
+    unknown -= feature_ids.keys()
+    if unknown:
+        for rows in _fan_out(_lookup_ingest_features, json.dumps(list(unknown))):
+            for name, repositorio, feature_id in rows:
+                feature_ids.setdefault((name, repositorio), feature_id)
+
+    by_shard = {}
+    for index, record in enumerate(chunk):
+        shard = _main_shard
+        key = _ingest_key(record)
+        if key is not None:
+            feature_id = feature_ids.get(key)
+            if feature_id is not None:
+                shard = _shard_for_feature(feature_id)
+            else:
+                shard = _shard_for_product(record.get("product_id"))
+        by_shard.setdefault(shard, []).append(index)
+
+    results = []
+    for shard, indexes in by_shard.items():
+        done = shard.writer.run(_ingest_chunk, [chunk[i] for i in indexes], 0, feature_ids,
+                                known_products, ambientes, estados)
+        for result in done:
+            result["index"] = offset + indexes[result["index"]]
+        results.extend(done)
+    results.sort(key=lambda r: r["index"])
+    return results
+
+def _lookup_ingest_features(lookup):
+    conn = get_db_connection()
+    rows = [tuple(row) for row in conn.execute(_INGEST_FEATURE_LOOKUP, (lookup,))]
+    conn.close()
+    return rows
+
+# --- ARCHIVO DE DESPLIEGUES VIEJOS ---
+#
+# deployments guarda solo la parte viva; los despliegues cerrados (por
+# defecto: estado Archived con más de ARCHIVE_AFTER_DAYS días) pasan a
+# deployments_archive, con el mismo id, en lotes que son transacciones del
+# escritor. KPIs, dashboard y matriz trabajan sobre lo vivo; /reports suma
+# el archivo solo si el rango de fechas lo alcanza. El historial
+# (deployment_events) registra el pase como 'archive', no como 'delete'.
+# Después de mover, PRAGMA incremental_vacuum devuelve las páginas libres.
+#
+# Archivar es una escritura más: tiene que correr en el proceso de la app
+# (start_archiver o POST /admin/archive) para que sus notificaciones lleguen
+# a la matriz en memoria y a /events. archiveDeployments.py es para correr
+# con la app parada.
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("DEPLOYMENTS_ARCHIVE_AFTER_DAYS", 365))
+# Estados que se archivan, separados por coma; vacío = cualquier estado
+ARCHIVE_ESTADOS = tuple(e.strip() for e in os.environ.get("DEPLOYMENTS_ARCHIVE_ESTADOS", "Archived").split(",")
+                        if e.strip())
+ARCHIVE_BATCH_SIZE = 2000
+ARCHIVE_VACUUM_PAGES = 4096  # páginas liberadas por transacción de incremental_vacuum
+ARCHIVE_INTERVAL = float(os.environ.get("DEPLOYMENTS_ARCHIVE_INTERVAL", 24 * 3600))  # segundos; 0 = no se agenda
+
+def _create_deployments_archive(conn):
+    conn.executescript(f'''
+        CREATE TABLE IF NOT EXISTS deployments_archive (
+            id INTEGER PRIMARY KEY,  -- el id que tenía en deployments
+            feature_id INTEGER NOT NULL,
+            ambiente TEXT,
+            estado TEXT,
+            fecha TEXT,
+            release_manager TEXT,
+            archived_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+            FOREIGN KEY(feature_id) REFERENCES features(id) ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS idx_deployments_archive_fecha ON deployments_archive(fecha);
+        CREATE INDEX IF NOT EXISTS idx_deployments_archive_feature ON deployments_archive(feature_id);
+
+        CREATE TRIGGER IF NOT EXISTS deployments_archive_events_ai AFTER INSERT ON deployments_archive BEGIN
+            INSERT INTO deployment_events ({_EVENT_COLUMNS}) VALUES ({_event_values("new", "archive")});
+        END;
+        -- Lo que se borra de deployments porque pasó al archivo no es un 'delete'
+        DROP TRIGGER IF EXISTS deployments_events_ad;
+        CREATE TRIGGER deployments_events_ad AFTER DELETE ON deployments
+        WHEN NOT EXISTS (SELECT 1 FROM deployments_archive WHERE id = old.id)
+        BEGIN
+            INSERT INTO deployment_events ({_EVENT_COLUMNS}) VALUES ({_event_values("old", "delete")});
+        END;
+    ''')
+
+def archive_deployments(before=None, estados=ARCHIVE_ESTADOS, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """
+    Pasa a deployments_archive los despliegues con fecha < `before` (por
+    defecto hoy - ARCHIVE_AFTER_DAYS) y estado en `estados` (vacío = todos),
+    `batch_size` filas por transacción; progress(archivados) tras cada lote.
+    Después corre incremental_vacuum. Devuelve {"archived", "batches",
+    "freed_pages", "seconds"}.
+    """
+    if before is None:
+        before = (date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)).isoformat()
+    if _fan_out_needed():
+        parts = _fan_out(archive_deployments, before, estados, batch_size)
+        return {key: (max if key == "seconds" else sum)(part[key] for part in parts)
+                for key in ("archived", "batches", "freed_pages", "seconds")}
+
+    start = time.perf_counter()
+    archived = batches = 0
+    while True:
+        moved = run_write(_archive_batch_tx, before, list(estados or ()), batch_size)
+        if not moved:
+            break
+        archived += moved
+        batches += 1
+        if progress:
+            progress(archived)
+    freed = 0
+    if archived:
+        # Sin estadísticas del archivo el planner lo recorre por el índice
+        # de feature_id en lugar del de fecha
+        run_write(_analyze_archive_tx)
+        freed = incremental_vacuum()
+    return {"archived": archived, "batches": batches, "freed_pages": freed,
+            "seconds": time.perf_counter() - start}
+
+def _analyze_archive_tx(conn):
+    conn.execute('ANALYZE deployments_archive')
+
+def _archive_batch_tx(conn, before, estados, batch_size):
+    estado_filter = "AND estado IN (SELECT value FROM json_each(?))" if estados else ""
+    params = [before] + ([json.dumps(estados)] if estados else [])
+    ids = json.dumps([row[0] for row in conn.execute(f'''
+        SELECT id FROM deployments
+        WHERE fecha < ? AND fecha <> '' {estado_filter}
+        LIMIT ?
+    ''', params + [batch_size])])
+    selected = "SELECT value FROM json_each(?)"
+    changes = []
+    if _write_listeners:
+        changes = [{"feature": row["name"], "feature_id": row["feature_id"], "ambiente": row["ambiente"],
+                    "deleted": True, "archived": True}
+                   for row in conn.execute(f'''
+                       SELECT f.name, d.feature_id, d.ambiente
+                       FROM deployments d JOIN features f ON f.id = d.feature_id
+                       WHERE d.id IN ({selected})
+                   ''', (ids,))]
+    conn.execute(f'''
+        INSERT INTO deployments_archive (id, feature_id, ambiente, estado, fecha, release_manager)
+        SELECT id, feature_id, ambiente, estado, fecha, release_manager
+        FROM deployments WHERE id IN ({selected})
+    ''', (ids,))
+    moved = conn.execute(f'DELETE FROM deployments WHERE id IN ({selected})', (ids,)).rowcount
+    _publish_after_commit(conn, changes)
+    return moved
+
+def incremental_vacuum(pages=ARCHIVE_VACUUM_PAGES):
+    """
+    Devuelve al sistema las páginas libres de la base, de a `pages` por
+    transacción del escritor. Sin auto_vacuum=INCREMENTAL no hace nada
+    (ver enable_incremental_vacuum). Devuelve las páginas liberadas.
+    """
+    freed = 0
+    while True:
+        step = run_write(_incremental_vacuum_tx, pages)
+        freed += step
+        if step < pages:
+            return freed
+
+def _incremental_vacuum_tx(conn, pages):
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return 0
+    before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+    return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+def enable_incremental_vacuum():
+    """
+    Pasa una base existente a auto_vacuum=INCREMENTAL (las nuevas ya nacen
+    así). Reescribe el archivo entero con VACUUM: correrlo con la app parada.
+    """
+    if _fan_out_needed():
+        _fan_out(enable_incremental_vacuum)
+        return
+    with dedicated_connection() as conn:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+
+def get_archive_stats():
+    if _fan_out_needed():
+        parts = _fan_out(get_archive_stats)
+        return {"rows": sum(p["rows"] for p in parts),
+                "newest": max((p["newest"] for p in parts if p["newest"]), default=None),
+                "free_pages": sum(p["free_pages"] for p in parts),
+                "incremental_vacuum": all(p["incremental_vacuum"] for p in parts)}
+    conn = get_db_connection()
+    stats = {
+        "rows": conn.execute('SELECT COUNT(*) FROM deployments_archive').fetchone()[0],
+        "newest": conn.execute('SELECT MAX(fecha) FROM deployments_archive').fetchone()[0],
+        "free_pages": conn.execute('PRAGMA freelist_count').fetchone()[0],
+        "incremental_vacuum": conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2,
+    }
     conn.close()
+    return stats
+
+class ArchiveScheduler:
+    """Hilo que corre archive_deployments() cada `interval` segundos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.interval = None
+        self._runs = 0
+        self._last_run = None
+        self._last_result = None
+        self._error = None
+
+    def start(self, interval):
+        with self._lock:
+            if self._thread is not None or interval <= 0:
+                return
+            self.interval = interval
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="deployments-archiver", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # La primera corrida espera un intervalo: arrancar la app no archiva
+        while not self._stop.wait(self.interval):
+            try:
+                result = archive_deployments()
+            except Exception as e:
+                writer_log.exception("scheduled archive failed")
+                with self._lock:
+                    self._error = f"{type(e).__name__}: {e}"
+                continue
+            with self._lock:
+                self._runs += 1
+                self._last_run = time.strftime("%Y-%m-%dT%H:%M:%S")
+                self._last_result = result
+                self._error = None
+
+    def shutdown(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self._thread is not None,
+                "interval_s": self.interval,
+                "runs": self._runs,
+                "last_run": self._last_run,
+                "last_result": self._last_result,
+                "error": self._error,
+            }
+
+_archiver = ArchiveScheduler()
+
+def start_archiver(interval=None):
+    """Agenda el archivado en este proceso cada ARCHIVE_INTERVAL segundos (0 = no)."""
+    _archiver.start(ARCHIVE_INTERVAL if interval is None else interval)
+
+def shutdown_archiver():
+    _archiver.shutdown()
+
+def get_archiver_stats():
+    return _archiver.stats()
+
+# --- BORRADO MASIVO ---
+
+def bulk_delete(features=None, ambientes=None, estado=None, before=None):
+    """
+    Borrado por conjuntos en una sola transacción.
+
+    - Solo `features`: borra esos features (todas sus versiones por
+      repositorio); sus deployments caen por ON DELETE CASCADE.
+    - Con `ambientes`, `estado` y/o `before` (fecha < before): borra los
+      deployments que cumplen todos los criterios, restringidos a `features`
+      si se indican. Ej.: estado="Archived", before="2024-01-01".
+
+    Devuelve {"features": n, "deployments": n} con las filas borradas.
+    """
+    if _fan_out_needed():
+        counts = _fan_out(bulk_delete, features, ambientes, estado, before)
+        return {"features": sum(c["features"] for c in counts),
+                "deployments": sum(c["deployments"] for c in counts)}
+    feature_filter = "SELECT id FROM features WHERE name IN (SELECT value FROM json_each(?))"
+    conditions = []
+    params = []
+    if features:
+        conditions.append(f"feature_id IN ({feature_filter})")
+        params.append(json.dumps(list(features)))
+    if ambientes:
+        conditions.append("ambiente IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(list(ambientes)))
+    if estado:
+        conditions.append("estado = ?")
+        params.append(estado)
+    if before:
+        conditions.append("fecha < ?")
+        params.append(before)
+    if not conditions:
+        raise ValueError("bulk_delete needs at least one criterion")
+
+    whole_features = features and not (ambientes or estado or before)
+    return run_write(_bulk_delete_tx, " AND ".join(conditions), params,
+                     feature_filter, whole_features)
+
+def _bulk_delete_tx(conn, where, params, feature_filter, whole_features):
+    # La transacción del escritor ya es IMMEDIATE: conteo y borrado ven el mismo estado
+    deleted = conn.execute(f'SELECT COUNT(*) FROM deployments WHERE {where}', params).fetchone()[0]
+    changes = []
+    if whole_features:
+        if _write_listeners:
+            changes = [{"feature": row["name"], "deleted": True} for row in conn.execute(
+                'SELECT DISTINCT name FROM features WHERE name IN (SELECT value FROM json_each(?))',
+                params)]
+        removed = conn.execute(f'DELETE FROM features WHERE id IN ({feature_filter})',
+                               params).rowcount
+    else:
+        if _write_listeners:
+            changes = [{"feature": row["name"], "feature_id": row["feature_id"],
+                        "ambiente": row["ambiente"], "deleted": True}
+                       for row in conn.execute(f'''
+                           SELECT f.name, d.feature_id, d.ambiente
+                           FROM deployments d JOIN features f ON f.id = d.feature_id
+                           WHERE {where}
+                       ''', params)]
+        removed = 0
+        conn.execute(f'DELETE FROM deployments WHERE {where}', params)
+    _publish_after_commit(conn, changes)
+    return {"features": removed, "deployments": deleted}
 
 def get_all_feature_names():
+    if _fan_out_needed():
+        return list(dict.fromkeys(itertools.chain.from_iterable(_fan_out(get_all_feature_names))))
     conn = get_db_connection()
     cursor = conn.execute('SELECT DISTINCT name FROM features')
     names = [row['name'] for row in cursor.fetchall()]
@@ -218,6 +3062,12 @@ def get_all_feature_names():
     return names
 
 def get_all_deployment_details():
+    if _fan_out_needed():
+        deployments = {}
+        for part in _fan_out(get_all_deployment_details):
+            for name, envs in part.items():
+                deployments.setdefault(name, {}).update(envs)
+        return deployments
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('''
@@ -247,13 +3097,12 @@ def get_all_deployment_details():
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
+def _create_user_tx(conn, username, password, role):
+    conn.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
+                 (username, hash_password(password), role))
+
 def create_user(username, password, role):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
-              (username, hash_password(password), role))
-    conn.commit()
-    conn.close()
+    run_write(_create_user_tx, username, password, role)
 
 def get_user_by_username(username):
     conn = get_db_connection()
@@ -271,16 +3120,14 @@ def get_all_users():
     conn.close()
     return users
 
+def _update_user_role_tx(conn, user_id, new_role):
+    conn.execute('UPDATE users SET role = ? WHERE id = ?', (new_role, user_id))
+
 def update_user_role(user_id, new_role):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('UPDATE users SET role = ? WHERE id = ?', (new_role, user_id))
-    conn.commit()
-    conn.close()
+    run_write(_update_user_role_tx, user_id, new_role)
+
+def _delete_user_tx(conn, user_id):
+    conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
 
 def delete_user(user_id):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('DELETE FROM users WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    run_write(_delete_user_tx, user_id)
\ No newline at end of file
@@ -0,0 +1,23 @@
+# splitShards.py
+# Parte la base actual (DEPLOYMENTS_DB) en una base por tenant dentro de
+# OUT_DIR; la original no se toca. Después: DEPLOYMENTS_DB=OUT_DIR/<nombre>
+#
+#   python splitShards.py OUT_DIR
+import os
+import sys
+
+import model
+from model import split_into_shards
+
+if len(sys.argv) != 2:
+    sys.exit("uso: python splitShards.py OUT_DIR")
+out_dir = sys.argv[1]
+
+def report(tenant_id, features):
+    label = "principal" if tenant_id == 0 else f"tenant {tenant_id}"
+    print(f"  {label}: {features} features")
+
+counts = split_into_shards(out_dir, progress=report)
+
+print(f"✅ Split complete: {len(counts) - 1} tenant shards, {sum(counts.values())} features. "
+      f"Usar DEPLOYMENTS_DB={os.path.join(out_dir, os.path.basename(model.DB_NAME))}")
@@ -0,0 +1,86 @@
+# Las pruebas corren contra una base sintética en un directorio temporal.
+# app.py abre la base al importarse, así que DEPLOYMENTS_DB (y el resto de
+# la configuración) se fija antes de importarlo, una vez por sesión.
+#
+#   python -m pytest [-q]               (TEST_FEATURES=20000 para una base más grande)
+
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FEATURES = int(os.environ.get("TEST_FEATURES", 2000))
+AMBIENTES = ["PreDEV", "DEV", "UAT", "PPD", "PRD"]
+ESTADOS = ["Valid", "Invalid", "Failed", "Archived", "In-PRD"]
+RMS = ["Michel LF", "Elizabet RC", "Yasser F"]
+ADMIN = ("admin", "admin")
+
+def populate(conn, n_features, seed=42):
+    """20 tenants × 3 soluciones × 4 productos, `n_features` features y su avance por ambiente."""
+    rnd = random.Random(seed)
+    c = conn.cursor()
+    products = []
+    for t in range(20):
+        tenant_id = c.execute('INSERT INTO tenants (name) VALUES (?)', (f"tenant-{t}",)).lastrowid
+        for s in range(3):
+            solution_id = c.execute('INSERT INTO solutions (tenant_id, name) VALUES (?, ?)',
+                                    (tenant_id, f"solution-{s}")).lastrowid
+            for p in range(4):
+                products.append(c.execute('INSERT INTO products (solution_id, name) VALUES (?, ?)',
+                                          (solution_id, f"product-{p}")).lastrowid)
+    c.executemany('INSERT INTO features (name, repositorio, product_id, master) VALUES (?, ?, ?, ?)',
+                  ((f"feat-{i}", f"Repo{i % 3}", rnd.choice(products), "package.sql")
+                   for i in range(n_features)))
+
+    start = date(2022, 1, 1)
+    def deployments():
+        for feature_id in range(1, n_features + 1):
+            for ambiente in AMBIENTES[:rnd.randint(1, len(AMBIENTES))]:
+                fecha = (start + timedelta(days=rnd.randrange(1000))).isoformat()
+                yield (feature_id, ambiente, rnd.choice(ESTADOS), fecha, rnd.choice(RMS))
+    c.executemany('''
+        INSERT INTO deployments (feature_id, ambiente, estado, fecha, release_manager)
+        VALUES (?, ?, ?, ?, ?)
+    ''', deployments())
+    conn.commit()
+    # Estadísticas fijas para el planner: los planes no dependen de cuándo corrió ANALYZE
+    conn.execute('ANALYZE')
+    conn.commit()
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    os.environ["DEPLOYMENTS_DB"] = str(tmp_path_factory.mktemp("db") / "deployments.db")
+    # Todo en el primario (la réplica es una copia con los mismos índices)
+    # y sin archivado agendado: las pruebas controlan cada escritura
+    os.environ["REPORT_REPLICA_MAX_AGE"] = "0"
+    os.environ["DEPLOYMENTS_ARCHIVE_INTERVAL"] = "0"
+    import model
+    # Por si algún módulo de pruebas ya importó model con la configuración por defecto
+    model.DB_NAME = os.environ["DEPLOYMENTS_DB"]
+    model.REPLICA_MAX_AGE = 0
+    model.ARCHIVE_INTERVAL = 0
+    model.create_db()
+    model.set_kpi_environments(AMBIENTES)
+    model.create_user(*ADMIN, "admin")
+    conn = model.get_db_connection()
+    populate(conn, FEATURES)
+    conn.close()
+
+    import app
+    yield app
+
+    model.shutdown_archiver()
+    model.shutdown_writer()
+    model.shutdown_replica()
+    model.close_shards()
+    model._pool.close_all()
+
+@pytest.fixture
+def client(app_module):
+    client = app_module.app.test_client()
+    client.post('/login', data={"username": ADMIN[0], "password": ADMIN[1]})
+    return client
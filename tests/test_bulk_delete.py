@@ -0,0 +1,90 @@
+# Borrados por conjuntos (model.bulk_delete y /api/deployments/delete) y
+# la migración 4, que agregó el ON DELETE CASCADE del que dependen.
+
+import logging
+import sqlite3
+
+import pytest
+
+import model
+
+def _feature(name, ambientes, repositorio="Repo1", estado="Valid", fecha="2024-05-01"):
+    feature_id = model.add_or_get_feature({"name": name, "repositorio": repositorio,
+                                           "product_id": 1, "master": "package.sql"})
+    for ambiente in ambientes:
+        model.save_deployment(feature_id, {"ambiente": ambiente, "estado": estado,
+                                           "fecha": fecha, "release_manager": "Yasser F"})
+    return feature_id
+
+def _deployments(feature_id):
+    conn = model.get_db_connection()
+    n = conn.execute('SELECT COUNT(*) FROM deployments WHERE feature_id = ?', (feature_id,)).fetchone()[0]
+    conn.close()
+    return n
+
+def test_whole_features_cascade_to_their_deployments(app_module):
+    first = _feature("bulk-cascade", ["DEV", "UAT", "PRD"])
+    second = _feature("bulk-cascade", ["DEV"], repositorio="Repo2")
+    assert model.bulk_delete(features=["bulk-cascade"]) == {"features": 2, "deployments": 4}
+    assert model.get_feature_by_name("bulk-cascade") is None
+    assert _deployments(first) == _deployments(second) == 0
+
+def test_criteria_delete_deployments_and_keep_features(app_module):
+    feature_id = _feature("bulk-criteria", ["DEV", "UAT", "PRD"])
+    assert model.bulk_delete(features=["bulk-criteria"], ambientes=["DEV", "PRD"]) == \
+        {"features": 0, "deployments": 2}
+    assert model.get_feature_by_name("bulk-criteria") is not None
+    assert _deployments(feature_id) == 1
+
+def test_estado_and_before_only_delete_older_matches(app_module):
+    # Fechas anteriores a todo populate(): solo cuentan estos despliegues
+    old = _feature("bulk-old", ["DEV", "UAT"], estado="Archived", fecha="2001-01-01")
+    recent = _feature("bulk-recent", ["DEV"], estado="Archived", fecha="2001-12-01")
+    assert model.bulk_delete(estado="Archived", before="2001-06-01") == {"features": 0, "deployments": 2}
+    assert _deployments(old) == 0
+    assert _deployments(recent) == 1
+
+def test_bulk_delete_needs_a_criterion(app_module):
+    with pytest.raises(ValueError):
+        model.bulk_delete()
+    with pytest.raises(ValueError):
+        model.bulk_delete(features=[], ambientes=[])
+
+@pytest.mark.parametrize("payload, message", [
+    ({}, "bulk_delete needs at least one criterion"),
+    ({"features": [], "ambientes": []}, "bulk_delete needs at least one criterion"),
+    ([], "JSON object required"),
+    ({"features": [1]}, "features must be a list of strings"),
+    ({"ambientes": {"DEV": True}}, "ambientes must be a list of strings"),
+    ({"estado": 5}, "estado must be a string"),
+    ({"features": ["feat-1"], "before": ["2024-01-01"]}, "before must be a string"),
+])
+def test_api_rejects_bad_criteria_with_400(client, payload, message):
+    response = client.post('/api/deployments/delete', json=payload)
+    assert response.status_code == 400
+    assert response.get_json()["message"] == message
+
+def test_cascade_migration_logs_dropped_orphans(app_module, tmp_path, monkeypatch, caplog):
+    path = str(tmp_path / "v3.db")
+    # Una base en la versión 3, con despliegues de features que ya no existen
+    with monkeypatch.context() as patch:
+        patch.setattr(model, "SCHEMA_MIGRATIONS", model.SCHEMA_MIGRATIONS[:3])
+        model.create_db(path)
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO tenants (name) VALUES ('t')")
+    conn.execute("INSERT INTO solutions (tenant_id, name) VALUES (1, 's')")
+    conn.execute("INSERT INTO products (solution_id, name) VALUES (1, 'p')")
+    conn.execute("INSERT INTO features (name, repositorio, product_id) VALUES ('kept', 'Repo1', 1)")
+    conn.executemany('INSERT INTO deployments (feature_id, ambiente, estado, fecha) VALUES (?, ?, ?, ?)',
+                     [(1, "DEV", "Valid", "2024-01-01"), (41, "DEV", "Failed", "2024-01-02"),
+                      (42, "PRD", "Valid", "2024-01-03")])
+    conn.commit()
+
+    with caplog.at_level(logging.WARNING, logger="deploy_mgmt.migrations"):
+        model.migrate_schema(conn)
+    assert model.get_schema_version(conn) == len(model.SCHEMA_MIGRATIONS)
+    assert conn.execute('SELECT feature_id FROM deployments').fetchall() == [(1,)]
+    [record] = [r for r in caplog.records if r.name == "deploy_mgmt.migrations"]
+    assert "dropping 2 orphan deployments" in record.getMessage()
+    assert "(2, 41, 'DEV', 'Failed', '2024-01-02')" in record.getMessage()
+    conn.close()
@@ -0,0 +1,47 @@
+# Cuántas consultas cuesta renderizar el dashboard ("/"). El número sale del
+# header Server-Timing (metrics.py cuenta cada sentencia del request) y no
+# depende de la cantidad de features: si vuelve a crecer con los datos, o
+# aparece una lectura por feature, la prueba falla.
+
+import re
+
+import pytest
+
+# La clave del cache del dashboard lee dos versiones: la del primario y la
+# de la réplica de reportes (que sin réplica es otra vez la del primario)
+VERSION_READS = 2
+
+def _render(client, app_module, url, cached=False):
+    if not cached:
+        app_module.response_cache.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    return int(re.search(r'desc="(\d+) queries"', response.headers["Server-Timing"]).group(1))
+
+@pytest.mark.parametrize("url, expected", [
+    # Resúmenes de KPIs: ambientes de la matriz, conteos, rango de fechas y features válidos
+    ("/", VERSION_READS + 4),
+    # Con ambiente: buckets del ambiente y sus bits
+    ("/?filter_ambiente=DEV", VERSION_READS + 3),
+    # Con texto: los estados que coinciden y los despliegues de los features
+    # que encuentra el FTS (el MATCH va como subconsulta)
+    ("/?filtro=feat-12", VERSION_READS + 2),
+    ("/?filtro=feat-12&filter_estado=Valid&filter_ambiente=UAT", VERSION_READS + 2),
+])
+def test_dashboard_render_query_count(client, app_module, url, expected):
+    assert _render(client, app_module, url) == expected
+
+def test_cached_dashboard_only_reads_versions(client, app_module):
+    _render(client, app_module, "/")
+    assert _render(client, app_module, "/", cached=True) == VERSION_READS
+
+def test_dashboard_query_count_does_not_grow_with_features(client, app_module):
+    import model
+
+    before = _render(client, app_module, "/?filtro=feat")
+    for i in range(50):
+        feature_id = model.add_or_get_feature({"name": f"feat-extra-{i}", "repositorio": "Repo1",
+                                               "product_id": 1, "master": "package.sql"})
+        model.save_deployment(feature_id, {"ambiente": "DEV", "estado": "Valid",
+                                           "fecha": "2024-05-01", "release_manager": "Yasser F"})
+    assert _render(client, app_module, "/?filtro=feat") == before
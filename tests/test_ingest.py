@@ -0,0 +1,42 @@
+# Validación por registro de /api/deployments/bulk: un registro inválido se
+# reporta en su resultado y no llega a la base (ni rompe las vistas que la leen).
+
+def _ingest(client, records):
+    response = client.post('/api/deployments/bulk', json=records)
+    assert response.status_code == 200
+    return response.get_json()["results"]
+
+def _record(name, **fields):
+    return {"name": name, "repositorio": "Repo1", "ambiente": "DEV", "estado": "Valid",
+            "fecha": "2024-05-01", "release_manager": "Yasser F", "product_id": 1,
+            "master": "package.sql", **fields}
+
+def test_ingest_rejects_impossible_dates(client):
+    import model
+
+    results = _ingest(client, [_record("ingest-bad-date", fecha="2025-02-30"),
+                               _record("ingest-bad-format", fecha="2025-2-3"),
+                               _record("ingest-good-date")])
+    assert [r["ok"] for r in results] == [False, False, True]
+    assert results[0]["message"] == "Invalid fecha 2025-02-30"
+    assert results[1]["message"] == "fecha must be YYYY-MM-DD"
+    assert model.get_feature_by_name("ingest-bad-date") is None
+
+def test_dashboard_renders_after_invalid_date(client, app_module):
+    _ingest(client, [_record("ingest-dashboard", fecha="2025-02-30")])
+    app_module.response_cache.clear()
+    assert client.get('/').status_code == 200
+    assert client.get('/?filtro=ingest').status_code == 200
+
+def test_ingest_product_id_must_be_an_integer(client):
+    import model
+
+    results = _ingest(client, [_record("ingest-float-product", product_id=3.7),
+                               _record("ingest-bool-product", product_id=True),
+                               _record("ingest-text-product", product_id="3a"),
+                               _record("ingest-digits-product", product_id="3")])
+    assert [r["message"] for r in results[:3]] == ["product_id must be an integer"] * 3
+    assert results[3]["ok"]
+    assert model.get_feature_by_name("ingest-float-product") is None
+    assert model.get_feature_by_name("ingest-bool-product") is None
+    assert model.get_feature_by_name("ingest-digits-product")["product_id"] == 3
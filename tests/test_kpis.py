@@ -0,0 +1,56 @@
+# Los tres caminos de KPIs dan el mismo dict: los resúmenes de triggers
+# (get_kpi_summary, "/" sin texto), el motor columnar ("/" con texto) y
+# calculate_kpis sobre las filas, que es la referencia.
+
+import pytest
+
+import model
+import utils
+from utils import KpiColumns, calculate_kpis, calculate_kpis_columnar
+
+AMBIENTES = ["PreDEV", "DEV", "UAT", "PPD", "PRD"]
+
+def _rows(filter_estado, filter_ambiente):
+    clauses = ["1"]
+    params = []
+    if filter_estado:
+        clauses.append("d.estado = ?")
+        params.append(filter_estado)
+    if filter_ambiente:
+        clauses.append("d.ambiente = ?")
+        params.append(filter_ambiente)
+    conn = model.get_db_connection()
+    rows = conn.execute(f'''
+        SELECT f.name, d.ambiente, d.estado, d.fecha, d.release_manager
+        FROM deployments d JOIN features f ON f.id = d.feature_id
+        WHERE {" AND ".join(clauses)}
+    ''', params).fetchall()
+    conn.close()
+    return rows
+
+@pytest.mark.parametrize("filter_estado, filter_ambiente", [
+    ("", ""), ("Valid", ""), ("Failed", ""), ("", "DEV"), ("", "PRD"),
+    ("Valid", "UAT"), ("Archived", "PreDEV"),
+])
+def test_kpi_summary_matches_calculate_kpis(app_module, filter_estado, filter_ambiente):
+    expected = calculate_kpis(_rows(filter_estado, filter_ambiente), AMBIENTES)
+    assert model.get_kpi_summary(filter_estado, filter_ambiente) == expected
+
+def _tied_rows():
+    # Dos release managers y dos ambientes con el mismo conteo
+    return [
+        {"name": "a", "ambiente": "UAT", "estado": "Valid", "fecha": "2024-01-01", "release_manager": "Yasser F"},
+        {"name": "a", "ambiente": "DEV", "estado": "Valid", "fecha": "2024-01-02", "release_manager": "Yasser F"},
+        {"name": "b", "ambiente": "UAT", "estado": "Failed", "fecha": "2024-01-03", "release_manager": "Michel LF"},
+        {"name": "b", "ambiente": "DEV", "estado": "Valid", "fecha": "2024-01-04", "release_manager": "Michel LF"},
+    ]
+
+@pytest.mark.parametrize("numpy_min_rows", [utils.NUMPY_MIN_ROWS, 0], ids=["python", "numpy"])
+@pytest.mark.parametrize("rows", [_tied_rows(), _tied_rows()[::-1]], ids=["in-order", "reversed"])
+def test_ties_break_alphabetically_in_every_engine(monkeypatch, rows, numpy_min_rows):
+    if numpy_min_rows == 0 and utils.np is None:
+        pytest.skip("NumPy no está instalado")
+    monkeypatch.setattr(utils, "NUMPY_MIN_ROWS", numpy_min_rows)
+    kpis = calculate_kpis(rows, AMBIENTES)
+    assert (kpis["most_active_env"], kpis["top_rm"]) == ("DEV", "Michel LF")
+    assert calculate_kpis_columnar(KpiColumns.from_rows(rows), AMBIENTES) == kpis
@@ -0,0 +1,58 @@
+# La matriz en memoria (matrix.py) es la única fuente de /api/matrix,
+# /api/matrix/details y suggest: después de cada tipo de escritura tiene que
+# coincidir con la base, según su propio MatrixStore.check().
+
+import model
+
+def _check(app_module):
+    # Los hooks corren en el escritor después de entregar el resultado: una
+    # escritura vacía en la cola asegura que ya corrieron los de las anteriores
+    model.run_write(lambda conn: None)
+    result = app_module.matrix_store.check()
+    assert result["mismatches"] == 0, result["feature_ids"]
+    return app_module.matrix_store
+
+def test_matrix_matches_database_after_ingest(client, app_module):
+    response = client.post('/api/deployments/bulk', json=[
+        {"name": "matrix-new", "repositorio": "Repo1", "ambiente": "DEV", "estado": "Valid",
+         "fecha": "2024-06-01", "release_manager": "Yasser F", "product_id": 2, "master": "m.sql"},
+        {"name": "matrix-new", "repositorio": "Repo1", "ambiente": "UAT", "estado": "Failed",
+         "fecha": "2024-06-02", "release_manager": "Michel LF"},
+        {"name": "feat-201", "repositorio": "Repo0", "ambiente": "PRD", "estado": "In-PRD",
+         "fecha": "2024-06-03", "release_manager": "Elizabet RC"},
+    ])
+    assert response.get_json()["ok"] == 3
+    store = _check(app_module)
+    assert set(store.details("matrix-new")) == {"DEV", "UAT"}
+    assert store.details("feat-201")["PRD"]["estado"] == "In-PRD"
+
+def test_matrix_matches_database_after_updates(client, app_module):
+    response = client.post('/update_full_deployment', json={
+        "feature": "feat-202", "ambiente": "PPD", "estado": "Invalid",
+        "fecha": "2024-07-01", "release_manager": "Yasser F"})
+    assert response.get_json()["success"]
+    response = client.post('/update_full_deployment_batch', json={"items": [
+        {"feature": "feat-203", "ambiente": "DEV", "estado": "Valid",
+         "fecha": "2024-07-02", "release_manager": "Michel LF"},
+        {"feature": "feat-204", "ambiente": "PreDEV", "estado": "Failed",
+         "fecha": "2024-07-03", "release_manager": "Elizabet RC"},
+    ]})
+    assert response.get_json()["success"]
+    store = _check(app_module)
+    assert store.details("feat-202")["PPD"] == {"estado": "Invalid", "fecha": "2024-07-01",
+                                                "release_manager": "Yasser F"}
+
+def test_matrix_matches_database_after_bulk_delete(client, app_module):
+    assert client.post('/delete_feature', json={"feature": "feat-205"}).get_json()["success"]
+    assert client.post('/delete_deployments', json={"feature": "feat-206",
+                                                    "ambientes": ["PreDEV"]}).get_json()["success"]
+    response = client.post('/api/deployments/delete', json={"estado": "Invalid", "before": "2022-04-01"})
+    assert response.get_json()["deleted"]["deployments"] > 0
+    store = _check(app_module)
+    assert store.details("feat-205") == {}
+    assert "PreDEV" not in store.details("feat-206")
+
+def test_matrix_matches_database_after_archive(client, app_module):
+    response = client.post('/admin/archive', json={"before": "2022-05-01", "estados": []})
+    assert response.get_json()["archived"] > 0
+    _check(app_module)
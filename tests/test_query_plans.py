@@ -0,0 +1,196 @@
+# Regresión de planes de consulta: cada consulta de model.py y app.py corre
+# sobre la base sintética de conftest.py capturando el SQL real (con sus
+# valores) por trace callback, y cada sentencia pasa por EXPLAIN QUERY PLAN.
+# Falla si alguna recorre una tabla completa con un plan que no está en la
+# lista permitida de esa consulta, donde cada entrada es el detalle exacto
+# de EXPLAIN QUERY PLAN y dice por qué ese recorrido es el correcto.
+#
+# populate() corre ANALYZE al final, así que los planes no dependen del
+# tamaño de la base: pasa igual con TEST_FEATURES=300 que con 20000. Todas
+# las consultas corren con el archivo ya poblado (fixture `archived`), así
+# los reportes lo leen siempre, sin importar qué módulo de pruebas archivó
+# antes.
+#
+#   python -m pytest -q tests/test_query_plans.py      (TEST_FEATURES=20000 para más volumen)
+
+import pytest
+
+import model
+
+AMBIENTES = ["PreDEV", "DEV", "UAT", "PPD", "PRD"]
+
+# Resultados intermedios y tablas virtuales, no tablas de la base:
+# los CTE (req, estados), FTS5 y json_each resuelven su propio índice y
+# FTS5 lee su tabla _config al abrirse en cada conexión
+IGNORED = {"SCAN CONSTANT ROW", "SCAN main.features_fts_config", "SCAN req", "SCAN estados"}
+
+# Listados completos que devuelven todas las features ordenadas por nombre:
+# recorren UNIQUE(name, repositorio) para no ordenar en memoria
+ALL_FEATURES_BY_NAME = {
+    "SCAN f USING INDEX sqlite_autoindex_features_1":
+        "listado completo por nombre; cada despliegue se busca por feature_id",
+}
+# Una fila por ambiente de la matriz (cinco)
+KPI_ENVS = {
+    "SCAN kpi_envs USING COVERING INDEX sqlite_autoindex_kpi_envs_2":
+        "suma los bits de los ambientes de la matriz, una fila por ambiente",
+}
+MATRIX_FIRST_PAGE = {
+    "SCAN f USING INDEX sqlite_autoindex_features_1":
+        "la página sale del índice por nombre y corta en LIMIT; el total de la "
+        "primera página cuenta todos los nombres (con cursor no se cuenta)",
+}
+
+def _report(filters, **kwargs):
+    return lambda client: model.get_report_page(filters, **kwargs)
+
+def _count(filters):
+    return lambda client: model.count_report_rows(filters)
+
+# (etiqueta, función(client), {detalle de recorrido permitido: motivo})
+CHECKS = [
+    ("get_all_features()", lambda client: model.get_all_features(), ALL_FEATURES_BY_NAME),
+    ("get_all_features(filtro)", lambda client: model.get_all_features("feat-12"), {}),
+    # "fail" coincide con el estado Failed: el OR con d.estado no sale de un índice
+    # de features y el resultado es casi toda la tabla
+    ("get_all_features(estado)", lambda client: model.get_all_features("fail"), ALL_FEATURES_BY_NAME),
+    ("search_features()", lambda client: model.search_features("feat 12", limit=20), {}),
+    ("get_dashboard_kpi_rows(filtro)", lambda client: model.get_dashboard_kpi_rows("feat-12"), {}),
+    # Texto que coincide con un estado: OR de los índices por feature_id y por estado
+    ("get_dashboard_kpi_rows(estado)", lambda client: model.get_dashboard_kpi_rows("fail"), {}),
+    ("get_dashboard_kpi_rows(filtro+ambiente)",
+     lambda client: model.get_dashboard_kpi_rows("feat-12", filter_ambiente="UAT"), {}),
+    ("get_all_feature_names()", lambda client: model.get_all_feature_names(), {
+        "SCAN features USING COVERING INDEX sqlite_autoindex_features_1":
+            "todos los nombres, leídos solo del índice por nombre",
+    }),
+    ("get_all_deployment_details()", lambda client: model.get_all_deployment_details(), {
+        "SCAN f USING COVERING INDEX sqlite_autoindex_features_1":
+            "todas las features con sus despliegues, buscados por feature_id",
+    }),
+    ("get_report_page({})", _report({}), {}),
+    ("get_report_page(after)", _report({}, after=("2023-06-01", 10**9)), {}),
+    ("get_report_page(fechas)", _report({"start_date": "2023-01-01", "end_date": "2023-01-31"}), {}),
+    ("get_report_page(ambiente)", _report({"filter_ambiente": "UAT"}), {}),
+    ("get_report_page(estado+fechas)", _report({"filter_estado": "Failed", "start_date": "2023-01-01"}), {}),
+    ("get_report_page(filtro)", _report({"filtro": "feat-12"}), {}),
+    ("count_report_rows(filtro)", _count({"filtro": "feat-12"}), {}),
+    ("count_report_rows(fechas)", _count({"start_date": "2023-01-01", "end_date": "2023-03-31"}), {}),
+    ("count_report_rows(ambiente)", _count({"filter_ambiente": "DEV"}), {}),
+    ("get_kpi_summary()", lambda client: model.get_kpi_summary(), KPI_ENVS),
+    ("get_kpi_summary(ambiente)", lambda client: model.get_kpi_summary(filter_ambiente="DEV"), KPI_ENVS),
+    ("get_kpi_summary(estado)", lambda client: model.get_kpi_summary(filter_estado="Valid"), KPI_ENVS),
+    ("get_feature_by_name()", lambda client: model.get_feature_by_name("feat-77"), {}),
+    ("get_feature_by_name(repo)", lambda client: model.get_feature_by_name("feat-77", "Repo2"), {}),
+    ("get_deployment()", lambda client: model.get_deployment(77, "DEV"), {}),
+    ("get_deployments_batch()",
+     lambda client: model.get_deployments_batch([{"feature": f"feat-{i}", "ambiente": "DEV"} for i in range(50)]),
+     {}),
+    ("iter_deployment_events()", lambda client: list(model.iter_deployment_events(1000)), {}),
+    ("get_feature_history()", lambda client: model.get_feature_history(77, "DEV"), {}),
+    ("/api/analytics/lead_time", lambda client: client.get('/api/analytics/lead_time'), {}),
+    ("get_matrix_page()", lambda client: model.get_matrix_page(AMBIENTES), MATRIX_FIRST_PAGE),
+    ("get_matrix_page(after)",
+     lambda client: model.get_matrix_page(AMBIENTES, after=["feat-500", "feat-500"]), {}),
+    ("get_matrix_page(name)", lambda client: model.get_matrix_page(AMBIENTES, {"name": "feat-12"}), {}),
+    ("get_matrix_page(tenancy, type)",
+     lambda client: model.get_matrix_page(AMBIENTES, {"tenancy": "tenant-3", "type": "product-1"}), {}),
+    ("get_matrix_page(sort=application)",
+     lambda client: model.get_matrix_page(AMBIENTES, sort="application", descending=True), {
+         "SCAN f USING INDEX sqlite_autoindex_features_1":
+             "ordenar por aplicación necesita la clave de cada feature (agrupadas por "
+             "nombre desde el índice); el total de la primera página cuenta todos los nombres",
+     }),
+    ("get_feature_details()", lambda client: model.get_feature_details("feat-77"), {}),
+    # Sin ids es la carga inicial de matrix.py: todas las filas, a propósito
+    ("get_matrix_features()", lambda client: model.get_matrix_features(), {
+        "SCAN f": "carga completa de la matriz en memoria al arrancar",
+    }),
+    ("get_matrix_features(ids)", lambda client: model.get_matrix_features([7, 77]), {}),
+    ("get_matrix_cells()", lambda client: model.get_matrix_cells(), {
+        "SCAN d": "carga completa de la matriz en memoria al arrancar",
+    }),
+    ("get_matrix_cells(ids)", lambda client: model.get_matrix_cells([7, 77]), {}),
+    ("get_user_by_username()", lambda client: model.get_user_by_username("admin"), {}),
+    ("get_all_users()", lambda client: model.get_all_users(), {
+        "SCAN users USING INDEX sqlite_autoindex_users_1":
+            "la pantalla de administración lista todos los usuarios por username",
+    }),
+    # El cache de jerarquía se arma una vez con las tres tablas completas
+    # (cientos de filas); las rutas /api/* solo leen su versión y usan el cache
+    ("get_hierarchy()", lambda client: model.get_hierarchy(), {
+        "SCAN tenants USING COVERING INDEX sqlite_autoindex_tenants_1": "todos los tenants, por nombre",
+        "SCAN solutions USING COVERING INDEX idx_solutions_tenant": "todas las soluciones, por tenant",
+        "SCAN products USING COVERING INDEX idx_products_solution": "todos los productos, por solución",
+    }),
+    ("/api/hierarchy", lambda client: client.get('/api/hierarchy'), {}),
+    ("/api/tenants", lambda client: client.get('/api/tenants'), {}),
+    ("/api/solutions/<id>", lambda client: client.get('/api/solutions/3'), {}),
+    ("/api/products/<id>", lambda client: client.get('/api/products/7'), {}),
+    ("/get_deployment_details",
+     lambda client: client.post('/get_deployment_details', json={"feature": "feat-5", "ambiente": "DEV"}), {}),
+    ("/delete_deployments",
+     lambda client: client.post('/delete_deployments', json={"feature": "feat-9", "ambientes": ["PRD"]}), {}),
+    ("/delete_feature", lambda client: client.post('/delete_feature', json={"feature": "feat-10"}), {}),
+    ("bulk_delete(estado+before)",
+     lambda client: model.bulk_delete(estado="Archived", before="2022-02-01"), {}),
+    ("bulk_delete(features)", lambda client: model.bulk_delete(features=["feat-11", "feat-12"]), {}),
+    ("archive_deployments(before)", lambda client: model.archive_deployments(before="2022-03-01"), {}),
+    ("get_archive_stats()", lambda client: model.get_archive_stats(), {
+        "SCAN deployments_archive USING COVERING INDEX idx_deployments_archive_feature":
+            "COUNT(*) del archivo para /admin/pool_stats; lo cuenta el índice más chico",
+    }),
+]
+
+# Reportes cuyo rango cae dentro del archivo
+ARCHIVE_CHECKS = [
+    ("get_report_page({}) + archivo", _report({}), {}),
+    ("get_report_page(fechas) + archivo", _report({"start_date": "2022-01-01", "end_date": "2022-02-15"}), {}),
+    ("get_report_page(filtro) + archivo", _report({"filtro": "feat-12"}), {}),
+    ("count_report_rows(filtro) + archivo", _count({"filtro": "feat-12"}), {}),
+    ("count_report_rows(fechas) + archivo", _count({"start_date": "2022-01-01", "end_date": "2022-03-31"}), {}),
+    ("get_report_page(ambiente+fechas) + archivo",
+     _report({"filter_ambiente": "UAT", "start_date": "2022-01-01", "end_date": "2022-02-15"}), {}),
+    ("count_report_rows(ambiente) + archivo", _count({"filter_ambiente": "DEV"}), {}),
+    ("count_report_rows(estado) + archivo", _count({"filter_estado": "Failed"}), {}),
+]
+
+@pytest.fixture(scope="module")
+def traced(app_module):
+    """Captura el SQL de la conexión del hilo (que queda fijada) y la del escritor."""
+    statements = []
+    conn = model.get_db_connection()
+    writer = model.get_writer_connection()
+    conn.set_trace_callback(statements.append)
+    writer.set_trace_callback(statements.append)
+    yield conn, statements
+    conn.set_trace_callback(None)
+    writer.set_trace_callback(None)
+    conn.close()
+
+@pytest.fixture(scope="module", autouse=True)
+def archived(app_module):
+    model.archive_deployments(before="2022-03-01")
+
+def _full_scans(traced, run, allowed):
+    conn, statements = traced
+    statements.clear()
+    run()
+    queries = [s for s in statements if s.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE"))]
+    assert queries, "la consulta no pasó por el trace"
+    conn.set_trace_callback(None)
+    try:
+        details = [row["detail"] for sql in queries for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    finally:
+        conn.set_trace_callback(statements.append)
+    return [d for d in details
+            if d.startswith("SCAN ") and "VIRTUAL TABLE" not in d and d not in IGNORED
+            and d not in allowed]
+
+@pytest.mark.parametrize("label, run, allowed", CHECKS, ids=[c[0] for c in CHECKS])
+def test_query_plan(traced, client, label, run, allowed):
+    assert _full_scans(traced, lambda: run(client), allowed) == []
+
+@pytest.mark.parametrize("label, run, allowed", ARCHIVE_CHECKS, ids=[c[0] for c in ARCHIVE_CHECKS])
+def test_query_plan_with_archive(traced, client, label, run, allowed):
+    assert _full_scans(traced, lambda: run(client), allowed) == []
@@ -1,3 +1,4 @@
+from array import array
 from datetime import datetime
 from collections import Counter, defaultdict
 
@@ -19,10 +20,10 @@ def calculate_kpis(filtered_deployments, ambiente_options):
     success_rate = round((valid / total) * 100, 1) if total > 0 else 0
 
     env_counts = Counter(d["ambiente"] for d in norm_deployments if d["ambiente"])
-    most_active_env = env_counts.most_common(1)[0][0] if env_counts else "-"
+    most_active_env = most_common_value(env_counts) or "-"
 
     rm_counts = Counter(d["release_manager"] for d in norm_deployments if d["release_manager"] and d.get("ambiente"))
-    top_rm = rm_counts.most_common(1)[0][0] if rm_counts else "-"
+    top_rm = most_common_value(rm_counts) or "-"
 
     dates = [datetime.strptime(d["fecha"], "%Y-%m-%d") for d in norm_deployments if d["fecha"] and d.get("ambiente")]
     if dates:
@@ -53,3 +54,206 @@ def calculate_kpis(filtered_deployments, ambiente_options):
         "avg_per_day": avg_per_day,
         "fully_deployed": fully_deployed_count
     }
+
+
+def most_common_value(counts):
+    """
+    El valor con más apariciones de un {valor: conteo}; a igualdad, el menor
+    en orden alfabético, así el KPI no depende del orden de las filas.
+    None si está vacío.
+    """
+    return min(counts.items(), key=lambda item: (-item[1], item[0]))[0] if counts else None
+
+def day_span(first_day, last_day):
+    """Días entre dos fechas ISO, ambos incluidos (None si falta alguna)."""
+    if not first_day or not last_day:
+        return None
+    return (datetime.strptime(last_day, "%Y-%m-%d") - datetime.strptime(first_day, "%Y-%m-%d")).days + 1
+
+def build_kpis(total, failed, valid, most_active_env, top_rm, span_days, fully_deployed):
+    """
+    Arma el dict de KPIs a partir de conteos ya agregados. Mismas reglas de
+    redondeo y valores por defecto que calculate_kpis.
+    """
+    success_rate = round((valid / total) * 100, 1) if total > 0 else 0
+    if span_days is not None:
+        avg_per_day = round(total / span_days, 2) if span_days > 0 else total
+    else:
+        avg_per_day = 0
+
+    return {
+        "total": total,
+        "failed": failed,
+        "success_rate": success_rate,
+        "most_active_env": most_active_env or "-",
+        "top_rm": top_rm or "-",
+        "avg_per_day": avg_per_day,
+        "fully_deployed": fully_deployed
+    }
+
+
+# --- Motor columnar de KPIs ---
+#
+# Para KPIs ad hoc sobre muchas filas: en vez de copiar cada fila a un dict,
+# se cargan solo las columnas necesarias en arrays compactos (códigos
+# internados y días epoch) y los siete KPIs salen de una pasada, o de
+# conteos vectorizados si NumPy está instalado. Resultado idéntico a
+# calculate_kpis, incluido el desempate de most_common_value.
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional
+    np = None
+
+NO_DATE = -1       # toordinal() siempre es >= 1
+NUMPY_MIN_ROWS = 50000
+
+class KpiColumns:
+    """
+    Columnas de KPIs en arrays de enteros. El código 0 significa "vacío";
+    los vocabularios guardan el texto de cada código (índice = código).
+    """
+    __slots__ = ("name", "ambiente", "estado", "release_manager", "fecha",
+                 "names", "ambientes", "estados", "release_managers")
+
+    def __init__(self):
+        self.name = array("i")
+        self.ambiente = array("i")
+        self.estado = array("i")
+        self.release_manager = array("i")
+        self.fecha = array("i")
+        self.names = [None]
+        self.ambientes = [None]
+        self.estados = [None]
+        self.release_managers = [None]
+
+    def __len__(self):
+        return len(self.ambiente)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Carga filas con name, ambiente, estado, fecha y release_manager."""
+        cols = cls()
+        names = [row["name"] for row in rows]
+        ambientes = [a.strip().upper() if a else None for a in (row["ambiente"] for row in rows)]
+        estados = [row["estado"] for row in rows]
+        rms = [row["release_manager"] or None for row in rows]
+        fechas = [row["fecha"] or None for row in rows]
+
+        cols.name, cols.names = _intern(names)
+        cols.ambiente, cols.ambientes = _intern(ambientes)
+        cols.estado, cols.estados = _intern(estados)
+        cols.release_manager, cols.release_managers = _intern(rms)
+
+        days = {None: NO_DATE}
+        for fecha in set(fechas):
+            if fecha is not None:
+                days[fecha] = datetime.strptime(fecha, "%Y-%m-%d").toordinal()
+        cols.fecha = array("i", map(days.__getitem__, fechas))
+        return cols
+
+def _intern(values):
+    """Códigos enteros por valor (None y "" -> 0) y su vocabulario."""
+    codes = {None: 0}
+    code_of = codes.setdefault
+    column = array("i", [code_of(v or None, len(codes)) for v in values])
+    return column, list(codes)
+
+def _code(values, value):
+    try:
+        return values.index(value, 1)
+    except ValueError:
+        return -1
+
+def calculate_kpis_columnar(cols, ambiente_options):
+    if np is not None and len(cols) >= NUMPY_MIN_ROWS:
+        return _columnar_kpis_numpy(cols, ambiente_options)
+    return _columnar_kpis_python(cols, ambiente_options)
+
+def _required_env_bits(cols, ambiente_options):
+    required = {a.strip().upper() for a in ambiente_options}
+    env_bit = [0] * len(cols.ambientes)
+    full = 0
+    for i, env in enumerate(sorted(required)):
+        full |= 1 << i
+        code = _code(cols.ambientes, env)
+        if code > 0:
+            env_bit[code] = 1 << i
+    return env_bit, full
+
+def _top(counts, values):
+    return most_common_value({values[code]: n for code, n in enumerate(counts) if n})
+
+def _columnar_kpis_python(cols, ambiente_options):
+    failed_code = _code(cols.estados, "Failed")
+    valid_code = _code(cols.estados, "Valid")
+    env_bit, full = _required_env_bits(cols, ambiente_options)
+
+    total = failed = valid = 0
+    env_counts = [0] * len(cols.ambientes)
+    rm_counts = [0] * len(cols.release_managers)
+    first_day = last_day = None
+    masks = {}
+
+    for env, estado, rm, day, name in zip(cols.ambiente, cols.estado,
+                                          cols.release_manager, cols.fecha, cols.name):
+        if not env:
+            continue
+        total += 1
+        env_counts[env] += 1
+        if estado == failed_code:
+            failed += 1
+        elif estado == valid_code:
+            valid += 1
+            masks[name] = masks.get(name, 0) | env_bit[env]
+        if rm:
+            rm_counts[rm] += 1
+        if day != NO_DATE:
+            if first_day is None or day < first_day:
+                first_day = day
+            if last_day is None or day > last_day:
+                last_day = day
+
+    fully = sum(1 for mask in masks.values() if mask & full == full)
+    return build_kpis(total=total, failed=failed, valid=valid,
+                      most_active_env=_top(env_counts, cols.ambientes),
+                      top_rm=_top(rm_counts, cols.release_managers),
+                      span_days=last_day - first_day + 1 if first_day is not None else None,
+                      fully_deployed=fully)
+
+def _columnar_kpis_numpy(cols, ambiente_options):
+    amb = np.frombuffer(cols.ambiente, dtype=np.intc)
+    estado = np.frombuffer(cols.estado, dtype=np.intc)
+    rm = np.frombuffer(cols.release_manager, dtype=np.intc)
+    fecha = np.frombuffer(cols.fecha, dtype=np.intc)
+    name = np.frombuffer(cols.name, dtype=np.intc)
+
+    has_env = amb != 0
+    total = int(np.count_nonzero(has_env))
+    failed = int(np.count_nonzero(has_env & (estado == _code(cols.estados, "Failed"))))
+    is_valid = has_env & (estado == _code(cols.estados, "Valid"))
+    valid = int(np.count_nonzero(is_valid))
+
+    def top(codes, values):
+        if not codes.size:
+            return None
+        counts = np.bincount(codes, minlength=len(values))
+        return _top(counts.tolist(), values)
+
+    dates = fecha[has_env & (fecha != NO_DATE)]
+    span_days = int(dates.max() - dates.min()) + 1 if dates.size else None
+
+    env_bit, full = _required_env_bits(cols, ambiente_options)
+    bits = np.asarray(env_bit, dtype=np.int64)[amb[is_valid]]
+    valid_names = name[is_valid]
+    masks = np.zeros(len(cols.names), dtype=np.int64)
+    np.bitwise_or.at(masks, valid_names, bits)
+    seen = np.zeros(len(cols.names), dtype=bool)
+    seen[valid_names] = True
+    fully = int(np.count_nonzero(seen & ((masks & full) == full)))
+
+    return build_kpis(total=total, failed=failed, valid=valid,
+                      most_active_env=top(amb[has_env], cols.ambientes),
+                      top_rm=top(rm[has_env & (rm != 0)], cols.release_managers),
+                      span_days=span_days,
+                      fully_deployed=fully)